@@ -0,0 +1,268 @@
+"""
+Benchmark suite of the hot paths on synthetic interaction sets
+
+Times:
+    - every `PairSampler` method (batches/sec)
+    - `TophatModel.fit` (steps/sec, for a few `steps_per_run`)
+    - `Validator.run_val` (users/sec)
+    - `TophatModel.predict` (latency)
+
+and writes the results (with the config and versions) as JSON, ex.
+
+    python benchmarks/run_benchmarks.py --size small --output results.json
+
+Results of different versions can be compared with `--compare`, ex.
+
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from tophat.constants import FType, FGroup
+from tophat.core import TophatModel
+from tophat.data import FeatureSource, InteractionsSource
+from tophat.datasets.synthetic import make_synthetic
+from tophat.evaluation import Validator
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+
+SEED = 322
+
+SIZES = {
+    'small': dict(n_users=1000, n_items=2000, density=0.01,
+                  n_user_feats=1, n_item_feats=2),
+    'medium': dict(n_users=20000, n_items=20000, density=0.001,
+                   n_user_feats=2, n_item_feats=4),
+    'large': dict(n_users=200000, n_items=100000, density=0.0001,
+                  n_user_feats=2, n_item_feats=4),
+}
+
+SAMPLE_METHODS = [
+    'uniform',
+    'uniform_verified',
+    'uniform_ordinal',
+    'weighted',
+    'adaptive',
+    'adaptive_ordinal',
+    'adaptive_warp',
+]
+
+BATCH_SIZE = 128
+EMB_DIM = 16
+N_SAMPLER_BATCHES = 200
+N_FIT_EPOCHS = 2
+STEPS_PER_RUN_L = [1, 8]
+N_USERS_EVAL = 100
+N_PREDICT_ITEMS = 100
+N_PREDICT_REPEATS = 50
+
+
+def make_sources(data):
+    """Interactions and group features of a synthetic data set"""
+    def xn_src(df):
+        return InteractionsSource(path=df.copy(), user_col='user_id',
+                                  item_col='item_id')
+
+    group_features = {FGroup.USER: [], FGroup.ITEM: []}
+    for fg, key in [(FGroup.USER, 'user_features'),
+                    (FGroup.ITEM, 'item_features')]:
+        if data[key] is not None:
+            group_features[fg].append(FeatureSource(
+                path=data[key].copy(),
+                feature_type=FType.CAT,
+                index_col=data[key].columns[0],
+                name=key,
+            ))
+    return xn_src(data['train']), xn_src(data['test']), group_features
+
+
+def make_task(data, sample_method='uniform_verified'):
+    # Fresh sources for each task (loaders may modify the frames in-place)
+    xn_train, _, group_features = make_sources(data)
+    task = FactorizationTaskWrapper(
+        loss_fn='kos' if sample_method == 'adaptive_warp' else 'bpr',
+        sample_method=sample_method,
+        interactions=xn_train,
+        group_features=group_features,
+        embedding_map_kwargs={'embedding_dim': EMB_DIM},
+        batch_size=BATCH_SIZE,
+        build_on_init=False,
+        seed=SEED,
+        name='bench',
+    )
+    if sample_method == 'weighted':
+        # Popularity weighted negatives
+        item_codes = task.data_loader.interactions_df[
+            task.data_loader.item_col].cat.codes
+        task.neg_weights = np.bincount(
+            item_codes, minlength=len(task.data_loader.cats_d[
+                task.data_loader.item_col])).astype(np.float64) + 1.
+    task.build()
+    return task
+
+
+def bench_samplers(data):
+    results = []
+    for method in SAMPLE_METHODS:
+        with tf.Graph().as_default():
+            tf.set_random_seed(SEED)
+            task = make_task(data, method)
+            model = TophatModel(tasks=[task])  # session for adaptive
+            pairs_iter = iter(task.sampler)
+            next(pairs_iter)  # warm-up
+            tic = time.perf_counter()
+            for _ in range(N_SAMPLER_BATCHES):
+                next(pairs_iter)
+            toc = time.perf_counter() - tic
+            model.sess.close()
+        results.append({
+            'bench': 'sampler', 'params': {'method': method},
+            'metric': 'batches_per_s', 'value': N_SAMPLER_BATCHES / toc,
+        })
+    return results
+
+
+def bench_fit(data):
+    results = []
+    for steps_per_run in STEPS_PER_RUN_L:
+        with tf.Graph().as_default():
+            tf.set_random_seed(SEED)
+            model = TophatModel(tasks=[make_task(data)])
+            model.fit(1, verbose=0, steps_per_run=steps_per_run)  # warm-up
+            step_0 = model.global_step
+            tic = time.perf_counter()
+            model.fit(N_FIT_EPOCHS, verbose=0, steps_per_run=steps_per_run)
+            toc = time.perf_counter() - tic
+            model.sess.close()
+        results.append({
+            'bench': 'fit', 'params': {'steps_per_run': steps_per_run},
+            'metric': 'steps_per_s',
+            'value': (model.global_step - step_0) / toc,
+        })
+    return results
+
+
+def bench_eval(data):
+    _, xn_test, _ = make_sources(data)
+    with tf.Graph().as_default():
+        tf.set_random_seed(SEED)
+        task = make_task(data)
+        validator = Validator(
+            xn_test,
+            parent_task_wrapper=task,
+            limit_items=-1,
+            n_users_eval=N_USERS_EVAL,
+            include_cold=False,
+            cold_only=False,
+            name='bench_val',
+        )
+        validator.make_ops()
+        model = TophatModel(tasks=[task])
+
+        tic = time.perf_counter()
+        validator.run_val(model.sess, macro=True)
+        toc_val = time.perf_counter() - tic
+
+        user_id = task.data_loader.cats_d['user_id'][0]
+        item_ids = task.data_loader.cats_d['item_id'][:N_PREDICT_ITEMS]
+        model.predict(user_id, item_ids)  # warm-up
+        latencies = []
+        for _ in range(N_PREDICT_REPEATS):
+            tic = time.perf_counter()
+            model.predict(user_id, item_ids)
+            latencies.append(time.perf_counter() - tic)
+        model.sess.close()
+
+    n_users_eval = min(N_USERS_EVAL, len(validator.user_ids_val))
+    return [
+        {'bench': 'run_val', 'params': {'macro': True},
+         'metric': 'users_per_s', 'value': n_users_eval / toc_val},
+        {'bench': 'predict', 'params': {'n_items': len(item_ids)},
+         'metric': 'latency_p50_ms', 'value': 1e3 * np.median(latencies)},
+        {'bench': 'predict', 'params': {'n_items': len(item_ids)},
+         'metric': 'latency_p90_ms',
+         'value': 1e3 * np.percentile(latencies, 90)},
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=Path(__file__).parent, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(size: str, seed: int = SEED):
+    np.random.seed(seed)
+    config = dict(SIZES[size], seed=seed)
+    data = make_synthetic(**config)
+
+    results = bench_samplers(data) + bench_fit(data) + bench_eval(data)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'tensorflow': tf.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'config': dict(config, size=size, batch_size=BATCH_SIZE,
+                       embedding_dim=EMB_DIM,
+                       n_train=len(data['train']), n_test=len(data['test'])),
+        'results': results,
+    }
+
+
+def results_df(path) -> pd.DataFrame:
+    with open(path) as f:
+        results = json.load(f)['results']
+    df = pd.DataFrame(results)
+    df['params'] = df['params'].apply(json.dumps)
+    return df.set_index(['bench', 'params', 'metric'])['value']
+
+
+def compare(path_old, path_new) -> pd.DataFrame:
+    """Relative change of each result between two runs"""
+    df = pd.concat([results_df(path_old), results_df(path_new)],
+                   axis=1, keys=['old', 'new'])
+    df['change'] = df['new'] / df['old'] - 1.
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', default='small', choices=list(SIZES))
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', default=None,
+                        help='path of the JSON results')
+    parser.add_argument('--compare', nargs=2, default=None,
+                        metavar=('OLD', 'NEW'),
+                        help='compare two JSON results instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare).to_string())
+    else:
+        output = run(args.size, args.seed)
+        path = Path(args.output or
+                    f'benchmark_{args.size}_{datetime.now():%Y%m%d%H%M%S}'
+                    f'.json')
+        with open(path, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(pd.DataFrame(output['results']).to_string())
+        print(f'Results written to {path}')
@@ -0,0 +1,70 @@
+"""
+Data-parallel training of the movielens example on a local cluster
+(worker and parameter server processes on localhost ports)
+"""
+import numpy as np
+import pandas as pd
+
+from tophat.data import FeatureSource, InteractionsSource
+from tophat.constants import FType, FGroup
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+from tophat.distributed import launch_local
+
+from tophat.datasets.movielens import fetch_movielens  # ref: lightfm
+
+EMB_DIM = 30
+N_WORKERS = 2
+N_PS = 2
+
+
+def make_tasks(shard, partitioner):
+    """Task wrappers of one worker (built on the worker's process)"""
+    # Get movielens data via lightfm
+    data = fetch_movielens(
+        indicator_features=False,
+        genre_features=True,
+        min_rating=5.0,  # Pretend 5-star is an implicit 'like'
+        download_if_missing=True,
+    )
+
+    xn_train = InteractionsSource(
+        path=pd.DataFrame(np.vstack(data['train'].nonzero()).T,
+                          columns=['user_id', 'item_id']),
+        user_col='user_id',
+        item_col='item_id',
+    )
+
+    genre_df = pd.DataFrame(np.vstack(data['item_features'].nonzero()).T,
+                            columns=['item_id', 'genre_id'])
+    genre_df.drop_duplicates('item_id', keep='first', inplace=True)
+
+    genre_feats = FeatureSource(
+        path=genre_df,
+        feature_type=FType.CAT,
+        index_col='item_id',
+        name='genre',
+    )
+
+    primary_task = FactorizationTaskWrapper(
+        loss_fn='bpr',
+        sample_method='uniform_verified',
+        interactions=xn_train,
+        group_features={
+            FGroup.USER: [],
+            FGroup.ITEM: [genre_feats],
+        },
+        embedding_map_kwargs={
+            'embedding_dim': EMB_DIM,
+            'partitioner': partitioner,
+        },
+        batch_size=128,
+        optimizer='adam',
+        shard=shard,
+        name='primary',
+    )
+    return [primary_task]
+
+
+if __name__ == '__main__':
+    launch_local(make_tasks, n_workers=N_WORKERS, n_ps=N_PS,
+                 fit_kwargs={'n_epochs': 10, 'verbose': 1})
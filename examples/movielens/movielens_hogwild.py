@@ -0,0 +1,109 @@
+"""
+Benchmark of Hogwild training throughput against the number of trainer
+threads (see `TophatModel.fit_hogwild`)
+"""
+import time
+import tensorflow as tf
+import numpy as np
+import pandas as pd
+
+from tophat.data import FeatureSource, InteractionsSource
+from tophat.constants import FType, FGroup
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+from tophat.core import TophatModel
+
+from tophat.datasets.movielens import fetch_movielens  # ref: lightfm
+
+SEED = 322
+EMB_DIM = 30
+BATCH_SIZE = 128
+N_EPOCHS = 2
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+
+# Get movielens data via lightfm
+data = fetch_movielens(
+    indicator_features=False,
+    genre_features=True,
+    min_rating=5.0,  # Pretend 5-star is an implicit 'like'
+    download_if_missing=True,
+)
+
+# #################### [ INTERACTIONS ] ####################
+xn_train = InteractionsSource(
+    path=pd.DataFrame(np.vstack(data['train'].nonzero()).T,
+                      columns=['user_id', 'item_id']),
+    user_col='user_id',
+    item_col='item_id',
+)
+
+# #################### [ FEATURES ] ####################
+
+genre_df = pd.DataFrame(np.vstack(data['item_features'].nonzero()).T,
+                        columns=['item_id', 'genre_id'])
+genre_df.drop_duplicates('item_id', keep='first', inplace=True)
+
+genre_feats = FeatureSource(
+    path=genre_df,
+    feature_type=FType.CAT,
+    index_col='item_id',
+    name='genre',
+)
+
+primary_group_features = {
+    FGroup.USER: [],
+    FGroup.ITEM: [genre_feats],
+}
+
+
+def examples_per_sec(n_threads):
+    """Training throughput of a fresh model with `n_threads` trainers"""
+    with tf.Graph().as_default():
+        tf.set_random_seed(SEED)
+        primary_task = FactorizationTaskWrapper(
+            loss_fn='bpr',
+            sample_method='uniform_verified',
+            interactions=xn_train,
+            group_features=primary_group_features,
+            embedding_map_kwargs={
+                'embedding_dim': EMB_DIM,
+                'reg_on_lookup': True,
+            },
+            batch_size=BATCH_SIZE,
+            optimizer='lazy_adam',
+            name='primary',
+        )
+
+        sess = tf.Session(config=tf.ConfigProto(
+            inter_op_parallelism_threads=n_threads))
+        model = TophatModel(tasks=[primary_task], sess=sess)
+
+        # Warm-up (builds the shard ops and fills the prefetch buffers)
+        model.fit_hogwild(1, n_threads=n_threads, verbose=0)
+
+        step_0 = model.global_step
+        tic = time.time()
+        model.fit_hogwild(N_EPOCHS, n_threads=n_threads, verbose=0)
+        toc = time.time() - tic
+        n_examples = (model.global_step - step_0) * BATCH_SIZE
+        loss = model.loss_hists[0].epoch_losses[-1]
+        sess.close()
+
+    return n_examples / toc, loss
+
+
+if __name__ == '__main__':
+    np.random.seed(SEED)
+
+    results = []
+    for n_threads in THREAD_COUNTS:
+        throughput, loss = examples_per_sec(n_threads)
+        results.append({
+            'n_threads': n_threads,
+            'examples_per_s': throughput,
+            'loss': loss,
+        })
+
+    results_df = pd.DataFrame(results).set_index('n_threads')
+    results_df['speedup'] = results_df['examples_per_s'] / \
+        results_df['examples_per_s'].iloc[0]
+    print(results_df.to_string())
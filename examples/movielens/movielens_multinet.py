@@ -166,7 +166,8 @@ primary_validator = Validator(
 if __name__ == '__main__':
     LOG_DIR = '/tmp/tensorboard-logs/tophat-movielens'
 
-    model = TophatModel(tasks=[primary_task, genre_task])
+    model = TophatModel(tasks=[primary_task, genre_task],
+                        scheduler='time_budget')
 
     summary_cb = cbks.Summary(log_dir=LOG_DIR)
     emb_cb = cbks.Projector(log_dir=LOG_DIR,
@@ -0,0 +1,159 @@
+"""
+Benchmark of reduced precision embedding storage against the fp32 baseline
+
+For each storage dtype, reports:
+    - memory of the embedding tables (including per-row scales)
+    - lookup throughput (looked up rows per second)
+    - MAP@10 of the `Validator` after a quantization round-trip of the
+      trained tables
+"""
+import time
+import tensorflow as tf
+import numpy as np
+import pandas as pd
+
+from tophat.data import FeatureSource, InteractionsSource
+from tophat.constants import FType, FGroup
+from tophat.embedding import EmbeddingMap
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+from tophat.core import TophatModel
+from tophat.evaluation import Validator
+from tophat.utils.quantization import quantize_rows, dequantize_rows
+
+from tophat.datasets.movielens import fetch_movielens  # ref: lightfm
+
+SEED = 322
+EMB_DIM = 30
+N_EPOCHS = 10
+DTYPES = ['float32', 'float16', 'int8']
+LOOKUP_BATCH_SIZE = 1024
+N_LOOKUP_STEPS = 200
+
+# Get movielens data via lightfm
+data = fetch_movielens(
+    indicator_features=False,
+    genre_features=True,
+    min_rating=5.0,  # Pretend 5-star is an implicit 'like'
+    download_if_missing=True,
+)
+
+# #################### [ INTERACTIONS ] ####################
+xn_train = InteractionsSource(
+    path=pd.DataFrame(np.vstack(data['train'].nonzero()).T,
+                      columns=['user_id', 'item_id']),
+    user_col='user_id',
+    item_col='item_id',
+)
+
+xn_test = InteractionsSource(
+    path=pd.DataFrame(np.vstack(data['test'].nonzero()).T,
+                      columns=['user_id', 'item_id']),
+    user_col='user_id',
+    item_col='item_id',
+)
+
+# #################### [ FEATURES ] ####################
+
+genre_df = pd.DataFrame(np.vstack(data['item_features'].nonzero()).T,
+                        columns=['item_id', 'genre_id'])
+genre_df.drop_duplicates('item_id', keep='first', inplace=True)
+
+genre_feats = FeatureSource(
+    path=genre_df,
+    feature_type=FType.CAT,
+    index_col='item_id',
+    name='genre',
+)
+
+primary_group_features = {
+    FGroup.USER: [],
+    FGroup.ITEM: [genre_feats],
+}
+
+
+def table_nbytes(embs_d, dtype):
+    """Memory of the tables when stored as `dtype`"""
+    n_bytes = 0
+    for emb in embs_d.values():
+        q, scale = quantize_rows(emb, dtype)
+        n_bytes += q.nbytes + (scale.nbytes if scale is not None else 0)
+    return n_bytes
+
+
+def lookup_throughput(cats_d, embs_d, dtype):
+    """Rows looked up per second from a fresh embedding map of `dtype`"""
+    with tf.Graph().as_default():
+        embedding_map = EmbeddingMap(
+            cats_d, embedding_dim=EMB_DIM, emb_dtype=dtype,
+            init_emb_d={k: tf.constant(v) for k, v in embs_d.items()},
+        )
+        input_d = {
+            feat_name: tf.random_uniform(
+                [LOOKUP_BATCH_SIZE], maxval=len(cats), dtype=tf.int32)
+            for feat_name, cats in cats_d.items()
+        }
+        embs, biases = embedding_map.look_up(input_d, {
+            FGroup.USER: [], FGroup.ITEM: list(cats_d.keys())})
+        lookup_op = tf.group(*embs[FGroup.ITEM].values())
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(lookup_op)  # warm-up
+            tic = time.time()
+            for _ in range(N_LOOKUP_STEPS):
+                sess.run(lookup_op)
+            toc = time.time() - tic
+    return N_LOOKUP_STEPS * LOOKUP_BATCH_SIZE * len(cats_d) / toc
+
+
+if __name__ == '__main__':
+    tf.set_random_seed(SEED)
+    np.random.seed(SEED)
+
+    primary_task = FactorizationTaskWrapper(
+        loss_fn='bpr',
+        sample_method='uniform_verified',
+        interactions=xn_train,
+        group_features=primary_group_features,
+        embedding_map_kwargs={
+            'embedding_dim': EMB_DIM,
+        },
+        batch_size=128,
+        optimizer=tf.train.AdamOptimizer(learning_rate=0.001),
+        name='primary',
+    )
+
+    primary_validator = Validator(
+        xn_test,
+        parent_task_wrapper=primary_task,
+        limit_items=-1,
+        n_users_eval=200,
+        include_cold=False,
+        cold_only=False,
+        name='userXmovie',
+    )
+    primary_validator.make_ops()
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(N_EPOCHS, verbose=0)
+
+    embedding_map = model.embedding_map
+    trained_embs_d = model.sess.run(embedding_map.embeddings_d)
+
+    results = []
+    for dtype in DTYPES:
+        # Quantization round-trip of the trained tables
+        for feat_name, emb in trained_embs_d.items():
+            embedding_map.embeddings_d[feat_name].load(
+                dequantize_rows(*quantize_rows(emb, dtype)), model.sess)
+        score_d = primary_validator.run_val(model.sess, macro=True)
+
+        results.append({
+            'dtype': dtype,
+            'table_mb': table_nbytes(trained_embs_d, dtype) / 2 ** 20,
+            'lookups_per_s': lookup_throughput(
+                embedding_map.cats_d, trained_embs_d, dtype),
+            'mapk': score_d['mapk'],
+        })
+
+    print(pd.DataFrame(results).set_index('dtype').to_string())
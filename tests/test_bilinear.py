@@ -0,0 +1,90 @@
+import pytest
+import numpy as np
+import tensorflow as tf
+from tophat.constants import FGroup
+from tophat.embedding import EmbeddingMap
+from tophat.nets.bilinear import BilinearNet, BilinearNetWithNum, \
+    BilinearNetWithNumFC
+
+BATCH_SIZE = 6
+CATS_D = {
+    'user_id': list(range(5)),
+    'gender': list(range(2)),
+    'item_id': list(range(7)),
+    'brand': list(range(3)),
+    'device': list(range(2)),
+}
+CAT_COLS = {
+    FGroup.USER: ['user_id', 'gender'],
+    FGroup.ITEM: ['item_id', 'brand'],
+    FGroup.CONTEXT: ['device'],
+}
+
+
+def make_net(net_cls, interaction_type, max_order):
+    embedding_map = EmbeddingMap(CATS_D, embedding_dim=4,
+                                 vis_emb_user_col='user_id')
+    kwargs = {}
+    context_cat_cols = CAT_COLS[FGroup.CONTEXT]
+    if net_cls is BilinearNetWithNum:
+        # (numerical features as item fields, no context)
+        kwargs = {'num_meta': {'vis': 3}, 'ruin': False}
+        context_cat_cols = []
+    elif net_cls is BilinearNetWithNumFC:
+        # (the pooled interactions as is, in place of the deep portion)
+        kwargs = {'deep_net_fn': lambda f_bi, reg, scope_name:
+                  tf.reduce_sum(f_bi, 1)}
+    return net_cls(embedding_map,
+                   CAT_COLS[FGroup.USER],
+                   CAT_COLS[FGroup.ITEM],
+                   context_cat_cols,
+                   interaction_type=interaction_type,
+                   max_order=max_order,
+                   **kwargs)
+
+
+@pytest.mark.parametrize('net_cls', [
+    BilinearNet, BilinearNetWithNum, BilinearNetWithNumFC])
+@pytest.mark.parametrize('interaction_type', ['intra', 'inter'])
+@pytest.mark.parametrize('max_order', [2, 3])
+def test_factored_kernel_matches_enumerated(net_cls, interaction_type,
+                                            max_order):
+    """
+    Scores of the factored kernel equal those of the enumerated
+    interactions, for every net
+    """
+    tf.reset_default_graph()
+    rand = np.random.RandomState(322)
+    net = make_net(net_cls, interaction_type, max_order)
+    assert not net.factored_kernel
+
+    input_xn_d = {col: tf.constant(rand.randint(len(cats), size=BATCH_SIZE))
+                  for col, cats in CATS_D.items()}
+    input_xn_d['vis'] = tf.constant(
+        rand.randn(BATCH_SIZE, 3).astype(np.float32))
+
+    scores = []
+    for factored_kernel in [False, True]:
+        net.factored_kernel = factored_kernel
+        scores.append(net.forward(input_xn_d))
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        scores_enumerated, scores_factored = sess.run(scores)
+    assert scores_enumerated.shape == (BATCH_SIZE,)
+    assert np.allclose(scores_factored, scores_enumerated,
+                       rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize('factored_kernel', [False, True])
+def test_inter_kernel_opt_in(factored_kernel):
+    """
+    The kernel over group sums is only used if `factored_kernel`
+    """
+    tf.reset_default_graph()
+    net = make_net(BilinearNet, 'inter', 2)
+    net.factored_kernel = factored_kernel
+    net.forward({col: tf.constant(np.zeros(BATCH_SIZE, dtype=np.int64))
+                 for col in CATS_D})
+    op_names = [op.name for op in tf.get_default_graph().get_operations()]
+    assert any('anova_2' in name for name in op_names) == factored_kernel
@@ -0,0 +1,132 @@
+import pytest
+import numpy as np
+import pandas as pd
+from tophat.constants import FType
+from tophat.data import combine_codes, combine_cols, simplifying_assumption
+
+
+@pytest.fixture(params=['object', 'category'])
+def cols_df(request):
+    df = pd.DataFrame({
+        'brand': ['a', 'b', 'a', np.nan, 'b', 'a', np.nan, 'c'],
+        'size': [1, 2, 1, 1, np.nan, 1, 1, 2],
+        'color': ['red', 'red', 'blue', 'red', 'red', 'red', 'red', 'red'],
+    })
+    if request.param == 'category':
+        # (with categories that are not seen in the rows)
+        df['brand'] = df['brand'].astype(
+            pd.CategoricalDtype(['z', 'c', 'b', 'a']))
+        df['color'] = df['color'].astype(
+            pd.CategoricalDtype(['red', 'green', 'blue']))
+    return df
+
+
+def as_list(s: pd.Series) -> list:
+    """Values of a column (any missing value as `None`)"""
+    return [None if pd.isnull(v) else v for v in s.astype(object)]
+
+
+@pytest.mark.parametrize('cols', [
+    ['brand'], ['brand', 'size'], ['brand', 'size', 'color']])
+def test_combine_codes(cols_df, cols):
+    """
+    Rows share a code iff they share the values of the columns
+    (with missing values as a value of their own)
+    """
+    codes, rep_rows = combine_codes(cols_df, cols)
+    ref_codes, _ = pd.factorize(pd.Series(
+        [tuple(row) for row in cols_df[cols].astype(object)
+         .where(cols_df[cols].notnull(), None).values]))
+
+    assert len(set(codes)) == len(set(ref_codes))
+    assert len(set(zip(codes, ref_codes))) == len(set(codes))
+    assert (codes[rep_rows] == np.arange(len(rep_rows))).all()
+
+
+@pytest.mark.parametrize('cols_seq', [
+    [['brand', 'size']], [['brand', 'size', 'color'], ['size', 'color']]])
+def test_combine_cols_matches_str_cat(cols_df, cols_seq):
+    """
+    Combined columns have the values of the string concatenation
+    """
+    ref_df = cols_df.copy()
+    for cols in cols_seq:
+        ref_df['__'.join(cols)] = ref_df[cols[0]].astype(str).str.cat(
+            [ref_df[col].astype(str) for col in cols[1:]], sep='__')
+
+    df = combine_cols(cols_df.copy(), cols_seq)
+    for cols in cols_seq:
+        new_col = '__'.join(cols)
+        assert isinstance(df[new_col].dtype, pd.CategoricalDtype)
+        assert as_list(df[new_col]) == as_list(ref_df[new_col])
+
+
+def simplifying_assumption_ref(interactions_df, user_feats_d, item_feats_d,
+                               user_col, item_col, existing_cats_d=None):
+    """Set based reference of `simplifying_assumption`"""
+    keep_d = {}
+    for col, feats_d in [(user_col, user_feats_d), (item_col, item_feats_d)]:
+        known = set(feats_d[FType.CAT].index)
+        if FType.NUM in feats_d:
+            known &= set(feats_d[FType.NUM].index)
+        keep_d[col] = known
+    interactions_df = interactions_df.loc[[
+        u in keep_d[user_col] and i in keep_d[item_col]
+        for u, i in zip(interactions_df[user_col], interactions_df[item_col])
+    ]]
+
+    pruned_d = {}
+    for col, feats_d in [(user_col, user_feats_d), (item_col, item_feats_d)]:
+        filt = set(interactions_df[col]) | \
+            set((existing_cats_d or {}).get(col, []))
+        cat_df = feats_d[FType.CAT]
+        pruned_d[col] = cat_df.loc[[v in filt for v in cat_df.index]]
+    return interactions_df, pruned_d[user_col], pruned_d[item_col]
+
+
+@pytest.mark.parametrize('id_dtype', ['object', 'category'])
+@pytest.mark.parametrize('existing_cats_d', [
+    None, {'user_id': ['u3', 'u9'], 'item_id': ['i4']}])
+def test_simplifying_assumption_matches_ref(id_dtype, existing_cats_d):
+    """
+    Interactions of users (items) without features are dropped (including
+    missing ids), and features are pruned to the remaining ids (and the
+    existing categories)
+    """
+    interactions_df = pd.DataFrame({
+        'user_id': ['u0', 'u1', 'u0', 'u2', np.nan, 'u5', 'u1', 'u2'],
+        'item_id': ['i0', 'i1', 'i2', 'i0', 'i1', 'i0', 'i9', np.nan],
+        'rating': np.arange(8),
+    })
+    if id_dtype == 'category':
+        # (with categories that are not seen in the interactions)
+        for col, cats in [('user_id', ['u0', 'u1', 'u2', 'u3', 'u5']),
+                          ('item_id', ['i0', 'i1', 'i2', 'i9', 'i8'])]:
+            interactions_df[col] = interactions_df[col].astype(
+                pd.CategoricalDtype(cats))
+
+    user_feats_d = {FType.CAT: pd.DataFrame(
+        {'gender': list('mfmfm')},
+        index=pd.Index(['u0', 'u1', 'u2', 'u3', 'u4'], name='user_id'))}
+    item_feats_d = {
+        FType.CAT: pd.DataFrame(
+            {'brand': list('abcab')},
+            index=pd.Index(['i0', 'i1', 'i2', 'i3', 'i4'], name='item_id')),
+        # i2 has no numerical features
+        FType.NUM: pd.DataFrame(
+            {'price': [1., 2., 3., 4.]},
+            index=pd.Index(['i0', 'i1', 'i3', 'i4'], name='item_id')),
+    }
+
+    ref_xn_df, ref_user_df, ref_item_df = simplifying_assumption_ref(
+        interactions_df, user_feats_d, item_feats_d,
+        'user_id', 'item_id', existing_cats_d)
+    xn_df, user_feats_d, item_feats_d = simplifying_assumption(
+        interactions_df, {k: v.copy() for k, v in user_feats_d.items()},
+        {k: v.copy() for k, v in item_feats_d.items()},
+        'user_id', 'item_id', existing_cats_d=existing_cats_d)
+
+    assert list(xn_df['rating']) == [0, 1, 3]
+    pd.testing.assert_frame_equal(xn_df, ref_xn_df)
+    pd.testing.assert_frame_equal(user_feats_d[FType.CAT], ref_user_df)
+    pd.testing.assert_frame_equal(item_feats_d[FType.CAT], ref_item_df)
@@ -0,0 +1,222 @@
+import pytest
+import numpy as np
+import tensorflow as tf
+from tophat.constants import FGroup, LOOKUP_REG_LOSSES
+from tophat.embedding import EmbeddingMap, bucket_codes, adaptive_dims
+from tophat.optimizers import check_emb_dtype
+from tophat.utils.hashing import hash_codes, HASH_SPACE
+from tophat.utils.io import write_vocab, load_vocab
+
+
+def test_warm_start_binary_vocab(tmpdir):
+    """
+    Warm starting via a binary vocab copies the rows of old ids, uses the
+    fresh initializer for new ids, and matches ids in their own dtype
+    """
+    old_cats = np.array([10, 20, 30], dtype=np.int64)
+    old_emb = np.arange(12, dtype=np.float32).reshape([3, 4]) + 1.
+    old_bias = np.array([[1.], [2.], [3.]], dtype=np.float32)
+
+    tf.reset_default_graph()
+    with tf.variable_scope('embeddings'):
+        tf.get_variable('item_id', initializer=old_emb)
+    with tf.variable_scope('biases'):
+        tf.get_variable('item_id', initializer=old_bias)
+    path_ckpt = str(tmpdir.join('model.ckpt'))
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, path_ckpt)
+
+    write_vocab(str(tmpdir), {'item_id': old_cats}, binary=True)
+    assert load_vocab(str(tmpdir), binary=True)['item_id'].dtype == np.int64
+    path_vocab = str(tmpdir.join('item_id.vocab.npy'))
+
+    tf.reset_default_graph()
+    embedding_map = EmbeddingMap(
+        cats_d={'item_id': [30, 40, 10]},
+        embedding_dim=4,
+        init_emb_via_vocab={'embeddings/item_id': path_vocab,
+                            'biases/item_id': path_vocab},
+        path_checkpoint=path_ckpt,
+    )
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        emb, bias = sess.run([embedding_map.embeddings_d['item_id'],
+                              embedding_map.biases_d['item_id']])
+
+    # Old ids are copied
+    assert np.allclose(emb[[0, 2]], old_emb[[2, 0]])
+    assert np.allclose(bias[[0, 2]], old_bias[[2, 0]])
+    # New ids get the fresh initializers
+    assert not np.isclose(emb[1][:, None], old_emb.ravel()[None, :]).any()
+    assert np.all(np.abs(emb[1]) <= 2. / 4)  # truncated normal
+    assert bias[1, 0] == 0.
+
+
+def test_fused_lookup_matches_unfused():
+    """
+    Lookups on the fused table equal per-feature lookups
+    """
+    tf.reset_default_graph()
+    rand = np.random.RandomState(322)
+    cats_d = {'user_id': list(range(5)), 'item_id': list(range(7)),
+              'brand': list(range(3))}
+    cat_cols = {FGroup.USER: ['user_id'], FGroup.ITEM: ['item_id', 'brand']}
+    init_values_d = {k: rand.randn(len(v), 4).astype(np.float32)
+                     for k, v in cats_d.items()}
+    input_xn_d = {
+        'user_id': tf.constant([0, 4, 2]),
+        'item_id': tf.constant([6, 0, 3]),
+        'brand': tf.constant([1, 2, 0]),
+    }
+
+    looked_up = []
+    for fused in [False, True]:
+        with tf.variable_scope(f'fused_{fused}'):
+            embedding_map = EmbeddingMap(
+                cats_d, embedding_dim=4, fused=fused,
+                init_emb_d={k: tf.constant(v)
+                            for k, v in init_values_d.items()})
+            looked_up.append(embedding_map.look_up(input_xn_d, cat_cols))
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        (embs, biases), (embs_fused, biases_fused) = sess.run(looked_up)
+
+    for fg, cols in cat_cols.items():
+        for col in cols:
+            assert np.allclose(embs[fg][col], embs_fused[fg][col])
+            assert np.allclose(biases[col], biases_fused[col])
+
+
+def test_bucket_codes_range_and_determinism():
+    """
+    Bucket codes of every hash function fall in the table, and are the
+    same across calls (and graphs) with the same seed
+    """
+    codes = np.concatenate([hash_codes(np.arange(1000)),
+                            [0, HASH_SPACE - 1]]).astype(np.int32)
+    n_buckets = 97
+
+    results = []
+    for _ in range(2):
+        tf.reset_default_graph()
+        buckets = bucket_codes(tf.constant(codes), n_buckets, n_fns=3,
+                               seed=322)
+        with tf.Session() as sess:
+            results.append(sess.run(buckets))
+
+    assert results[0].shape == (3, len(codes))
+    assert ((results[0] >= 0) & (results[0] < n_buckets)).all()
+    assert np.array_equal(results[0], results[1])
+    # The hash functions differ
+    assert not np.array_equal(results[0][0], results[0][1])
+
+
+@pytest.mark.parametrize('emb_dtype,atol', [
+    ('float16', 1e-2), ('int8', 0.5 / 127 * 3.)])
+def test_reduced_precision_lookup(emb_dtype, atol):
+    """
+    Lookups of reduced precision tables come out as float32, within the
+    storage precision of the initial values
+    """
+    tf.reset_default_graph()
+    rand = np.random.RandomState(322)
+    init_values = np.clip(rand.randn(6, 4), -3., 3.).astype(np.float32)
+    embedding_map = EmbeddingMap(
+        {'item_id': list(range(6))}, embedding_dim=4, emb_dtype=emb_dtype,
+        init_emb_d={'item_id': tf.constant(init_values)})
+    codes = np.array([5, 0, 2])
+    embs, _ = embedding_map.look_up(
+        {'item_id': tf.constant(codes)}, {FGroup.ITEM: ['item_id']})
+    looked_up = embs[FGroup.ITEM]['item_id']
+    assert looked_up.dtype == tf.float32
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        looked_up_values = sess.run(looked_up)
+    assert np.allclose(looked_up_values, init_values[codes], atol=atol)
+
+
+def test_float16_optimizer_epsilon():
+    """
+    Optimizers whose epsilon underflows in float16 are rejected for float16
+    tables only
+    """
+    with pytest.raises(ValueError):
+        check_emb_dtype(tf.train.AdamOptimizer(), 'float16')
+    check_emb_dtype(tf.train.AdamOptimizer(), 'float32')
+    check_emb_dtype(tf.train.AdamOptimizer(epsilon=1e-4), 'float16')
+    check_emb_dtype(tf.train.AdagradOptimizer(0.1), 'float16')
+
+
+def test_adaptive_dims():
+    dims_d = adaptive_dims({'gender': 2, 'brand': 12, 'item_id': 10 ** 6},
+                           max_dim=32)
+    assert dims_d == {'gender': 7, 'brand': 11, 'item_id': 32}
+
+
+@pytest.mark.parametrize('embedding_dim_d', [{'brand': 3}, 'auto'])
+def test_projected_dims_shapes(embedding_dim_d):
+    """
+    Narrow tables keep their own width, but lookups (and float tables) are
+    projected to `embedding_dim`
+    """
+    tf.reset_default_graph()
+    cats_d = {'item_id': list(range(5000)), 'brand': list(range(12))}
+    embedding_map = EmbeddingMap(cats_d, embedding_dim=16,
+                                 embedding_dim_d=embedding_dim_d)
+    brand_dim = embedding_map.embedding_dim_d['brand']
+    assert brand_dim < 16
+    assert embedding_map.embeddings_d['brand'].get_shape().as_list() == \
+        [12, brand_dim]
+
+    embs, biases = embedding_map.look_up(
+        {'item_id': tf.constant([0, 4999, 7]),
+         'brand': tf.constant([11, 0, 3])},
+        {FGroup.ITEM: ['item_id', 'brand']})
+    float_embs_d = embedding_map.float_embeddings_d()
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        embs, biases, float_embs_d = sess.run([embs, biases, float_embs_d])
+    for col in ['item_id', 'brand']:
+        assert embs[FGroup.ITEM][col].shape == (3, 16)
+        assert biases[col].shape == (3,)
+        assert float_embs_d[col].shape == (len(cats_d[col]), 16)
+
+
+def test_lookup_reg_scoped_per_task():
+    """
+    With `reg_on_lookup`, the penalties of looked up rows are collected
+    under the (task) name scope of the lookup, and not on the full tables,
+    so the table gradients stay sparse
+    """
+    tf.reset_default_graph()
+    embedding_map = EmbeddingMap({'item_id': list(range(10))},
+                                 embedding_dim=4, l2_emb=0.1,
+                                 reg_on_lookup=True)
+    assert not tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES)
+
+    scopes = {}
+    for task_name, codes in [('a', [0, 1]), ('b', [2, 3, 4])]:
+        with tf.name_scope(f'task_{task_name}') as scopes[task_name]:
+            embedding_map.look_up({'item_id': tf.constant(codes)},
+                                  {FGroup.ITEM: ['item_id']})
+
+    reg_a = tf.get_collection(LOOKUP_REG_LOSSES, scope=scopes['a'])
+    reg_b = tf.get_collection(LOOKUP_REG_LOSSES, scope=scopes['b'])
+    assert len(reg_a) == len(reg_b) == 1
+    assert len(tf.get_collection(LOOKUP_REG_LOSSES)) == 2
+
+    grad, = tf.gradients(reg_a[0], [embedding_map.embeddings_d['item_id']])
+    assert isinstance(grad, tf.IndexedSlices)
+
+    table = embedding_map.embeddings_d['item_id']
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        table_values, reg_a_value, grad_inds = sess.run(
+            [table, reg_a[0], grad.indices])
+    assert np.isclose(reg_a_value,
+                      0.1 * np.sum(table_values[[0, 1]] ** 2) / 2, rtol=1e-4)
+    assert sorted(grad_inds) == [0, 1]
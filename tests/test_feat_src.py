@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 import os
 from tophat.constants import FType
-from tophat.data import FeatureSource
+from tophat.data import FeatureSource, cast_cat
+from tophat.utils.num_proc import NumTransform
 
 from tempfile import NamedTemporaryFile
 
@@ -51,8 +53,64 @@ def test_feat_fn_src():
     assert dim.data.equals(feat_df2)
 
 
+def test_num_transform_src(tmpdir):
+    """
+    A numerical source is reduced and cast, and the persisted transform
+    gives the same features for the same items
+    """
+    rand = np.random.RandomState(322)
+    num_df = pd.DataFrame(rand.randn(50, 16),
+                          index=pd.Index([f'i{i}' for i in range(50)],
+                                         name='item_id'))
 
-
-
-
-
+    dim = FeatureSource(
+        path=num_df.copy(),
+        feature_type=FType.NUM,
+        num_transform=NumTransform(dtype='float16', n_components=4),
+        name='vis',
+    )
+    dim.load()
+    assert dim.data.shape == (50, 4)
+    assert (dim.data.dtypes == np.float16).all()
+    assert dim.data.index.equals(num_df.index)
+
+    path = str(tmpdir.join('vis_transform.npz'))
+    dim.num_transform.save(path)
+    dim_val = FeatureSource(
+        path=num_df.iloc[:10].copy(),
+        feature_type=FType.NUM,
+        num_transform=path,
+        name='vis',
+    )
+    dim_val.load()
+    assert dim_val.data.equals(dim.data.iloc[:10])
+
+
+def test_num_src_force_str():
+    """
+    Without a `num_transform`, `force_str` still casts numerical sources to
+    str (values and index)
+    """
+    num_df = pd.DataFrame([[0.5, 1.], [2., 3.5]], columns=['w', 'h'],
+                          index=pd.Index([1, 2], name='item_id'))
+    dim = FeatureSource(path=num_df.copy(), feature_type=FType.NUM)
+    dim.load()
+    assert dim.data.values.tolist() == [['0.5', '1.0'], ['2.0', '3.5']]
+    assert dim.data.index.tolist() == ['1', '2']
+
+
+def test_cast_cat_int_ids():
+    """
+    Existing (text) vocab is merged in the dtype of integer ids, with new
+    ids appended
+    """
+    feats_d = {FType.CAT: pd.DataFrame({
+        'item_id': np.array([5, 3, 9, 3], dtype=np.int64),
+    })}
+    existing_cats_d = {'item_id': ['3', '5']}
+    feats_d = cast_cat(feats_d, existing_cats_d, add_new_cats=True)
+
+    assert existing_cats_d['item_id'] == [3, 5, 9]
+    cats = feats_d[FType.CAT]['item_id'].cat
+    assert cats.categories.dtype == np.int64
+    assert cats.codes.tolist() == [1, 0, 2, 0]
@@ -3,12 +3,15 @@ import tensorflow as tf
 import numpy as np
 import pandas as pd
 import tempfile
+from pathlib import Path
 import tophat.callbacks as cbks
 from tophat.data import FeatureSource, InteractionsSource
 from tophat.constants import FType, FGroup
 from tophat.tasks.wrapper import FactorizationTaskWrapper
 from tophat.core import TophatModel
 from tophat.evaluation import Validator
+from tophat.sampling.cache import write_sample_cache, cached_inds_dataset
+from tophat.sampling.pair_sampler import PairSampler
 
 from tophat.datasets.movielens import fetch_movielens
 
@@ -140,3 +143,212 @@ def test_movielens_basic(data):
     user0_neg_scores = model.predict(0, [1, 2, 3, 4])  # unseen (full set)
     assert user0_pos_scores.mean() > user0_neg_scores.mean()
 
+
+def test_movielens_steps_per_run(data):
+    """
+    Same as the basic example, but with many optimizer steps per session call
+    """
+    primary_task, primary_validator = data
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(5, verbose=False, steps_per_run=8)
+
+    # Training loss should be decreasing between epochs
+    assert (np.diff(model.loss_hists[0].epoch_losses) < 0).all()
+    assert model.global_step % 8 == 0
+
+    scores = primary_validator.run_val(model.sess, macro=True)
+    assert scores['auc'] > 0.75
+
+
+def test_movielens_checkpoint_resume(data):
+    """
+    Snapshots written in the background can be restored to resume a fit
+    """
+    with tempfile.TemporaryDirectory() as save_dir:
+        primary_task, _ = data
+
+        model = TophatModel(tasks=[primary_task])
+        ckpt_cb = cbks.AsyncCheckpointer(model, save_dir,
+                                         every_n_steps=50, keep_last=2)
+        model.fit(2, callbacks=[ckpt_cb], verbose=False)
+
+        global_step = model.global_step
+        emb = model.embedding_map.embeddings_d['item_id']
+        emb_trained = model.sess.run(emb)
+
+        # Clobber the weights, then restore them
+        model.sess.run(tf.global_variables_initializer())
+        model.global_step = 0
+        model.restore(save_dir)
+
+        assert model.global_step == global_step
+        assert np.allclose(model.sess.run(emb), emb_trained)
+        assert len(list(Path(save_dir).glob('*.npz'))) == 2
+
+        model.fit(1, verbose=False)
+        assert model.global_step > global_step
+
+
+def test_movielens_sample_cache(data):
+    """
+    Sampled batches written to a cache stream back with valid indices
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        primary_task, _ = data
+        sampler = primary_task.sampler
+
+        write_sample_cache(sampler, cache_dir, n_epochs=2, n_shards=2,
+                           block=True)
+        assert len(list(Path(cache_dir).glob('*.tfrecord'))) == 4
+
+        inds_d = cached_inds_dataset(cache_dir) \
+            .make_one_shot_iterator().get_next()
+        with tf.Session() as sess:
+            batches = [sess.run(inds_d) for _ in range(10)]
+
+    pos_xns = set(zip(sampler.pos_xn_coo.row, sampler.pos_xn_coo.col))
+    for batch in batches:
+        assert batch['neg'].shape == (sampler.batch_size, sampler.n_neg)
+        assert set(zip(batch['user'], batch['pos'])) <= pos_xns
+        assert not set(zip(batch['user'], batch['neg'][:, 0])) & pos_xns
+
+
+def test_movielens_sample_cache_writer_fails(data, monkeypatch):
+    """
+    Training from a cache whose writer failed raises (rather than waiting
+    for shard files forever)
+    """
+    primary_task, _ = data
+
+    def iter_inds_fails(*args, **kwargs):
+        raise ValueError('sampling failed')
+        yield
+
+    monkeypatch.setattr(PairSampler, 'iter_inds', iter_inds_fails)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tf.reset_default_graph()
+        primary_task.sample_cache_dir = cache_dir
+        primary_task.build()
+
+        model = TophatModel(tasks=[primary_task])
+        with pytest.raises(tf.errors.OpError):
+            model.fit(1, verbose=False)
+        assert isinstance(primary_task.cache_writer.exception, ValueError)
+
+
+def test_movielens_index_feed(data):
+    """
+    Training on index feeds (features gathered in-graph) works as well
+    """
+    primary_task, _ = data
+
+    # Rebuild the task in a fresh graph with index feeds
+    tf.reset_default_graph()
+    primary_task.index_feed = True
+    primary_task.build()
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(3, verbose=False)
+
+    assert (np.diff(model.loss_hists[0].epoch_losses) < 0).all()
+
+
+def test_movielens_index_feed_val(data):
+    """
+    Evaluating does not re-initialize the in-graph feature arrays
+    (only the validator's own local variables)
+    """
+    primary_task, primary_validator = data
+
+    tf.reset_default_graph()
+    primary_task.index_feed = True
+    primary_task.build()
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(1, verbose=False)
+
+    codes_var = primary_task.gatherer.codes_d[FGroup.USER]
+    codes = model.sess.run(codes_var)
+    codes[0] = -1
+    codes_var.load(codes, model.sess)
+
+    scores = primary_validator.run_val(model.sess, macro=True)
+    assert scores['auc'] > 0.75
+    assert np.array_equal(model.sess.run(codes_var), codes)
+
+
+def test_movielens_sample_in_graph(data):
+    """
+    Training on batches sampled natively in `tf.data` works as well
+    """
+    primary_task, _ = data
+
+    # Rebuild the task in a fresh graph with in-graph sampling
+    tf.reset_default_graph()
+    primary_task.sample_in_graph = True
+    primary_task.build()
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(3, verbose=False)
+
+    assert (np.diff(model.loss_hists[0].epoch_losses) < 0).all()
+
+
+def test_movielens_tower_cache(data):
+    """
+    Scores via the cached item tower match the full forward pass, and the
+    cache is refreshed once the model has trained
+    """
+    primary_task, primary_validator = data
+
+    model = TophatModel(tasks=[primary_task])
+    model.fit(1, verbose=False)
+
+    item_ids = [1, 2, 3, 170, 201]
+    scores_towers = model.predict(0, item_ids, use_towers=True)
+    assert np.allclose(scores_towers,
+                       model.predict(0, item_ids, use_towers=False),
+                       atol=1e-5)
+
+    cache = model.tower_scorers_d[primary_task.name][0]
+    assert not cache.refresh(model.sess)
+
+    model.fit(1, verbose=False)
+    scores_towers_2 = model.predict(0, item_ids, use_towers=True)
+    assert not np.allclose(scores_towers, scores_towers_2)
+    assert np.allclose(scores_towers_2,
+                       model.predict(0, item_ids, use_towers=False),
+                       atol=1e-5)
+
+    primary_validator.use_tower_cache = True
+    scores = primary_validator.run_val(model.sess, macro=True)
+    assert primary_validator.tower_cache is not None
+    assert scores['auc'] > 0.75
+
+
+def test_movielens_tower_cache_restore(data):
+    """
+    Validator tower caches are invalidated when the model is re-initialized
+    or restored, so evaluating after a restore scores the restored weights
+    """
+    with tempfile.TemporaryDirectory() as save_dir:
+        primary_task, primary_validator = data
+        primary_validator.use_tower_cache = True
+
+        model = TophatModel(tasks=[primary_task])
+        ckpt_cb = cbks.AsyncCheckpointer(model, save_dir, every_n_steps=50)
+        model.fit(1, callbacks=[ckpt_cb], verbose=False)
+        scores_trained = primary_validator.run_val(model.sess, macro=True)
+        cache = primary_validator.tower_cache
+        assert cache is not None
+
+        model.sess_init(init_vars=True)
+        assert cache.cached_steps is None
+        scores_init = primary_validator.run_val(model.sess, macro=True)
+        assert scores_init['auc'] < scores_trained['auc']
+
+        model.restore(save_dir)
+        assert cache.cached_steps is None
+        scores_restored = primary_validator.run_val(model.sess, macro=True)
+        assert np.isclose(scores_restored['auc'], scores_trained['auc'])
@@ -0,0 +1,38 @@
+import pytest
+import numpy as np
+from tophat.utils.quantization import (quantize_rows, dequantize_rows,
+                                       write_quantized, load_quantized)
+
+
+@pytest.mark.parametrize('dtype,rtol', [
+    ('float32', 1e-7), ('float16', 1e-3), ('int8', 1. / 127)])
+def test_quantize_roundtrip(dtype, rtol):
+    """
+    Round-trip error is within the precision of the storage dtype
+    (relative to the largest magnitude of each row for int8)
+    """
+    rand = np.random.RandomState(322)
+    arr = rand.randn(50, 16).astype(np.float32)
+    arr[3] = 0.  # all-zero row
+
+    q, scale = quantize_rows(arr, dtype)
+    assert q.dtype == np.dtype(dtype)
+    assert (scale is None) == (dtype != 'int8')
+
+    err = np.abs(dequantize_rows(q, scale) - arr)
+    row_max = np.abs(arr).max(axis=1, keepdims=True)
+    assert (err <= rtol * row_max + 1e-7).all()
+
+
+def test_quantized_file_roundtrip(tmpdir):
+    rand = np.random.RandomState(322)
+    arr = rand.randn(10, 4).astype(np.float32)
+    bias = rand.randn(10).astype(np.float32)
+    path = str(tmpdir.join('item_id.npz'))
+
+    write_quantized(path, *quantize_rows(arr, 'int8'), bias=bias)
+    values, bias_loaded = load_quantized(path)
+
+    assert values.dtype == np.float32
+    assert np.allclose(values, arr, atol=np.abs(arr).max() / 127)
+    assert np.array_equal(bias_loaded, bias)
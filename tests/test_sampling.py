@@ -10,6 +10,9 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 from tophat.sampling.pair_sampler import PairSampler
+from tophat.sampling.tf_sampling import tf_inds_dataset
+from tophat.sampling.cache import SampleCacheWriter, read_meta
+from tophat.constants import CONTEXT_VAR_TAG
 from tophat.constants import FGroup
 from pandas.api.types import CategoricalDtype
 
@@ -162,3 +165,61 @@ def test_neg(data):
             user_xn = interactions_df.loc[interactions_df['user_id'] == user_id]
 
             assert not set(neg_item_id).intersection(user_xn['item_id'].values)
+
+
+def test_tf_batches_within_epochs(data):
+    """
+    In-graph batches do not straddle epochs: the indices of a batch are
+    distinct (the partial last batch of each epoch is dropped)
+    """
+    sampler, cats_d, interactions_df, feat_codes_df_d = data
+    sampler.batch_size = 4
+    n_inds = len(sampler.shuffle_inds)
+    assert sampler.batch_size < n_inds < 2 * sampler.batch_size
+
+    next_batch = tf_inds_dataset(sampler, prefetch=None)\
+        .make_one_shot_iterator().get_next()
+    with tf.Session() as sess:
+        for _ in range(20):
+            context_inds = sess.run(next_batch)[CONTEXT_VAR_TAG]
+            assert len(context_inds) == sampler.batch_size
+            assert len(set(context_inds)) == sampler.batch_size
+
+
+def test_cache_fingerprint(data, tmpdir):
+    """
+    A sample cache is re-used for the same interactions, but not for
+    different interactions written with the same settings
+    """
+    sampler, cats_d, interactions_df, feat_codes_df_d = data
+    cache_dir = str(tmpdir.join('cache'))
+    writer = SampleCacheWriter(sampler, cache_dir)
+    assert read_meta(cache_dir) == writer.meta
+    assert not tmpdir.join('cache', 'meta.json.tmp').exists()
+    SampleCacheWriter(sampler, cache_dir)
+
+    sampler.pos_xn_coo = sampler.pos_xn_coo.copy()
+    sampler.pos_xn_coo.col[0] = (sampler.pos_xn_coo.col[0] + 1) % \
+        sampler.n_items
+    with pytest.raises(ValueError):
+        SampleCacheWriter(sampler, cache_dir)
+
+
+def test_tf_dataset_ends_after_n_epochs(data):
+    """
+    Like the python sampler, the in-graph dataset is exhausted after
+    `n_epochs` epochs
+    """
+    sampler, cats_d, interactions_df, feat_codes_df_d = data
+    sampler.batch_size = 4  # a single full batch per epoch
+    sampler.n_epochs = 3
+
+    next_batch = tf_inds_dataset(sampler, prefetch=None)\
+        .make_one_shot_iterator().get_next()
+    n_batches = 0
+    with tf.Session() as sess:
+        with pytest.raises(tf.errors.OutOfRangeError):
+            while True:
+                sess.run(next_batch)
+                n_batches += 1
+    assert n_batches == sampler.n_epochs
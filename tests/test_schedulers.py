@@ -0,0 +1,113 @@
+import numpy as np
+from tophat.schedulers import TaskScheduler, RoundRobinScheduler, \
+    LossImprovementScheduler, TimeBudgetScheduler
+
+
+def test_weighted_schedule():
+    """
+    Tasks are sampled in proportion to their weights
+    """
+    scheduler = TaskScheduler([3., 1.], seed=322)
+    assert np.allclose(scheduler.probs(), [0.75, 0.25])
+
+    inds = scheduler.schedule(10000)
+    assert set(inds) == {0, 1}
+    assert np.isclose(np.mean(inds == 0), 0.75, atol=0.02)
+
+    # Same seed, same schedule
+    assert np.array_equal(
+        inds, TaskScheduler([3., 1.], seed=322).schedule(10000))
+
+
+def test_round_robin_schedule():
+    scheduler = RoundRobinScheduler([10., 1., 1.])
+    assert list(scheduler.schedule(7)) == [0, 1, 2, 0, 1, 2, 0]
+
+
+def test_update_book_keeping():
+    """
+    Epoch losses are averaged over steps, and reset on schedule
+    """
+    scheduler = TaskScheduler([1., 1.], seed=322)
+    scheduler.schedule(4)
+    scheduler.update(0, loss=1., duration=0.1, n_steps=1)
+    scheduler.update(0, loss=4., duration=0.2, n_steps=3)
+    losses = scheduler.epoch_mean_losses
+    assert np.isclose(losses[0], (1. + 4. * 3) / 4)
+    assert np.isnan(losses[1])
+    assert np.isclose(scheduler.epoch_durations[0], 0.3)
+
+    scheduler.schedule(4)
+    assert np.isnan(scheduler.epoch_mean_losses).all()
+
+
+def test_loss_improvement_probs():
+    """
+    Tasks get steps in proportion to their relative loss improvement, with
+    a floor for stalled tasks
+    """
+    scheduler = LossImprovementScheduler([1., 1., 1.], seed=322,
+                                         min_share=0.05)
+    # No history yet: the base weights
+    scheduler.schedule(10)
+    assert np.allclose(scheduler.probs(), 1. / 3)
+
+    for task_ind, loss in enumerate([1., 1., 1.]):
+        scheduler.update(task_ind, loss, duration=1.)
+    scheduler.schedule(10)
+    # Only a single epoch of losses: no improvement measured yet
+    assert np.allclose(scheduler.probs(), 1. / 3)
+
+    # Improvements of 50%, 10% and none (a loss going up)
+    for task_ind, loss in enumerate([0.5, 0.9, 1.2]):
+        scheduler.update(task_ind, loss, duration=1.)
+    scheduler.schedule(10)
+    assert np.allclose(scheduler.improvements, [0.5, 0.1, 0.])
+
+    p = np.maximum(np.array([0.5, 0.1, 0.]) / 0.6, 0.05)
+    assert np.allclose(scheduler.probs(), p / p.sum())
+
+
+def test_loss_improvement_all_stalled():
+    """
+    If no task improves, the base weights are used
+    """
+    scheduler = LossImprovementScheduler([1., 3.], seed=322)
+    for losses in [[1., 1.], [1., 1.]]:
+        for task_ind, loss in enumerate(losses):
+            scheduler.update(task_ind, loss, duration=1.)
+        scheduler.schedule(10)
+    assert np.allclose(scheduler.probs(), [0.25, 0.75])
+
+
+def test_time_budget_probs():
+    """
+    Steps are shared out so that tasks get their weight of wall time
+    """
+    scheduler = TimeBudgetScheduler([1., 1.], seed=322, momentum=0.5)
+    scheduler.schedule(10)
+    assert np.allclose(scheduler.probs(), [0.5, 0.5])
+
+    # Task 1 is 3x slower per step
+    scheduler.update(0, loss=1., duration=1., n_steps=10)
+    scheduler.update(1, loss=1., duration=3., n_steps=10)
+    scheduler.schedule(10)
+    assert np.allclose(scheduler.latencies, [0.1, 0.3])
+    assert np.allclose(scheduler.probs(), [0.75, 0.25])
+
+    # Moving average of latencies
+    scheduler.update(0, loss=1., duration=3., n_steps=10)
+    scheduler.update(1, loss=1., duration=3., n_steps=10)
+    scheduler.schedule(10)
+    assert np.allclose(scheduler.latencies, [0.2, 0.3])
+
+
+def test_time_budget_unmeasured():
+    """
+    Until every task has run, the base weights are used
+    """
+    scheduler = TimeBudgetScheduler([1., 3.], seed=322)
+    scheduler.update(0, loss=1., duration=1.)
+    scheduler.schedule(10)
+    assert np.isnan(scheduler.latencies[1])
+    assert np.allclose(scheduler.probs(), [0.25, 0.75])
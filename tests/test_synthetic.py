@@ -0,0 +1,155 @@
+""" Smoke tests of the fit loops on a tiny synthetic data set
+"""
+import json
+import pytest
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+import tophat.callbacks as cbks
+from tophat.constants import FType, FGroup
+from tophat.core import TophatModel
+from tophat.data import FeatureSource, InteractionsSource
+from tophat.datasets.synthetic import make_synthetic
+from tophat.distributed import launch_local, local_cluster_spec
+from tophat.evaluation.towers import ItemTowerCache, TOWER_CACHE_VARS
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+
+SYNTHETIC_KWARGS = dict(n_users=50, n_items=40, density=0.1,
+                        n_user_feats=1, n_item_feats=1, seed=322)
+BATCH_SIZE = 16
+
+
+def make_task(shard=None, partitioner=None, **kwargs):
+    data = make_synthetic(**SYNTHETIC_KWARGS)
+    group_features = {
+        fg: [FeatureSource(path=data[key], feature_type=FType.CAT,
+                           index_col=data[key].columns[0], name=key)]
+        for fg, key in [(FGroup.USER, 'user_features'),
+                        (FGroup.ITEM, 'item_features')]
+    }
+    embedding_map_kwargs = {'embedding_dim': 8}
+    if partitioner is not None:
+        embedding_map_kwargs['partitioner'] = partitioner
+    return FactorizationTaskWrapper(
+        loss_fn='bpr',
+        sample_method='uniform_verified',
+        interactions=InteractionsSource(path=data['train'],
+                                        user_col='user_id',
+                                        item_col='item_id'),
+        group_features=group_features,
+        embedding_map_kwargs=embedding_map_kwargs,
+        batch_size=BATCH_SIZE,
+        optimizer=tf.train.AdamOptimizer(learning_rate=0.01),
+        shard=shard,
+        name='synthetic',
+        **kwargs
+    )
+
+
+def make_tasks(shard, partitioner):
+    # (module-level, as it is pickled for the worker processes)
+    return [make_task(shard, partitioner)]
+
+
+@pytest.fixture
+def task():
+    tf.reset_default_graph()
+    return make_task()
+
+
+def test_fit_hogwild(task):
+    """
+    Concurrent trainer threads run every step of the epochs and train the
+    shared variables
+    """
+    model = TophatModel(tasks=[task])
+    emb = model.embedding_map.embeddings_d['item_id']
+    emb_init = model.sess.run(emb)
+
+    n_epochs = 3
+    model.fit_hogwild(n_epochs, n_threads=2, verbose=False)
+
+    assert model.global_step == n_epochs * int(model.steps_per_epoch)
+    epoch_losses = model.loss_hists[0].epoch_losses
+    assert len(epoch_losses) == n_epochs
+    assert np.isfinite(epoch_losses).all()
+    assert epoch_losses[-1] < epoch_losses[0]
+    assert not np.allclose(model.sess.run(emb), emb_init)
+
+
+def test_profiler(task, tmpdir):
+    """
+    The profiler reports per-phase timings each epoch, and writes a Chrome
+    trace of every traced step
+    """
+    trace_dir = str(tmpdir.join('traces'))
+    profiler = cbks.Profiler([task], log_dir=trace_dir, trace_freq=3)
+    throughput = cbks.TaskThroughput([task.name], freq=0)
+    model = TophatModel(tasks=[task])
+
+    n_epochs = 2
+    model.fit(n_epochs, callbacks=[profiler, throughput], verbose=False)
+    n_steps = n_epochs * int(model.steps_per_epoch)
+
+    paths = sorted(Path(trace_dir).glob('timeline_step*.json'))
+    assert len(paths) == int(np.ceil(n_steps / 3))
+    with open(paths[0]) as f:
+        assert json.load(f)['traceEvents']
+
+    timings_df = profiler.timings_df
+    assert len(timings_df) == n_epochs
+    for col in [f'{task.name}/run_ms', f'{task.name}/sample_ms',
+                'queue_wait_ms']:
+        assert (timings_df[col] >= 0).all()
+    assert (timings_df[f'{task.name}/run_ms'] > 0).all()
+
+    assert len(throughput.history) == n_epochs
+    assert all(h[task.name] > 0 for h in throughput.history)
+
+
+def test_local_cluster_spec():
+    cluster_def = local_cluster_spec(n_workers=3, n_ps=2).as_dict()
+    assert len(cluster_def['worker']) == 3
+    assert len(cluster_def['ps']) == 2
+    addresses = cluster_def['worker'] + cluster_def['ps']
+    assert len(set(addresses)) == len(addresses)
+
+
+def test_replica_device_placement():
+    """
+    Under the device setter of the workers, the tables go to the parameter
+    servers, but the local feature arrays and tower caches stay on the
+    worker
+    """
+    tf.reset_default_graph()
+    cluster_spec = local_cluster_spec(n_workers=1, n_ps=2)
+    with tf.device(tf.train.replica_device_setter(
+            worker_device='/job:worker/task:0', cluster=cluster_spec)):
+        task = make_task((0, 1), tf.fixed_size_partitioner(2),
+                         index_feed=True)
+        item_codes_df = task.data_loader.feats_codes_df[FGroup.ITEM][
+            task.net.cat_cols[FGroup.ITEM]]
+        ItemTowerCache(task.net, item_codes_df)
+
+    assert all(v.device.startswith('/job:ps')
+               for v in tf.trainable_variables())
+    local_vars = tf.local_variables() + tf.get_collection(TOWER_CACHE_VARS)
+    assert len(tf.get_collection(TOWER_CACHE_VARS)) == 2
+    assert tf.local_variables()
+    assert all(v.device.startswith('/job:worker/task:0')
+               for v in local_vars)
+
+
+def test_launch_local(tmpdir):
+    """
+    Workers fit their shards against the parameter servers, and the chief
+    saves the (row sharded) tables
+    """
+    path_checkpoint = str(tmpdir.join('model.ckpt'))
+    launch_local(make_tasks, n_workers=2, n_ps=2,
+                 fit_kwargs={'n_epochs': 1, 'verbose': 0},
+                 path_checkpoint=path_checkpoint)
+
+    shapes_d = dict(tf.train.list_variables(path_checkpoint))
+    assert shapes_d['embeddings/item_id'][1] == 8
+    assert shapes_d['embeddings/user_id'][1] == 8
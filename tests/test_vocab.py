@@ -0,0 +1,40 @@
+import numpy as np
+from tophat.utils.io import write_vocab, load_vocab, vocab_remapping, \
+    vocab_index, StrVocab
+
+
+def test_binary_vocab_roundtrip(tmpdir):
+    """
+    Binary vocabs keep their dtype (and str categories their text)
+    """
+    cats_d = {
+        'item_id': np.array([5, 3, 9], dtype=np.int64),
+        'brand': ['a', 'héllo', '', 'b__c'],
+    }
+    write_vocab(str(tmpdir), cats_d, binary=True)
+    loaded_d = load_vocab(str(tmpdir), binary=True)
+
+    assert loaded_d['item_id'].dtype == np.int64
+    assert loaded_d['item_id'].tolist() == [5, 3, 9]
+    assert loaded_d['brand'].tolist() == cats_d['brand']
+
+
+def test_str_vocab_lazy(tmpdir):
+    """
+    Str categories are decoded per access from the mapped bytes
+    """
+    cats = ['a', 'héllo', '', 'b__c', '日本']
+    write_vocab(str(tmpdir), {'brand': cats}, binary=True)
+    vocab = load_vocab(str(tmpdir), binary=True)['brand']
+
+    assert isinstance(vocab, StrVocab)
+    assert isinstance(vocab.text, np.memmap)
+    assert len(vocab) == len(cats)
+    assert [vocab[i] for i in range(-len(cats), len(cats))] == cats + cats
+    assert vocab[1:4] == cats[1:4]
+    assert vocab_index(vocab).get_indexer(['日本', 'x']).tolist() == [4, -1]
+
+
+def test_vocab_remapping():
+    remap = vocab_remapping(np.array([5, 3, 9]), ['9', '4', '5'])
+    assert remap.tolist() == [2, -1, 0]
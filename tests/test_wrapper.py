@@ -0,0 +1,53 @@
+import numpy as np
+import tensorflow as tf
+from types import SimpleNamespace
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+
+
+class QuadraticTask(object):
+    """Task stand-in: `loss = (w - x) ** 2` for batches `x`, with SGD"""
+
+    def __init__(self, lr: float):
+        self.scope = None
+        self.w = tf.get_variable('w', initializer=0.)
+        self.opt = tf.train.GradientDescentOptimizer(lr)
+
+    def get_loss(self, x):
+        with tf.name_scope('task_quadratic') as self.scope:
+            return tf.square(self.w - x)
+
+    def training(self, loss, weight=1., summarize=True):
+        return self.opt.minimize(weight * loss)
+
+
+def test_multi_step_ops_sequential():
+    """
+    Many steps per run give the same result as as many separate runs:
+    each step reads the variables updated by the previous one
+    """
+    tf.reset_default_graph()
+    xs = np.arange(1., 9., dtype=np.float32)
+    lr = 0.1
+    wrapper = SimpleNamespace(
+        name='quadratic',
+        task=QuadraticTask(lr),
+        task_weight=1.,
+        iterator=tf.data.Dataset.from_tensor_slices(xs)
+        .make_one_shot_iterator(),
+        input_via_iterator=lambda iterator: iterator.get_next(),
+        multi_step_ops_d={},
+    )
+    loss_op, train_op = FactorizationTaskWrapper.multi_step_ops(
+        wrapper, len(xs))
+
+    w, losses = 0., []
+    for x in xs:
+        losses.append((w - x) ** 2)
+        w -= lr * 2 * (w - x)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        loss, _ = sess.run([loss_op, train_op])
+        w_multi = sess.run(wrapper.task.w)
+    assert np.isclose(w_multi, w, rtol=1e-5)
+    assert np.isclose(loss, np.mean(losses), rtol=1e-5)
@@ -52,8 +52,16 @@ def test_xn_fn_src():
     assert xn.data.equals(xn_df2)
 
 
-
-
-
-
-
+def test_xn_src_int_ids():
+    """
+    Sources build (and keep integer ids) without string casting
+    """
+    xn = InteractionsSource(
+        path=pd.DataFrame({'user_id': [1, 2], 'item_id': [10, 20]}),
+        user_col='user_id',
+        item_col='item_id',
+        force_str=False,
+    )
+    xn.load()
+    assert xn.data['user_id'].dtype.kind == 'i'
+    assert xn.data['item_id'].tolist() == [10, 20]
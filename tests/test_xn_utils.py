@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import tensorflow as tf
+from tophat.utils.xn_utils import (preset_interactions, kernel_via_xn_sets,
+                                   kernel_via_anova, group_sums)
+
+
+def make_embs(fields_d):
+    tf.reset_default_graph()
+    rand = np.random.RandomState(322)
+    return {f: tf.constant(rand.randn(8, 5), dtype=tf.float32)
+            for f in sum(fields_d.values(), [])}
+
+
+@pytest.mark.parametrize('max_order', [2, 3, 4])
+def test_anova_kernel_matches_intra(max_order):
+    """
+    The factorized kernel scores the same as enumerating all intra
+    interactions
+    """
+    fields_d = {
+        'user': ['user_id', 'gender', 'age'],
+        'item': ['item_id', 'brand'],
+        'context': ['device'],
+    }
+    emb_d = make_embs(fields_d)
+
+    interaction_sets = preset_interactions(
+        fields_d, interaction_type='intra', max_order=max_order)
+    score_sets = kernel_via_xn_sets(interaction_sets, emb_d)
+    score_anova = kernel_via_anova(
+        [emb_d[f] for f in sum(fields_d.values(), [])], max_order)
+
+    with tf.Session() as sess:
+        scores_sets, scores_anova = sess.run([score_sets, score_anova])
+    assert np.allclose(scores_sets, scores_anova, atol=1e-4)
+
+
+@pytest.mark.parametrize('max_order,with_context', [
+    (2, False), (2, True), (3, True)])
+def test_group_sum_kernel_matches_inter(max_order, with_context):
+    """
+    The kernel over group sums scores the same as enumerating all inter
+    interactions
+    """
+    fields_d = {
+        'user': ['user_id', 'gender', 'age'],
+        'item': ['item_id', 'brand'],
+        'context': ['device'] if with_context else [],
+    }
+    emb_d = make_embs(fields_d)
+
+    interaction_sets = preset_interactions(
+        fields_d, interaction_type='inter', max_order=max_order)
+    score_sets = kernel_via_xn_sets(interaction_sets, emb_d)
+    score_sums = kernel_via_anova(
+        list(group_sums(fields_d, emb_d).values()), max_order)
+
+    with tf.Session() as sess:
+        scores_sets, scores_sums = sess.run([score_sets, score_sums])
+    assert np.allclose(scores_sets, scores_sums, atol=1e-4)
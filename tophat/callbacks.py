@@ -6,8 +6,12 @@ References:
 """
 import pandas as pd
 import tensorflow as tf
+import threading
+from collections import defaultdict
+from tensorflow.python.client import timeline
 from tensorflow.python.keras.callbacks import *
 from tophat.utils.log import logger
+from tophat.utils.checkpoint import write_snapshot, remove_old_snapshots
 from tophat.embedding import EmbeddingProjector
 
 
@@ -65,10 +69,144 @@ class Monitor(Callback):
             logger.info('\t'.join(
                 [f'ep={epoch}', f'time={toc:.3f}s'] +
                 [f'{l.task_name}_loss={l.epoch_losses[-1]:.3f}'
-                 for l in self.loss_hist]
+                 for l in self.loss_hist] +
+                # Additional epoch values (ex. from `Profiler`)
+                [f'{k}={v:.3f}' for k, v in (logs or {}).items()
+                 if isinstance(v, (int, float))]
             ))
 
 
+class TaskThroughput(Callback):
+    """Logs the examples per second of each task's training operations
+    (uses the `duration` and `size` batch logs of the fit loop)
+    """
+    def __init__(self, task_names, freq=1):
+        super().__init__()
+        self.task_names = task_names
+        self.freq = freq
+
+    def on_train_begin(self, logs=None):
+        self.history = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.n_examples = dict.fromkeys(self.task_names, 0)
+        self.durations = dict.fromkeys(self.task_names, 0.)
+
+    def on_batch_end(self, batch, logs=None):
+        self.n_examples[logs['task']] += logs.get('size', 0)
+        self.durations[logs['task']] += logs.get('duration', 0.)
+
+    def on_epoch_end(self, epoch, logs=None):
+        throughputs = {
+            name: self.n_examples[name] / self.durations[name]
+            if self.durations[name] else 0.
+            for name in self.task_names}
+        self.history.append(throughputs)
+        if self.freq and (epoch % self.freq) == 0:
+            logger.info('\t'.join(
+                [f'ep={epoch}'] +
+                [f'{name}_ex/s={throughput:.0f}'
+                 for name, throughput in throughputs.items()]
+            ))
+
+
+class Profiler(Callback):
+    """Per-phase timings of the training steps
+
+    Adds the mean time per batch (in ms) of each phase to the epoch logs
+    (so that `Monitor` and `Summary` report them -- list the profiler before
+    `Summary`):
+        - `{task}/sample_ms`, `{task}/negatives_ms`, `{task}/feed_build_ms`:
+          sampling phases of the task's `PairSampler` (run ahead of the
+          training steps by the dataset prefetch)
+        - `{task}/run_ms`: session call of the training step
+        - `queue_wait_ms`: time spent waiting on the dataset iterators
+          within traced steps
+
+    Optionally traces every `trace_freq` steps and writes Chrome traces
+    (`timeline_step{step}.json` in `log_dir`, open with chrome://tracing)
+    and the run metadata to `summary_writer` (TensorBoard graph view)
+
+    Args:
+        task_wrappers: tasks whose samplers to profile
+        log_dir: directory for the Chrome traces
+        trace_freq: periodicity (in steps) of traces (0 to disable)
+        summary_writer: Optional summary writer for the run metadata
+    """
+    def __init__(self, task_wrappers, log_dir=None, trace_freq=0,
+                 summary_writer=None):
+        super().__init__()
+        self.task_wrappers = task_wrappers
+        self.log_dir = log_dir
+        self.trace_freq = trace_freq
+        self.summary_writer = summary_writer
+        if self.trace_freq and self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+
+    def on_train_begin(self, logs=None):
+        self.step = 0
+        self.history = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.run_durations = defaultdict(float)
+        self.n_runs = defaultdict(int)
+        self.queue_waits = []
+        for task_wrapper in self.task_wrappers:
+            task_wrapper.sampler.pop_timings()
+
+    def on_batch_begin(self, batch, logs=None):
+        if self.trace_freq and (self.step % self.trace_freq) == 0:
+            logs['run_options'] = tf.RunOptions(
+                trace_level=tf.RunOptions.FULL_TRACE)
+            logs['run_metadata'] = tf.RunMetadata()
+
+    def on_batch_end(self, batch, logs=None):
+        self.run_durations[logs['task']] += logs.get('duration', 0.)
+        self.n_runs[logs['task']] += 1
+        if 'run_metadata' in logs:
+            self.write_trace(logs['run_metadata'])
+        self.step += 1
+
+    def write_trace(self, run_metadata):
+        step_stats = run_metadata.step_stats
+        self.queue_waits.append(sum(
+            node_stats.all_end_rel_micros
+            for dev_stats in step_stats.dev_stats
+            for node_stats in dev_stats.node_stats
+            if 'IteratorGetNext' in node_stats.node_name) / 1e6)
+        if self.log_dir:
+            trace = timeline.Timeline(step_stats) \
+                .generate_chrome_trace_format()
+            path = os.path.join(self.log_dir, f'timeline_step{self.step}.json')
+            with open(path, 'w') as f:
+                f.write(trace)
+        if self.summary_writer is not None:
+            self.summary_writer.add_run_metadata(
+                run_metadata, f'step{self.step}', global_step=self.step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        timings_d = {}
+        for task_wrapper in self.task_wrappers:
+            name = task_wrapper.name
+            timings = task_wrapper.sampler.pop_timings()
+            n_batches = timings.pop('n_batches', 0)
+            for phase, secs in timings.items():
+                timings_d[f'{name}/{phase}_ms'] = 1e3 * secs / n_batches
+            if self.n_runs[name]:
+                timings_d[f'{name}/run_ms'] = \
+                    1e3 * self.run_durations[name] / self.n_runs[name]
+        if self.queue_waits:
+            timings_d['queue_wait_ms'] = 1e3 * np.mean(self.queue_waits)
+
+        self.history.append(timings_d)
+        if logs is not None:
+            logs.update(timings_d)
+
+    @property
+    def timings_df(self):
+        return pd.DataFrame(self.history)
+
+
 class Summary(Callback):
     # TODO: consider using TensorBoard callback
     def __init__(self, log_dir, sess=None):
@@ -81,6 +219,12 @@ class Summary(Callback):
     def on_epoch_end(self, epoch, logs=None):
         summary_str = self.sess.run(self.summary_op)
         self.summary_writer.add_summary(summary_str, epoch)
+        # Additional epoch values (ex. from `Profiler`)
+        values = [tf.Summary.Value(tag=k, simple_value=v)
+                  for k, v in (logs or {}).items()
+                  if isinstance(v, (int, float))]
+        if values:
+            self.summary_writer.add_summary(tf.Summary(value=values), epoch)
         self.summary_writer.flush()
 
 
@@ -109,6 +253,89 @@ class ModelSaver(Callback):
         self.saver.save(self.sess, os.path.join(self.save_dir, 'model.ckpt'))
 
 
+class AsyncCheckpointer(Callback):
+    """Periodic snapshots of all global variables (incl. optimizer slots
+    and task step counters) written on a background thread
+
+    The values are copied to host memory with a single session call, and
+    the write to disk happens off the fit loop. If the previous write is
+    still in progress, the snapshot is skipped rather than stalling.
+    Resume with `TophatModel.restore(save_dir)`.
+
+    Note: the state of the samplers (and their iterators) is not saved
+
+    Args:
+        model: the `TophatModel` being fit (for its session and global step)
+        save_dir: directory of the snapshots
+        every_n_steps: Optional periodicity in steps
+        every_n_secs: Optional periodicity in seconds
+        keep_last: number of snapshots to keep
+    """
+    def __init__(self, model, save_dir, every_n_steps=None,
+                 every_n_secs=None, keep_last=3):
+        super().__init__()
+        self.tophat_model = model
+        self.save_dir = save_dir
+        self.every_n_steps = every_n_steps
+        self.every_n_secs = every_n_secs
+        self.keep_last = keep_last
+        os.makedirs(self.save_dir, exist_ok=True)
+
+        self.var_list = None
+        self.writer = None
+        self.epoch = 0
+        self.last_step = 0
+        self.last_time = time.time()
+
+    def on_train_begin(self, logs=None):
+        self.var_list = tf.global_variables()
+        self.last_step = self.tophat_model.global_step
+        self.last_time = time.time()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_batch_end(self, batch, logs=None):
+        global_step = self.tophat_model.global_step
+        if (self.every_n_steps and
+                global_step - self.last_step >= self.every_n_steps) or \
+                (self.every_n_secs and
+                 time.time() - self.last_time >= self.every_n_secs):
+            self.snapshot()
+
+    def on_train_end(self, logs=None):
+        self.wait()
+        if self.last_step != self.tophat_model.global_step:
+            self.snapshot()
+        self.wait()
+
+    def snapshot(self):
+        global_step = self.tophat_model.global_step
+        self.last_step = global_step
+        self.last_time = time.time()
+        if self.writer is not None and self.writer.is_alive():
+            logger.warning(f'Snapshot at step {global_step} skipped '
+                           f'(previous write in progress)')
+            return
+
+        values = self.tophat_model.sess.run(self.var_list)  # host copy
+        names = [v.op.name for v in self.var_list]
+        meta = {'global_step': global_step, 'epoch': self.epoch,
+                'time': self.last_time}
+
+        def write():
+            write_snapshot(self.save_dir, names, values, meta)
+            remove_old_snapshots(self.save_dir, self.keep_last)
+
+        self.writer = threading.Thread(target=write, daemon=True)
+        self.writer.start()
+
+    def wait(self):
+        """Waits for the write in progress (if any)"""
+        if self.writer is not None:
+            self.writer.join()
+
+
 class Scorer(Callback):
     def __init__(self, validator, summary_writer, freq=1, sess=None,
                  macro=True):
@@ -53,3 +53,6 @@ class FGroup(DummyEnum):
 
 # Dictionary of FType to list of feature names optionally with dimension
 FtypeMeta = Dict[FType, Union[List[str], List[Tuple[str, int]]]]
+
+# Collection of regularization losses on looked up (rather than all) rows
+LOOKUP_REG_LOSSES = 'lookup_regularization_losses'
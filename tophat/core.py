@@ -1,12 +1,20 @@
 import tensorflow as tf
 import numpy as np
-import itertools as it
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from tophat.constants import FGroup
 from tophat.tasks.wrapper import FactorizationTaskWrapper
 import tophat.callbacks as cbks
 from tophat.evaluation.transport import items_pred_dicter
+from tophat.evaluation.towers import make_tower_scorer, catalog_positions, \
+    invalidate_tower_caches
+from tophat.schedulers import TaskScheduler, NAMED_SCHEDULERS
 from tophat.utils.io import write_vocab
+from tophat.utils.checkpoint import read_snapshot
+from tophat.utils.log import logger
 from typing import Optional, List, Sequence, Any, Union
 
 
@@ -16,7 +24,22 @@ class TophatModel(object):
                  tasks: List[FactorizationTaskWrapper],
                  task_weights: List[float] = None,
                  sess: Optional[tf.Session] = None,
+                 init_vars: bool = True,
+                 scheduler: Union[str, TaskScheduler] = 'weighted',
                  ):
+        """
+        Args:
+            tasks: task wrappers to alternate between
+            task_weights: sampling weights of the tasks
+                (on top of their number of steps per epoch)
+            sess: Optional session
+            scheduler: task scheduler (or the name of one in
+                `tophat.schedulers.NAMED_SCHEDULERS` which is then
+                initialized with the task sampling weights)
+            init_vars: flag to initialize all variables
+                (turn off if `sess` is already initialized -- ex. a
+                non-chief worker of a cluster, see `tophat.distributed`)
+        """
 
         self.tasks = tasks
         # Assure all tasks are built
@@ -32,28 +55,46 @@ class TophatModel(object):
         self.task_samp_weights *= task_weights
         self.task_samp_weights = (self.task_samp_weights /
                                   self.task_samp_weights.sum())
+        self.scheduler = NAMED_SCHEDULERS[scheduler](self.task_samp_weights) \
+            if isinstance(scheduler, str) else scheduler
 
         self.sess = sess
-        self.sess_init()
+        self.sess_init(init_vars)
 
         # Assume embedding map is shared for all tasks, just grab first
         self.embedding_map = self.tasks[0].embedding_map
 
         self.global_step = 0
         self.loss_hists = None
+        # Cached item tower scorers keyed by task name (see `predict`)
+        self.tower_scorers_d = {}
 
-    def sess_init(self):
+    def sess_init(self, init_vars: bool = True):
         self.sess = self.sess or tf.Session()
         # Set session on sampler (in case of adaptive sampling)
         for task in self.tasks:
             task.sampler.sess = self.sess
-        init = tf.global_variables_initializer()
-        self.sess.run(init)
+        if init_vars:
+            init = tf.global_variables_initializer()
+            self.sess.run(init)
+            invalidate_tower_caches()
+        # Local variables (ex. feature arrays of in-graph gathers)
+        self.sess.run(tf.local_variables_initializer())
+
+    def init_new_vars(self):
+        """Initializes variables created after `sess_init`"""
+        uninit_names = set(self.sess.run(
+            tf.report_uninitialized_variables()))
+        new_vars = [v for v in tf.global_variables()
+                    if v.op.name.encode() in uninit_names]
+        if new_vars:
+            self.sess.run(tf.variables_initializer(new_vars))
 
     def fit(self,
             n_epochs: Optional[int] = 1,
             callbacks: Optional[List[cbks.Callback]] = None,
             verbose: int = 1,
+            steps_per_run: int = 1,
             ):
         """Alternating task fit
 
@@ -61,63 +102,218 @@ class TophatModel(object):
             n_epochs: number of effective epochs
                 This is approximate since we're randomly alternating tasks
             callbacks: list of callbacks to perform during fit loop
+                (batch callbacks can set `run_options` and `run_metadata`
+                in the batch logs to trace the step, see `cbks.Profiler`)
             verbose: periodicity (in epochs) of logging
+            steps_per_run: number of optimizer steps (of the same task) per
+                session call (see `FactorizationTaskWrapper.multi_step_ops`).
+                Batch callbacks are then called once per run, with the mean
+                loss of the run and its number of steps (`logs['steps']`).
+                Larger values cut the per-call overhead which dominates the
+                step time of small models.
 
         Returns:
 
         """
 
-        n_tasks_per_epoch = int(self.steps_per_epoch)
-        self.loss_hists = [cbks.TaskLossHistory(t.name) for t in self.tasks]
-
-        _callbacks = (callbacks or []) + self.loss_hists
-        if verbose:
-            _callbacks.append(cbks.Monitor(self.loss_hists, verbose))
-
-        for c in _callbacks:
-            if hasattr(c, 'sess') and c.sess is None:
-                c.sess = self.sess
-
-        callbacks = cbks.CallbackList(_callbacks)
+        if steps_per_run > 1:
+            for task in self.tasks:
+                task.multi_step_ops(steps_per_run)
+            self.init_new_vars()
+        n_tasks_per_epoch = int(np.ceil(
+            int(self.steps_per_epoch) / steps_per_run))
+        callbacks = self.make_callback_list(callbacks, verbose)
 
         callbacks.on_train_begin()
 
         for epoch_ind in range(n_epochs):
-            callbacks.on_epoch_begin(epoch_ind)
+            epoch_logs = {}
+            callbacks.on_epoch_begin(epoch_ind, epoch_logs)
 
-            if len(self.tasks) == 1:
-                sampled_tasks = it.repeat(self.tasks[0], n_tasks_per_epoch)
-            else:
-                sampled_tasks = np.random.choice(
-                    self.tasks, n_tasks_per_epoch, p=self.task_samp_weights)
+            task_inds = self.scheduler.schedule(n_tasks_per_epoch)
 
-            for step_ind, task in enumerate(sampled_tasks):
-                batch_logs = {'batch': step_ind, 'size': task.batch_size,
+            for step_ind, task_ind in enumerate(task_inds):
+                task = self.tasks[task_ind]
+                batch_logs = {'batch': step_ind,
+                              'size': task.batch_size * steps_per_run,
+                              'steps': steps_per_run,
                               'task': task.name}
 
                 callbacks.on_batch_begin(step_ind, batch_logs)
 
                 # Perform operations
-                task_loss, _ = self.sess.run([task.loss, task.train_op])
+                if steps_per_run > 1:
+                    loss_op, train_op = task.multi_step_ops(steps_per_run)
+                else:
+                    loss_op, train_op = task.loss, task.train_op
+                tic = time.time()
+                task_loss, _ = self.sess.run(
+                    [loss_op, train_op],
+                    options=batch_logs.get('run_options'),
+                    run_metadata=batch_logs.get('run_metadata'))
+                batch_logs['duration'] = time.time() - tic
                 batch_logs['loss'] = task_loss
+                self.scheduler.update(task_ind, task_loss,
+                                      batch_logs['duration'], steps_per_run)
 
                 callbacks.on_batch_end(step_ind, batch_logs)
-                self.global_step += 1
+                self.global_step += steps_per_run
 
-            callbacks.on_epoch_end(epoch_ind)
+            callbacks.on_epoch_end(epoch_ind, epoch_logs)
         callbacks.on_train_end()
 
+    def fit_hogwild(self,
+                    n_epochs: Optional[int] = 1,
+                    n_threads: int = 4,
+                    callbacks: Optional[List[cbks.Callback]] = None,
+                    verbose: int = 1,
+                    ):
+        """Alternating task fit with concurrent trainer threads (Hogwild)
+
+        Each thread drives the shared session with its own sampler shard
+        (see `FactorizationTaskWrapper.shard_ops`) and applies its updates
+        to the shared variables without locking. The steps of an epoch are
+        split between the threads, which are joined at the end of each epoch.
+        Batch callbacks are serialized with a lock.
+
+        Note: the session should allow concurrent ops
+        (ex. `tf.ConfigProto(inter_op_parallelism_threads=n_threads)`)
+
+        Args:
+            n_epochs: number of effective epochs
+                This is approximate since we're randomly alternating tasks
+            n_threads: number of trainer threads
+            callbacks: list of callbacks to perform during fit loop
+            verbose: periodicity (in epochs) of logging
+
+        Returns:
+
+        """
+
+        for task in self.tasks:
+            task.shard_ops(n_threads)
+        self.init_new_vars()
+
+        n_tasks_per_epoch = int(self.steps_per_epoch)
+        callbacks = self.make_callback_list(callbacks, verbose)
+        lock = threading.Lock()
+
+        def trainer(shard_index, task_inds, step_inds):
+            for step_ind, task_ind in zip(step_inds, task_inds):
+                task = self.tasks[task_ind]
+                batch_logs = {'batch': step_ind, 'size': task.batch_size,
+                              'task': task.name, 'thread': shard_index}
+                with lock:
+                    callbacks.on_batch_begin(step_ind, batch_logs)
+
+                loss_op, train_op = task.shard_ops(n_threads)[shard_index]
+                tic = time.time()
+                task_loss, _ = self.sess.run(
+                    [loss_op, train_op],
+                    options=batch_logs.get('run_options'),
+                    run_metadata=batch_logs.get('run_metadata'))
+                batch_logs['duration'] = time.time() - tic
+                batch_logs['loss'] = task_loss
+
+                with lock:
+                    self.scheduler.update(task_ind, task_loss,
+                                          batch_logs['duration'])
+                    callbacks.on_batch_end(step_ind, batch_logs)
+                    self.global_step += 1
+
+        callbacks.on_train_begin()
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            for epoch_ind in range(n_epochs):
+                epoch_logs = {}
+                callbacks.on_epoch_begin(epoch_ind, epoch_logs)
+
+                task_inds = self.scheduler.schedule(n_tasks_per_epoch)
+                step_inds = range(n_tasks_per_epoch)
+                futures = [
+                    executor.submit(trainer, shard_index,
+                                    task_inds[shard_index::n_threads],
+                                    step_inds[shard_index::n_threads])
+                    for shard_index in range(n_threads)]
+                for future in futures:
+                    future.result()  # re-raises exceptions of the trainers
+
+                callbacks.on_epoch_end(epoch_ind, epoch_logs)
+        callbacks.on_train_end()
+
+    def make_callback_list(self,
+                           callbacks: Optional[List[cbks.Callback]] = None,
+                           verbose: int = 1,
+                           ) -> cbks.CallbackList:
+        """Callbacks of a fit loop (with fresh task loss histories)"""
+        self.loss_hists = [cbks.TaskLossHistory(t.name) for t in self.tasks]
+
+        _callbacks = (callbacks or []) + self.loss_hists
+        if verbose:
+            _callbacks.append(cbks.Monitor(self.loss_hists, verbose))
+            _callbacks.append(cbks.TaskThroughput(
+                [t.name for t in self.tasks], verbose))
+
+        for c in _callbacks:
+            if hasattr(c, 'sess') and c.sess is None:
+                c.sess = self.sess
+
+        return cbks.CallbackList(_callbacks)
+
+    def restore(self, path: Union[str, Path]):
+        """Restores variable values and global step from a snapshot written
+        by `cbks.AsyncCheckpointer` (so that `fit` can resume)
+
+        Args:
+            path: a snapshot or a directory of snapshots
+                (the latest is restored)
+
+        """
+        values_d, meta = read_snapshot(path)
+        vars_d = {v.op.name: v for v in tf.global_variables()}
+        missing = set(vars_d) - set(values_d)
+        if missing:
+            logger.warning(f'Variables missing from snapshot: {missing}')
+        for name, value in values_d.items():
+            if name in vars_d:
+                vars_d[name].load(value, self.sess)
+        self.global_step = meta['global_step']
+        # Also the caches of validators (not only of `predict`)
+        invalidate_tower_caches()
+        logger.info(f'Restored snapshot at step {self.global_step}')
+
     def predict(self,
                 user_id: Any,
                 item_ids: Sequence[Any],
                 task: Optional[FactorizationTaskWrapper] = None,
+                use_towers: bool = False,
                 ):
+        """Scores items for a user
+
+        If `use_towers` and the task's net has towers
+        (see `BilinearNet.has_towers`), the item tower of the catalog is
+        cached (and refreshed once the model has trained since), so that
+        scoring is a single matmul
+
+        Args:
+            user_id: user to score for
+            item_ids: items to score
+            task: task to score with (the first task by default)
+            use_towers: flag to score via the cached item tower if possible
+                (the cache and its ops are added to the graph on first use)
+
+        Returns:
+            Array of scores of the items
+        """
 
         task_wrapper = task or self.tasks[0]
         data_loader = task_wrapper.data_loader
         feat_codes_df = data_loader.feats_codes_df
         num_feats_df = data_loader.num_feats_df
 
+        if use_towers and task_wrapper.net.has_towers:
+            return self.predict_via_towers(user_id, item_ids, task_wrapper)
+
         input_fwd_d = task_wrapper.task.get_fwd_dict()
 
         input_tensors = items_pred_dicter(
@@ -134,8 +330,31 @@ class TophatModel(object):
 
         return preds_arr
 
-    def write_vocab(self, dir_export: Union[str, Path]):
-        write_vocab(dir_export, self.embedding_map.cats_d)
+    def predict_via_towers(self,
+                           user_id: Any,
+                           item_ids: Sequence[Any],
+                           task_wrapper: FactorizationTaskWrapper,
+                           ) -> np.array:
+        net = task_wrapper.net
+        codes_dfs = task_wrapper.data_loader.feats_codes_df
+        item_codes_df = codes_dfs[FGroup.ITEM][net.cat_cols[FGroup.ITEM]]
+
+        if task_wrapper.name not in self.tower_scorers_d:
+            self.tower_scorers_d[task_wrapper.name] = \
+                make_tower_scorer(net, item_codes_df)
+        cache, user_input_d, item_inds, scores_op = \
+            self.tower_scorers_d[task_wrapper.name]
+        cache.refresh(self.sess)
+
+        user_codes = codes_dfs[FGroup.USER].loc[[user_id]]
+        feed_dict = {ph: user_codes[col].values
+                     for col, ph in user_input_d.items()}
+        feed_dict[item_inds] = catalog_positions(item_codes_df, item_ids)
+        return self.sess.run(scores_op, feed_dict=feed_dict)
+
+    def write_vocab(self, dir_export: Union[str, Path],
+                    binary: bool = False):
+        write_vocab(dir_export, self.embedding_map.cats_d, binary=binary)
 
     def write_cats(self, path_export):
         pickle.dump(self.embedding_map.cats_d, open(path_export, 'wb'))
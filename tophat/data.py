@@ -9,6 +9,8 @@ from typing import Optional, Iterable, Tuple, Dict, List, Any, Sized, \
 from tophat.constants import FType, FGroup
 from tophat.utils.pp_utils import append_dt_extracts
 from tophat.utils.convenience import filter_col_isin, log_shape_or_npartitions
+from tophat.utils.hashing import hash_codes
+from tophat.utils.num_proc import NumTransform
 from tophat.utils.log import logger
 
 
@@ -26,7 +28,17 @@ class FeatureSource(object):
         load_kwargs: kwargs for `load_fn`
         force_str: if `True`, cast everything to strings
             (to avoid collision of dtypes when expanding vocab)
+            If `False`, ids keep their dtype (ex. int64) throughout,
+            and existing vocabs are cast to it (see `cast_cat`)
+            Note: the values of numerical sources with a `num_transform`
+            are not cast (only their index)
         name: Name of the data source
+        num_transform: Optional preprocessing of a numerical source
+            (cast and/or reduction, see `NumTransform`). If it is not
+            fitted yet, it is fitted on this source, else it is re-applied
+            as is (ex. to the cold items of a validation source).
+            Can also be the path of a transform saved with
+            `NumTransform.save`
     """
 
     def __init__(self,
@@ -41,6 +53,7 @@ class FeatureSource(object):
                  load_kwargs: Optional[Dict] = None,
                  force_str: Optional[bool] = True,
                  name=None,
+                 num_transform: Optional[Union[NumTransform, str]] = None,
                  ):
 
         self.name = name
@@ -53,6 +66,11 @@ class FeatureSource(object):
         self.concat_cols = concat_cols
         self.drop_cols = drop_cols
         self.force_str = force_str
+        if num_transform is not None and feature_type != FType.NUM:
+            raise ValueError('`num_transform` is only for numerical sources')
+        if isinstance(num_transform, str):
+            num_transform = NumTransform.load(num_transform)
+        self.num_transform = num_transform
 
         self.data = None
 
@@ -95,8 +113,14 @@ class FeatureSource(object):
             if self.drop_cols:
                 self.data.drop(list(set(self.drop_cols)), axis=1, inplace=True)
 
+            if self.num_transform is not None:
+                self.data = self.num_transform.transform_df(
+                    self.data, prefix=self.name or 'num')
+
             if self.force_str:
-                self.data = self.data.astype(str)
+                # (the output of a numerical transform stays numerical)
+                if self.num_transform is None:
+                    self.data = self.data.astype(str)
                 self.data.index = self.data.index.astype(str)
 
         return self
@@ -105,10 +129,54 @@ class FeatureSource(object):
 FeatureSourceDictType = Dict[FGroup, Optional[Iterable[FeatureSource]]]
 
 
+def codes_via_col(s: pd.Series) -> Tuple[np.array, pd.Index]:
+    """Integer codes (-1 if missing) and unique values of a column
+    (categorical columns are not re-factorized)
+    """
+    if hasattr(s, 'cat'):
+        return s.cat.codes.values, s.cat.categories
+    codes, uniques = pd.factorize(s)
+    return codes, pd.Index(uniques)
+
+
+def combine_codes(df: pd.DataFrame,
+                  cols: Sequence[str],
+                  ) -> Tuple[np.array, np.array]:
+    """Integer codes of the combinations of values of columns
+    Columns are factorized and crossed arithmetically two at a time, and
+    the crossed codes are re-factorized after each step (so they stay
+    below the number of rows, and can not overflow)
+
+    Args:
+        df: dataframe to operate on
+        cols: columns to cross
+
+    Returns:
+        Tuple of the codes `[n_rows]` and the position of a representative
+        row of each code
+    """
+    codes, n_codes = None, 1
+    for col in cols:
+        # (missing values are coded as -1, and shifted to their own code)
+        col_codes, col_uniques = codes_via_col(df[col])
+        col_codes = col_codes.astype(np.int64) + 1
+        if codes is None:
+            codes = col_codes
+        else:
+            codes = codes * (len(col_uniques) + 1) + col_codes
+        codes, uniques = pd.factorize(codes)
+        n_codes = len(uniques)
+
+    rep_rows = np.empty(n_codes, dtype=np.int64)
+    rep_rows[codes] = np.arange(len(codes))
+    return codes, rep_rows
+
+
 def combine_cols(df: pd.DataFrame,
                  cols_seq: Sequence[Sequence[str]],
                  sep: str='__'):
-    """Concatenates columns (will output str dtypes)
+    """Concatenates columns into categorical columns
+    (with str categories, the only strings built are the categories)
     
     Args:
         df: dataframe to operate on
@@ -123,8 +191,14 @@ def combine_cols(df: pd.DataFrame,
 
     for cols in cols_seq:
         new_col_name = sep.join(cols)
-        df[new_col_name] = df[cols[0]].astype(str).str.cat(
-            [df[col].astype(str) for col in cols[1:]], sep=sep)
+        codes, rep_rows = combine_codes(df, cols)
+        reps = df[list(cols)].iloc[rep_rows]
+        labels = reps[cols[0]].astype(str).str.cat(
+            [reps[col].astype(str) for col in cols[1:]], sep=sep)
+        # Distinct combinations may share a label (ex. with `sep` in values)
+        label_codes, categories = pd.factorize(labels.values)
+        df[new_col_name] = pd.Categorical.from_codes(
+            label_codes[codes], categories=categories)
 
     return df
 
@@ -143,6 +217,7 @@ class InteractionsSource(object):
         load_kwargs: kwargs for `load_fn`
         force_str: if `True`, cast everything to strings
             (to avoid collision of dtypes when expanding vocab)
+            If `False`, user and item ids keep their dtype
         name: name for this object
     """
 
@@ -272,6 +347,10 @@ class TrainDataLoader(object):
         existing_cats_d: Optional dictionary of existing categories
         add_new_cats: if `True`, will append newly seen categories to
             book-keeping dictionary of categories (mutates inplace)
+        hashed_cols: categorical columns that bypass vocab encoding
+            Their codes will be hashes of the raw ids and they will have
+            no categories in `cats_d`
+            (see `EmbeddingMap(hash_buckets_d=...)`)
     """
 
     def __init__(self,
@@ -283,10 +362,12 @@ class TrainDataLoader(object):
                  batch_size: int=128,
                  existing_cats_d: Optional[Dict[str, List[Any]]] = None,
                  add_new_cats: Optional[bool] = False,
+                 hashed_cols: Optional[Iterable[str]] = None,
                  name: Optional[str]=None,
                  ):
         self.name = name or interactions_train.name or ''
         self.batch_size = batch_size
+        self.hashed_cols = list(hashed_cols or [])
         self.activity_col = interactions_train.activity_col
         self.cols = {
             FGroup.USER: interactions_train.user_col,
@@ -309,6 +390,11 @@ class TrainDataLoader(object):
         self.cat_cols = {}
         self.cats_d = existing_cats_d or {}
 
+        for fgroup in [FGroup.USER, FGroup.ITEM]:
+            if self.cols[fgroup] in self.hashed_cols:
+                raise ValueError(f'Primary id `{self.cols[fgroup]}` '
+                                 f'can not be hashed')
+
         self.interactions_df, self.feats_by_group = \
             load_simple(
                 interactions_train,
@@ -317,6 +403,7 @@ class TrainDataLoader(object):
                 existing_cats_d=self.cats_d,
                 add_new_cats=add_new_cats,
                 resolution=resolution,
+                hashed_cols=self.hashed_cols,
             )
 
         for fgroup in [FGroup.USER, FGroup.ITEM]:
@@ -327,6 +414,7 @@ class TrainDataLoader(object):
             if not existing_cats_d:
                 self.cats_d.update({
                     feat_name: feats[FType.CAT][feat_name].cat.categories.tolist()
+                    if feat_name not in self.hashed_cols else []
                     for feat_name in self.cat_cols[fgroup]
                 })
 
@@ -371,11 +459,8 @@ class TrainDataLoader(object):
     def make_feat_codes(self):
         # Convert all categorical cols to corresponding codes
         for fgroup in [FGroup.USER, FGroup.ITEM]:
-            self.feats_codes_df[fgroup] = \
-                self.feats_by_group[fgroup][FType.CAT].copy()
-            for col in self.feats_codes_df[fgroup].columns:
-                self.feats_codes_df[fgroup][col] = \
-                    self.feats_codes_df[fgroup][col].cat.codes
+            self.feats_codes_df[fgroup] = cat_codes_via_df(
+                self.feats_by_group[fgroup][FType.CAT], self.hashed_cols)
 
         if self.context_cat_cols:
             self.feats_codes_df[FGroup.CONTEXT] = \
@@ -400,9 +485,33 @@ class TrainDataLoader(object):
                 self.num_meta[fgroup] = self.num_feats_df[fgroup].shape[1]
 
 
+def cat_codes_via_df(cat_df: pd.DataFrame,
+                     hashed_cols: Optional[Iterable[str]] = None,
+                     ) -> pd.DataFrame:
+    """Converts categorical columns to their codes
+    (hashed columns are converted to their hash codes)
+
+    Args:
+        cat_df: dataframe of categorical features
+        hashed_cols: columns to hash rather than take category codes of
+
+    Returns:
+        Dataframe of codes
+    """
+    hashed_cols = hashed_cols or []
+    codes_df = cat_df.copy()
+    for col in codes_df.columns:
+        if col in hashed_cols:
+            codes_df[col] = hash_codes(codes_df[col].values)
+        else:
+            codes_df[col] = codes_df[col].cat.codes
+    return codes_df
+
+
 def cast_cat(feats_d: Dict[FType, pd.DataFrame],
              existing_cats_d: Optional[Dict[str, Iterable]] = None,
              add_new_cats: Optional[bool] = False,
+             hashed_cols: Optional[Iterable[str]] = None,
              ) -> Dict[FType, pd.DataFrame]:
     """Casts feature columns to categorical
     -- optionally applying existing categories
@@ -411,26 +520,33 @@ def cast_cat(feats_d: Dict[FType, pd.DataFrame],
         feats_d: Dictionary of feature dataframes
         existing_cats_d: Optional dictionary of existing categories.
             Note: these existing categories will be casted to the dtype of
-            the column being casted.
+            the column being casted (or of its categories), ex. the str
+            categories of `load_vocab` to int64 ids
         add_new_cats: if `True`, will append newly seen categories to
             book-keeping dictionary of categories (mutates inplace)
+        hashed_cols: columns to leave as raw ids (to be hashed later)
 
     Returns:
         Modified version of `feats_d`
     """
 
+    hashed_cols = hashed_cols or []
     for col in feats_d[FType.CAT].columns:
+        if col in hashed_cols:
+            continue
         if existing_cats_d and col in existing_cats_d:
+            codes, uniques = codes_via_col(feats_d[FType.CAT][col])
             # Cast existing category to proper dtype (in-place)
-            col_dtype = feats_d[FType.CAT][col].dtype
-            existing_cats_d.update(
-                {col: list(np.array(existing_cats_d[col]).astype(col_dtype))}
-            )
+            existing_cats = pd.Index(existing_cats_d[col])
+            if existing_cats.dtype != uniques.dtype:
+                existing_cats = existing_cats.astype(uniques.dtype)
             if add_new_cats:
-                existing_cats_d[col] += list(
-                    set(feats_d[FType.CAT][col].unique()) -
-                    set(existing_cats_d[col]))
-            existing_cats = existing_cats_d[col]
+                present = np.bincount(codes[codes >= 0],
+                                      minlength=len(uniques)) > 0
+                uniques = uniques[present]
+                existing_cats = existing_cats.append(
+                    uniques[~uniques.isin(existing_cats)])
+            existing_cats_d[col] = existing_cats.tolist()
         else:
             existing_cats = None
         feats_d[FType.CAT][col] = feats_d[FType.CAT][col].astype(
@@ -445,6 +561,7 @@ def load_simple(
         existing_cats_d: Optional[Dict[str, List[Any]]] = None,
         add_new_cats: Optional[bool] = False,
         resolution: Optional[str] = None,
+        hashed_cols: Optional[Iterable[str]] = None,
 ) -> Tuple[pd.DataFrame, Dict[FGroup, Dict[FType, pd.DataFrame]]]:
     """Stand-in loader mostly for local testing
 
@@ -459,6 +576,7 @@ def load_simple(
         add_new_cats: whether to add new categories
         resolution: re-agg to this resolution if provided
                 (will effect one of the group features)
+        hashed_cols: categorical columns to leave as raw ids (to be hashed)
 
     Returns:
         Tuple of preprocessed interactions, user features, and item_features
@@ -522,7 +640,7 @@ def load_simple(
                 feats[FType.CAT].index
 
         # Cast categorical
-        feats = cast_cat(feats, existing_cats_d, add_new_cats)
+        feats = cast_cat(feats, existing_cats_d, add_new_cats, hashed_cols)
 
         existing_fgroup_cats = feats[FType.CAT][col].cat.categories \
             if col in feats[FType.CAT] else None
@@ -549,40 +667,39 @@ def simplifying_assumption(
         ):
     """OUTOFPLACE:
     filtering to make sure we only have known interaction users/items
+
+    Membership is tested once per unique user (item) rather than per
+    interaction, and the rows are selected with a single boolean mask
     """
-    # All interactions have an entry in the feature dfs
-    in_user_feats = interactions_df[user_col].isin(
-        user_feats_d[FType.CAT].index)
-    in_item_feats = interactions_df[item_col].isin(
-        item_feats_d[FType.CAT].index)
-    interactions_df = interactions_df.loc[in_user_feats & in_item_feats]
-    # Same assumption with numerical features
-    if FType.NUM in user_feats_d:
-        in_user_feats = interactions_df[user_col].isin(
-            user_feats_d[FType.NUM].index)
-        interactions_df = interactions_df.loc[in_user_feats]
-    if FType.NUM in item_feats_d:
-        in_item_feats = interactions_df[item_col].isin(
-            item_feats_d[FType.NUM].index)
-        interactions_df = interactions_df.loc[in_item_feats]
+    keep = np.ones(len(interactions_df), dtype=bool)
+    present_d = {}
+    for col, feats_d in [(user_col, user_feats_d), (item_col, item_feats_d)]:
+        codes, uniques = codes_via_col(interactions_df[col])
+        # All interactions have an entry in the feature dfs
+        # Same assumption with numerical features
+        known = uniques.isin(feats_d[FType.CAT].index)
+        if FType.NUM in feats_d:
+            known &= uniques.isin(feats_d[FType.NUM].index)
+        keep &= (codes >= 0) & known[codes]
+        present_d[col] = (codes, uniques)
+    interactions_df = interactions_df.loc[keep]
 
     if prune_features:
         # And some more filtering
         # Get rid of rows in feature df that don't show up in interactions
         # (so we dont have a gazillion things in our vocab)
-        if existing_cats_d and user_col in existing_cats_d:
-            user_filt = list(set(existing_cats_d[user_col])
-                             .union(interactions_df[user_col].unique()))
-        else:
-            user_filt = interactions_df[user_col].unique()
-        if existing_cats_d and item_col in existing_cats_d:
-            item_filt = list(set(existing_cats_d[item_col])
-                             .union(interactions_df[item_col].unique()))
-        else:
-            item_filt = interactions_df[item_col].unique()
-
-        user_feats_d[FType.CAT] = user_feats_d[FType.CAT].loc[user_filt]
-        item_feats_d[FType.CAT] = item_feats_d[FType.CAT].loc[item_filt]
+        for col, feats_d in [(user_col, user_feats_d),
+                             (item_col, item_feats_d)]:
+            codes, uniques = present_d[col]
+            present = np.bincount(codes[keep], minlength=len(uniques)) > 0
+            filt = uniques[present]
+            if existing_cats_d and col in existing_cats_d:
+                existing_cats = pd.Index(existing_cats_d[col])
+                if existing_cats.dtype != filt.dtype:
+                    existing_cats = existing_cats.astype(filt.dtype)
+                filt = filt.append(existing_cats)
+            feats_d[FType.CAT] = feats_d[FType.CAT].loc[
+                feats_d[FType.CAT].index.isin(filt)]
 
     return interactions_df, user_feats_d, item_feats_d,
 
@@ -0,0 +1,72 @@
+"""
+Synthetic interaction sets of configurable size (ex. for benchmarks)
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+
+def make_synthetic(n_users: int = 1000,
+                   n_items: int = 1000,
+                   density: float = 0.01,
+                   n_user_feats: int = 0,
+                   n_item_feats: int = 1,
+                   n_feat_cats: int = 20,
+                   pop_exponent: float = 1.,
+                   test_frac: float = 0.2,
+                   seed: int = 0,
+                   ) -> Dict[str, Optional[pd.DataFrame]]:
+    """Generates random user*item interactions with a power-law item
+    popularity, and random categorical user and item features
+
+    Args:
+        n_users: number of users
+        n_items: number of items
+        density: fraction of the user*item matrix to draw
+            (before de-duplication)
+        n_user_feats: number of categorical user features
+        n_item_feats: number of categorical item features
+        n_feat_cats: number of categories of each feature
+        pop_exponent: exponent of the power-law of item popularity
+            (0 for uniform)
+        test_frac: fraction of interactions held out for the test split
+        seed: seed for random state
+
+    Returns:
+        Dictionary of dataframes:
+            - train, test: interactions with columns `user_id`, `item_id`
+            - user_features: `user_id` and `user_feat{i}` columns
+              (`None` if `n_user_feats` is 0)
+            - item_features: `item_id` and `item_feat{i}` columns
+              (`None` if `n_item_feats` is 0)
+
+    """
+    rand = np.random.RandomState(seed)
+
+    n_xns = max(int(density * n_users * n_items), 1)
+    item_p = 1. / np.arange(1, n_items + 1) ** pop_exponent
+    item_p = item_p[rand.permutation(n_items)] / item_p.sum()
+
+    xn_df = pd.DataFrame({
+        'user_id': rand.randint(n_users, size=n_xns),
+        'item_id': rand.choice(n_items, size=n_xns, p=item_p),
+    }).drop_duplicates().reset_index(drop=True)
+
+    is_test = rand.rand(len(xn_df)) < test_frac
+
+    def feats_df(id_col, n, n_feats):
+        if not n_feats:
+            return None
+        df = pd.DataFrame(
+            rand.randint(n_feat_cats, size=(n, n_feats)),
+            columns=[f'{id_col.split("_")[0]}_feat{i}'
+                     for i in range(n_feats)])
+        df.insert(0, id_col, np.arange(n))
+        return df
+
+    return {
+        'train': xn_df[~is_test].reset_index(drop=True),
+        'test': xn_df[is_test].reset_index(drop=True),
+        'user_features': feats_df('user_id', n_users, n_user_feats),
+        'item_features': feats_df('item_id', n_items, n_item_feats),
+    }
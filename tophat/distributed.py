@@ -0,0 +1,173 @@
+"""
+Data-parallel training across local worker processes against parameter
+server processes (between-graph replication)
+
+Each worker builds its own graph with `make_tasks`, places the variables on
+the parameter servers via `tf.train.replica_device_setter`, and trains on its
+own shard of the sampler. The embedding and bias tables are sharded by row
+across the parameter servers. Local variables (ex. the in-graph feature
+arrays of index feeds) and tower caches stay on the worker.
+
+Example:
+
+    def make_tasks(shard, partitioner):
+        return [FactorizationTaskWrapper(
+            ...,
+            embedding_map_kwargs={'partitioner': partitioner},
+            shard=shard,
+        )]
+
+    if __name__ == '__main__':
+        launch_local(make_tasks, n_workers=2, n_ps=2,
+                     fit_kwargs={'n_epochs': 5})
+
+Note: `make_tasks` must be picklable (ex. a module-level function) since
+processes are spawned
+"""
+import multiprocessing as mp
+import socket
+import time
+import tensorflow as tf
+from contextlib import closing
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+from tophat.core import TophatModel
+from tophat.tasks.wrapper import FactorizationTaskWrapper
+from tophat.utils.log import logger
+
+MakeTasksFn = Callable[[Tuple[int, int], Callable],
+                       List[FactorizationTaskWrapper]]
+
+
+def free_port() -> int:
+    """An available localhost port
+
+    Note: the port is released before it is returned, so another process
+    may bind it before the server does (the server then fails to start,
+    and `launch_local` raises)
+    """
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def local_cluster_spec(n_workers: int, n_ps: int) -> tf.train.ClusterSpec:
+    """Cluster of `n_workers` workers and `n_ps` parameter servers on
+    localhost ports (see the note of `free_port`)
+    """
+    return tf.train.ClusterSpec({
+        'ps': [f'localhost:{free_port()}' for _ in range(n_ps)],
+        'worker': [f'localhost:{free_port()}' for _ in range(n_workers)],
+    })
+
+
+def run_ps(cluster_def: Dict[str, List[str]], task_index: int):
+    """Runs a parameter server (blocks forever)"""
+    server = tf.train.Server(tf.train.ClusterSpec(cluster_def),
+                             job_name='ps', task_index=task_index)
+    server.join()
+
+
+def run_worker(cluster_def: Dict[str, List[str]],
+               task_index: int,
+               make_tasks: MakeTasksFn,
+               fit_kwargs: Optional[Dict[str, Any]] = None,
+               path_checkpoint: Optional[str] = None,
+               ):
+    """Runs a worker: builds its replica of the graph and fits its shard
+
+    Args:
+        cluster_def: cluster specification as a dictionary
+        task_index: index of this worker (worker 0 is the chief)
+        make_tasks: function of (shard index, number of shards) and the
+            table partitioner returning the task wrappers to fit
+        fit_kwargs: kwargs of `TophatModel.fit`
+        path_checkpoint: Optional path for the chief to save the variables
+            to once done
+
+    """
+    cluster_spec = tf.train.ClusterSpec(cluster_def)
+    n_workers = cluster_spec.num_tasks('worker')
+    n_ps = cluster_spec.num_tasks('ps')
+    is_chief = task_index == 0
+
+    server = tf.train.Server(cluster_spec,
+                             job_name='worker', task_index=task_index)
+
+    with tf.device(tf.train.replica_device_setter(
+            worker_device=f'/job:worker/task:{task_index}',
+            cluster=cluster_spec)):
+        tasks = make_tasks((task_index, n_workers),
+                           tf.fixed_size_partitioner(n_ps))
+
+    # The chief initializes the variables, the others wait for it
+    session_manager = tf.train.SessionManager(
+        local_init_op=tf.local_variables_initializer())
+    if is_chief:
+        sess = session_manager.prepare_session(
+            server.target, init_op=tf.global_variables_initializer())
+    else:
+        sess = session_manager.wait_for_session(server.target)
+
+    model = TophatModel(tasks=tasks, sess=sess, init_vars=False)
+    logger.info(f'worker {task_index}/{n_workers}: fitting')
+    model.fit(**(fit_kwargs or {}))
+
+    if is_chief and path_checkpoint:
+        tf.train.Saver(sharded=True).save(sess, path_checkpoint)
+
+
+def launch_local(make_tasks: MakeTasksFn,
+                 n_workers: int = 2,
+                 n_ps: int = 1,
+                 fit_kwargs: Optional[Dict[str, Any]] = None,
+                 path_checkpoint: Optional[str] = None,
+                 poll_secs: float = 1.,
+                 ):
+    """Launches a local cluster in separate processes and fits on every
+    worker. Returns once all workers are done (the parameter servers are then
+    terminated). Raises (and terminates the cluster) as soon as a worker
+    fails or a parameter server stops.
+
+    Args:
+        make_tasks: see `run_worker`
+        n_workers: number of worker processes
+        n_ps: number of parameter server processes
+        fit_kwargs: kwargs of `TophatModel.fit` for each worker
+        path_checkpoint: see `run_worker`
+        poll_secs: interval of checks on the processes
+
+    """
+    cluster_def = local_cluster_spec(n_workers, n_ps).as_dict()
+    ctx = mp.get_context('spawn')
+
+    ps_procs = [ctx.Process(target=run_ps, args=(cluster_def, i))
+                for i in range(n_ps)]
+    worker_procs = [
+        ctx.Process(target=run_worker,
+                    args=(cluster_def, i, make_tasks, fit_kwargs,
+                          path_checkpoint))
+        for i in range(n_workers)]
+
+    for proc in ps_procs + worker_procs:
+        proc.start()
+    try:
+        # A failed process (ex. a server that could not bind its port)
+        # would leave the others waiting on it
+        while any(proc.is_alive() for proc in worker_procs):
+            stopped_ps = [i for i, proc in enumerate(ps_procs)
+                          if not proc.is_alive()]
+            if stopped_ps:
+                raise RuntimeError(f'Parameter servers {stopped_ps} stopped')
+            if any(proc.exitcode for proc in worker_procs):
+                break
+            time.sleep(poll_secs)
+    finally:
+        for proc in ps_procs + worker_procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+    failed = [i for i, proc in enumerate(worker_procs) if proc.exitcode]
+    if failed:
+        raise RuntimeError(f'Workers {failed} failed')
@@ -1,18 +1,21 @@
 import itertools as it
 
-import os
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from tensorflow.contrib.framework import load_embedding_initializer
 from collections import defaultdict
 from tensorflow.contrib.tensorboard.plugins import projector
 from typing import Iterable, Dict, Tuple, Optional, List, Any, Union, Callable
-from tempfile import TemporaryDirectory
+from pathlib import Path
 
-from tophat.constants import FGroup
+from tophat.constants import FGroup, LOOKUP_REG_LOSSES
 from tophat.utils.metadata_proc import write_metadata_emb
-from tophat.utils.io import write_vocab
+from tophat.utils.io import is_binary_vocab, load_binary_vocab, \
+    vocab_remapping
+from tophat.utils.hashing import HASH_SPACE
+from tophat.utils.quantization import (
+    EMB_DTYPES, INT8_MAX, quantize_rows, write_quantized)
+from tophat.utils.log import logger
 
 
 class EmbeddingMap(object):
@@ -30,6 +33,13 @@ class EmbeddingMap(object):
                  init_emb_d: Optional[Dict[str, tf.Tensor]] = None,
                  init_emb_via_vocab: Optional[Dict[str, str]] = None,
                  path_checkpoint: Optional[str] = None,
+                 fused: bool = False,
+                 hash_buckets_d: Optional[Dict[str, int]] = None,
+                 n_hash_fns: int = 1,
+                 emb_dtype: str = 'float32',
+                 embedding_dim_d: Optional[Union[Dict[str, int], str]] = None,
+                 reg_on_lookup: bool = False,
+                 partitioner: Optional[Callable] = None,
                  ):
         """Convenience container for embedding layers
         
@@ -72,11 +82,59 @@ class EmbeddingMap(object):
                 (including scope) with values of paths to existing vocab files.
                 `path_checkpoint` must be provided. Also, `init_emb_d`
                 takes precedence over initializations from this argument.
-                Note: this will require writing vocab files for the new vocab
-                so temporary storage will be used. Also vocabs must match
-                when serialized as str type.
+                Vocabs are matched in-memory (see `VocabRemapper`): text
+                vocabs when serialized as str type, binary vocabs
+                (`.vocab.npy`, see `write_vocab`) in their own dtype.
             path_checkpoint: path of checkpoint (V2) to load from
                 (use in conjunction with `init_emb_via_vocab`)
+            fused: If `True`, pack all features into a single embedding table
+                (and a single bias table) with per-feature row offsets, so
+                that lookups become one gather over offset codes instead of
+                one gather per feature. Per-feature entries of `embeddings_d`
+                and `biases_d` become slices of the fused tables.
+                Initializations (`init_emb_d`, `init_emb_via_vocab`) are
+                resolved per feature and concatenated.
+            hash_buckets_d: Number of hash buckets keyed by feature name.
+                These features bypass vocab encoding: their codes are hashes
+                of the raw ids (see `tophat.utils.hashing.hash_codes`) and
+                their tables have a fixed number of rows regardless of the
+                number of categories, so new ids never require a new graph.
+                Warm-start initializations do not apply to hashed features.
+            n_hash_fns: Number of hash functions for hashed features.
+                If larger than 1, each id is looked up in `n_hash_fns` rows
+                of the shared table which are then averaged
+                (multi-hash embedding -- fewer harmful collisions at the
+                same table size)
+            emb_dtype: Storage dtype of the embedding tables.
+                One of {'float32', 'float16', 'int8'}.
+                Lookups are always cast back to float32.
+                'float16' halves memory and checkpoint size and stays
+                trainable (the optimizer slots are float16 as well, so
+                tasks raise for optimizers whose epsilon underflows, ex.
+                Adam's default, see `tophat.optimizers.check_emb_dtype`).
+                'int8' stores each row with a float32 scale
+                (`embeddings ~= q * scale`) and is not trainable -- intended
+                for serving a trained model (ex. via `init_emb_d`).
+                Biases are always float32.
+            embedding_dim_d: Per-feature sizes of the embedding tables.
+                Either a dictionary keyed by feature name (missing features
+                use `embedding_dim`) or 'auto' to size every table via
+                `adaptive_dims` (by its number of rows).
+                Tables narrower than `embedding_dim` are looked up through a
+                learned `[dim, embedding_dim]` projection so that all looked
+                up embeddings are still of size `embedding_dim` downstream.
+                Not supported with `fused=True`.
+            reg_on_lookup: If `True`, the l1/l2 penalties of the embedding
+                and bias tables are only applied to the rows looked up in the
+                batch (added to the `LOOKUP_REG_LOSSES` collection) instead
+                of the full tables. This keeps the gradients of the tables
+                sparse so that sparse optimizers (ex. 'lazy_adam',
+                'adagrad') only touch the gathered rows. Note that rows are
+                then penalized in proportion to how often they are sampled.
+            partitioner: Optional variable partitioner for the embedding and
+                bias tables (ex. `tf.fixed_size_partitioner(n_ps)` to shard
+                the tables by row across parameter servers -- see
+                `tophat.distributed`). Only float32, non-fused tables.
                 
         """
 
@@ -92,8 +150,36 @@ class EmbeddingMap(object):
         self.l2_emb = l2_emb
         self.reg_emb = tf.contrib.layers.l1_l2_regularizer(
             scale_l1=self.l1_emb, scale_l2=self.l2_emb)
+        # Regularizers of the table variables
+        self.reg_on_lookup = reg_on_lookup
+        self.reg_emb_table = None if reg_on_lookup else self.reg_emb
+        self.reg_bias_table = None if reg_on_lookup else self.reg_bias
 
         self.embedding_dim = embedding_dim
+
+        self.hash_buckets_d = hash_buckets_d or {}
+        self.n_hash_fns = n_hash_fns
+        # Number of rows of each feature's table
+        self.n_rows_d = {
+            feat_name: self.hash_buckets_d.get(feat_name, len(cats))
+            for feat_name, cats in self.cats_d.items()
+        }
+
+        # Size of each feature's table (before projection)
+        if embedding_dim_d == 'auto':
+            embedding_dim_d = adaptive_dims(self.n_rows_d, self.embedding_dim)
+        elif isinstance(embedding_dim_d, str):
+            raise ValueError(f'Unknown embedding_dim_d: {embedding_dim_d}')
+        embedding_dim_d = embedding_dim_d or {}
+        self.embedding_dim_d = {
+            feat_name: embedding_dim_d.get(feat_name, self.embedding_dim)
+            for feat_name in self.cats_d.keys()
+        }
+        if fused and any(dim != self.embedding_dim
+                         for dim in self.embedding_dim_d.values()):
+            raise ValueError(
+                'Fused embedding tables do not support per-feature dims')
+
         # Note: possibly need an emb for NaN code
         #     (can be index 0, and we will always add 1 to our codes)
         #     else, it should map to 0's tensor
@@ -105,107 +191,289 @@ class EmbeddingMap(object):
         else:
             self.feature_weights_d = feature_weights_d
 
-        self.tmp_dir = TemporaryDirectory()
+        self.init_emb_d = init_emb_d
+        self.init_emb_via_vocab = init_emb_via_vocab
+        self.path_checkpoint = path_checkpoint
+        self.remapper = VocabRemapper(path_checkpoint, init_emb_via_vocab) \
+            if init_emb_via_vocab else None
+
+        if emb_dtype not in EMB_DTYPES:
+            raise ValueError(f'Unknown embedding dtype: {emb_dtype}')
+        if partitioner is not None and (fused or emb_dtype != 'float32'):
+            raise ValueError(
+                'Partitioned tables must be float32 and not fused')
+        self.partitioner = partitioner
+        self.emb_dtype = emb_dtype
+        # Per-row scales of int8 tables
+        self.scales_d = {}
+
+        self.fused = fused
+        self.offsets_d = {}
+        self.fused_embeddings = None
+        self.fused_biases = None
+        self.fused_scales = None
+
+        if self.fused:
+            self._make_fused_tables(zero_init_rows)
+        else:
+            self._make_tables(zero_init_rows)
+
+        # Projections of narrow tables to the interaction dimension
+        self.projections_d = {}
+        with tf.variable_scope('projections'):
+            for feat_name, dim in self.embedding_dim_d.items():
+                if dim != self.embedding_dim:
+                    self.projections_d[feat_name] = tf.get_variable(
+                        name=feat_name,
+                        shape=[dim, self.embedding_dim],
+                        initializer=tf.glorot_uniform_initializer(
+                            seed=self.seed),
+                    )
+
+        # TODO: numerical specific factors for user (theta_u)
+        self.vis_emb_user_col = vis_emb_user_col
+        if self.vis_emb_user_col:
+            K2 = self.embedding_dim
+            with tf.variable_scope('visual'):
+                self.user_vis = tf.get_variable(  # vbpr: theta_u
+                    name='user_vis',
+                    # have K' = K (n_visual_factors = n_factors)
+                    shape=[len(self.cats_d[self.vis_emb_user_col]), K2],
+                    initializer=tf.random_normal_initializer(
+                        mean=0., stddev=1. / K2, seed=self.seed),
+                    regularizer=self.reg_emb,
+                )
 
-        # TODO: lots of repeated code coming up
+    def _emb_init(self, feat_name: str):
+        """Resolves the initializer (and shape) of a feature's embeddings
+
+        Returns:
+            Tuple of initializer (or initial value tensor) and shape
+            (`None` if the initializer is already a tensor)
+        """
+        cats = self.cats_d[feat_name]
+        embedding_dim = self.embedding_dim_d[feat_name]
+        tensor_name = f'embeddings/{feat_name}'
+        if feat_name in self.hash_buckets_d:
+            # No vocab to warm-start from
+            emb_init = tf.truncated_normal_initializer(
+                mean=0., stddev=1. / self.embedding_dim,
+                seed=self.seed)
+            shape = [self.n_rows_d[feat_name], embedding_dim]
+        elif self.init_emb_d is not None and feat_name in self.init_emb_d:
+            # Initialize from passed-in weights
+            emb_init = self.init_emb_d[feat_name]
+            assert emb_init.shape == [len(cats), embedding_dim]
+            shape = None
+        elif self.remapper is not None and tensor_name in self.remapper:
+            # Initialize from vocab file
+            emb_init = self.remapper.initializer(
+                tensor_name, feat_name, cats,
+                initializer=tf.truncated_normal_initializer(
+                    mean=0., stddev=1. / self.embedding_dim,
+                    seed=self.seed)
+            )
+            shape = [len(cats), embedding_dim]
+        else:
+            # Nothing to load, just rand initialization
+            emb_init = tf.truncated_normal_initializer(
+                mean=0., stddev=1. / self.embedding_dim,
+                seed=self.seed)
+            shape = [len(cats), embedding_dim]
+        return emb_init, shape
+
+    def _bias_init(self, feat_name: str):
+        """Resolves the initializer (and shape) of a feature's biases
+
+        Returns:
+            Tuple of initializer and shape
+        """
+        cats = self.cats_d[feat_name]
+        tensor_name = f'biases/{feat_name}'
+
+        if feat_name not in self.hash_buckets_d and \
+                self.remapper is not None and tensor_name in self.remapper:
+            # Initialize from vocab file
+            b_init = self.remapper.initializer(
+                tensor_name, feat_name, cats,
+                initializer=tf.zeros_initializer(),
+            )
+        else:
+            b_init = tf.zeros_initializer()
+        return b_init, [self.n_rows_d[feat_name], 1]
+
+    def _make_tables(self, zero_init_rows):
+        """One embedding and one bias variable per feature"""
         with tf.variable_scope('embeddings'):
             self.embeddings_d = {}
 
-            for feat_name, cats in self.cats_d.items():
-                tensor_name = f'embeddings/{feat_name}'
-                if init_emb_d is not None and feat_name in init_emb_d:
-                    # Initialize from passed-in weights
-                    emb_init = init_emb_d[feat_name]
-                    assert emb_init.shape == [len(cats), embedding_dim]
-                    shape = None
-                elif init_emb_via_vocab is not None and \
-                        tensor_name in init_emb_via_vocab:
-                    # Initialize from vocab file
-                    path_vocab = init_emb_via_vocab[tensor_name]
-                    write_vocab(self.tmp_dir.name,
-                                {feat_name: self.cats_d[feat_name]})
-
-                    emb_init = load_embedding_initializer(
-                        path_checkpoint,
-                        tensor_name,
-                        new_vocab_size=len(cats),
-                        embedding_dim=embedding_dim,
-                        old_vocab_file=path_vocab,
-                        new_vocab_file=os.path.join(self.tmp_dir.name,
-                                                    f'{feat_name}.vocab'),
-                        initializer=tf.truncated_normal_initializer(
-                            mean=0., stddev=1. / self.embedding_dim,
-                            seed=self.seed)
-                    )
-                    shape = [len(cats), embedding_dim]
-                else:
-                    # Nothing to load, just rand initialization
-                    emb_init = tf.truncated_normal_initializer(
-                        mean=0., stddev=1. / self.embedding_dim,
-                        seed=self.seed)
-                    shape = [len(cats), embedding_dim]
-                self.embeddings_d[feat_name] = tf.get_variable(
-                    name=feat_name,
-                    shape=shape,
-                    initializer=emb_init,
-                    regularizer=self.reg_emb
-                )
+            for feat_name in self.cats_d.keys():
+                emb_init, shape = self._emb_init(feat_name)
+                emb, scale = self._emb_variable(feat_name, emb_init, shape)
+                self.embeddings_d[feat_name] = emb
+                if scale is not None:
+                    self.scales_d[feat_name] = scale
 
         if zero_init_rows is not None:
             for k, v in zero_init_rows.items():
-                z = np.ones([len(self.cats_d[k]), embedding_dim],
+                z = np.ones([self.n_rows_d[k], self.embedding_dim_d[k]],
                             dtype=np.float32)
                 z[v] = False
-                self.embeddings_d[k] *= tf.constant(z)
+                self.embeddings_d[k] *= tf.constant(
+                    z, dtype=self.embeddings_d[k].dtype.base_dtype)
 
         with tf.variable_scope('biases'):
             self.biases_d = {}
 
-            for feat_name, cats in self.cats_d.items():
-                tensor_name = f'biases/{feat_name}'
-
-                if init_emb_via_vocab is not None and \
-                        tensor_name in init_emb_via_vocab:
-                    # Initialize from vocab file
-                    path_vocab = init_emb_via_vocab[tensor_name]
-
-                    # Old vocab should already be written by embeddings loop
-                    # write_vocab(self.tmp_dir.name,
-                    #             {feat_name: self.cats_d[feat_name]})
-
-                    b_init = load_embedding_initializer(
-                        path_checkpoint,
-                        tensor_name,
-                        new_vocab_size=len(cats),
-                        embedding_dim=1,
-                        old_vocab_file=path_vocab,
-                        new_vocab_file=os.path.join(self.tmp_dir.name,
-                                                    f'{feat_name}.vocab'),
-                        initializer=tf.zeros_initializer(),
-                    )
-                else:
-                    b_init = tf.zeros_initializer()
-
+            for feat_name in self.cats_d.keys():
+                b_init, shape = self._bias_init(feat_name)
                 self.biases_d[feat_name] = tf.get_variable(
                         name=feat_name,
-                        shape=[len(cats), 1],
+                        shape=shape,
                         initializer=b_init,
-                        regularizer=self.reg_bias
+                        regularizer=self.reg_bias_table,
+                        partitioner=self.partitioner,
                     )
 
-        # TODO: numerical specific factors for user (theta_u)
-        self.vis_emb_user_col = vis_emb_user_col
-        if self.vis_emb_user_col:
-            K2 = self.embedding_dim
-            with tf.variable_scope('visual'):
-                self.user_vis = tf.get_variable(  # vbpr: theta_u
-                    name='user_vis',
-                    # have K' = K (n_visual_factors = n_factors)
-                    shape=[len(self.cats_d[self.vis_emb_user_col]), K2],
-                    initializer=tf.random_normal_initializer(
-                        mean=0., stddev=1. / K2, seed=self.seed),
-                    regularizer=self.reg_emb,
-                )
+    def _make_fused_tables(self, zero_init_rows):
+        """A single embedding and a single bias variable for all features
+        Each feature occupies a contiguous block of rows starting at its
+        offset in `self.offsets_d`. The per-feature initializers are resolved
+        as usual and concatenated into the initial value of the fused table.
+        """
+        feat_names = list(self.cats_d.keys())
+        offset = 0
+        for feat_name in feat_names:
+            self.offsets_d[feat_name] = offset
+            offset += self.n_rows_d[feat_name]
+
+        def init_value(init, shape):
+            # Passed-in tensors are already values, initializers are called
+            return init if shape is None else init(shape, dtype=tf.float32)
+
+        with tf.variable_scope('embeddings'):
+            emb_init = tf.concat(
+                [init_value(*self._emb_init(feat_name))
+                 for feat_name in feat_names], axis=0)
+            self.fused_embeddings, self.fused_scales = self._emb_variable(
+                'fused', emb_init, None)
+
+        if zero_init_rows is not None:
+            z = np.ones([offset, int(self.fused_embeddings.get_shape()[-1])],
+                        dtype=np.float32)
+            for k, v in zero_init_rows.items():
+                z[np.asarray(v, dtype=np.int64) + self.offsets_d[k]] = False
+            self.fused_embeddings *= tf.constant(
+                z, dtype=self.fused_embeddings.dtype.base_dtype)
+
+        with tf.variable_scope('biases'):
+            b_init = tf.concat(
+                [init_value(*self._bias_init(feat_name))
+                 for feat_name in feat_names], axis=0)
+            self.fused_biases = tf.get_variable(
+                name='fused',
+                initializer=b_init,
+                regularizer=self.reg_bias_table,
+            )
+
+        # Per-feature views (not variables) for downstream book-keeping
+        self.embeddings_d = {
+            feat_name: self.fused_embeddings[
+                self.offsets_d[feat_name]:
+                self.offsets_d[feat_name] + self.n_rows_d[feat_name]]
+            for feat_name in feat_names}
+        self.biases_d = {
+            feat_name: self.fused_biases[
+                self.offsets_d[feat_name]:
+                self.offsets_d[feat_name] + self.n_rows_d[feat_name]]
+            for feat_name in feat_names}
+        if self.fused_scales is not None:
+            self.scales_d = {
+                feat_name: self.fused_scales[
+                    self.offsets_d[feat_name]:
+                    self.offsets_d[feat_name] + self.n_rows_d[feat_name]]
+                for feat_name in feat_names}
+
+    def _emb_variable(self, name: str, emb_init, shape,
+                      ) -> Tuple[tf.Variable, Optional[tf.Variable]]:
+        """Creates an embedding table in the storage dtype
+
+        Returns:
+            Tuple of the table and its per-row scale
+            (scale is `None` unless `emb_dtype` is 'int8')
+        """
+        if self.emb_dtype == 'float32':
+            if self.partitioner is not None and shape is None:
+                # Partitioned variables need a shape and an initializer
+                shape = emb_init.get_shape().as_list()
+                emb_init = sliced_initializer(emb_init)
+            return tf.get_variable(
+                name=name,
+                shape=shape,
+                initializer=emb_init,
+                regularizer=self.reg_emb_table,
+                partitioner=self.partitioner,
+            ), None
+
+        init_value = emb_init if shape is None \
+            else emb_init(shape, dtype=tf.float32)
+        if self.emb_dtype == 'float16':
+            return tf.get_variable(
+                name=name,
+                initializer=tf.cast(init_value, tf.float16),
+                # Keep the regularization loss in float32
+                regularizer=None if self.reg_on_lookup
+                else lambda w: self.reg_emb(tf.cast(w, tf.float32)),
+            ), None
+
+        # int8: not trainable, dequantized on lookup
+        q, scale = quantize_rows_tf(init_value)
+        emb = tf.get_variable(name=name, initializer=q, trainable=False)
+        emb_scale = tf.get_variable(name=f'{name}_scale', initializer=scale,
+                                    trainable=False)
+        return emb, emb_scale
+
+    def float_embeddings_d(self) -> Dict[str, tf.Tensor]:
+        """Embedding tables as float32 (dequantized if needed)
+        Narrow tables are projected to `embedding_dim`
+        """
+        embs_d = {}
+        for feat_name, emb in self.embeddings_d.items():
+            emb = dequantize(tf.convert_to_tensor(emb),
+                             self.scales_d.get(feat_name, None))
+            if feat_name in self.projections_d:
+                emb = tf.matmul(emb, self.projections_d[feat_name])
+            embs_d[feat_name] = emb
+        return embs_d
+
+    def export_quantized(self, sess: tf.Session,
+                         dir_export: Union[str, Path],
+                         dtype: str = 'int8',
+                         ) -> Dict[str, Path]:
+        """Writes quantized embeddings (and biases) of every feature for
+        serving (see `tophat.utils.quantization.load_quantized`)
+
+        Args:
+            sess: session holding the trained values
+            dir_export: directory to write a `{feat_name}.npz` file per
+                feature to
+            dtype: one of {'float32', 'float16', 'int8'}
+
+        Returns:
+            Dictionary of written paths
+        """
+        dir_export = Path(dir_export)
+        dir_export.mkdir(parents=True, exist_ok=True)
+        embs_d, biases_d = sess.run([
+            self.float_embeddings_d(),
+            {k: tf.convert_to_tensor(v) for k, v in self.biases_d.items()}])
+        paths_d = {}
+        for feat_name, emb in embs_d.items():
+            q, scale = quantize_rows(emb, dtype)
+            paths_d[feat_name] = dir_export / f'{feat_name}.npz'
+            write_quantized(paths_d[feat_name], q, scale,
+                            bias=biases_d[feat_name][:, 0])
+        return paths_d
 
     def look_up(self, input_xn_d, cat_cols: Dict[FGroup, List[str]],
                 ) -> Tuple[Dict[FGroup, Dict[str, tf.Tensor]],  # embs
@@ -223,6 +491,12 @@ class EmbeddingMap(object):
             Tuple of embeddings and biases
         """
 
+        if self.hash_buckets_d:
+            input_xn_d = self.hash_inputs(input_xn_d)
+
+        if self.fused:
+            return self.look_up_fused(input_xn_d, cat_cols)
+
         emb_lookup_d = {}
 
         for fg, cols in cat_cols.items():
@@ -230,6 +504,9 @@ class EmbeddingMap(object):
                 self.embeddings_d, input_xn_d, cols,
                 f'{fg.value}_lookup', name_tmp='{}_emb',
                 feature_weights_d=self.feature_weights_d,
+                scales_d=self.scales_d,
+                projections_d=self.projections_d,
+                reg_fn=self.reg_emb if self.reg_on_lookup else None,
             )
 
         # Pre-squeeze biases from shape `[len(cats), 1]` to `[len(cats)]`
@@ -237,6 +514,53 @@ class EmbeddingMap(object):
             self.biases_d, input_xn_d, it.chain(*cat_cols.values()),
             'bias_lookup', name_tmp='{}_bias',
             feature_weights_d=self.feature_weights_d,
+            reg_fn=self.reg_bias if self.reg_on_lookup else None,
+        ).items()}
+
+        return emb_lookup_d, biases
+
+    def hash_inputs(self, input_xn_d: Dict[str, tf.Tensor],
+                    ) -> Dict[str, tf.Tensor]:
+        """Maps the hash codes of hashed features to rows of their tables
+
+        Returns:
+            Shallow copy of `input_xn_d` with the codes of hashed features
+            replaced by bucket codes
+        """
+        hashed_d = dict(input_xn_d)
+        with tf.name_scope('hash_buckets'):
+            for feat_name, n_buckets in self.hash_buckets_d.items():
+                if feat_name in hashed_d:
+                    hashed_d[feat_name] = bucket_codes(
+                        hashed_d[feat_name], n_buckets,
+                        n_fns=self.n_hash_fns, seed=self.seed)
+        return hashed_d
+
+    def look_up_fused(self, input_xn_d, cat_cols: Dict[FGroup, List[str]],
+                      ) -> Tuple[Dict[FGroup, Dict[str, tf.Tensor]],
+                                 Dict[str, tf.Tensor],
+                                 ]:
+        """Same as `look_up`, but with a single gather on the fused embedding
+        table and a single gather on the fused bias table for all features
+        """
+        all_cols = list(it.chain(*cat_cols.values()))
+
+        embs = fused_lookup_wrapper(
+            self.fused_embeddings, self.offsets_d, input_xn_d, all_cols,
+            'fused_lookup', name_tmp='{}_emb',
+            feature_weights_d=self.feature_weights_d,
+            scales=self.fused_scales,
+            reg_fn=self.reg_emb if self.reg_on_lookup else None,
+        )
+        emb_lookup_d = {fg: {col: embs[col] for col in cols}
+                        for fg, cols in cat_cols.items()}
+
+        # Pre-squeeze biases from shape `[len(cats), 1]` to `[len(cats)]`
+        biases = {k: tf.squeeze(v) for k, v in fused_lookup_wrapper(
+            self.fused_biases, self.offsets_d, input_xn_d, all_cols,
+            'bias_lookup', name_tmp='{}_bias',
+            feature_weights_d=self.feature_weights_d,
+            reg_fn=self.reg_bias if self.reg_on_lookup else None,
         ).items()}
 
         return emb_lookup_d, biases
@@ -248,34 +572,342 @@ def lookup_wrapper(emb_d: Dict[str, tf.Tensor],
                    scope: str, name_tmp: str = '{}',
                    feature_weights_d: Dict[str, float] = None,
                    agg_fn: Callable = tf.reduce_mean,
+                   scales_d: Optional[Dict[str, tf.Tensor]] = None,
+                   projections_d: Optional[Dict[str, tf.Tensor]] = None,
+                   reg_fn: Optional[Callable] = None,
                    ) -> Dict[str, tf.Tensor]:
     """Embedding lookup for each categorical feature
     Can be stacked downstream to yield a tensor
     ie) `tf.stack(list(looked_up.values()), axis=-1)`
+
+    Reduced precision tables are cast to float32 after the gather
+    (and multiplied by their gathered per-row scale if in `scales_d`)
+    Features in `projections_d` are projected after the gather
+    If `reg_fn` is provided, the penalty of the gathered rows is added to
+    the `LOOKUP_REG_LOSSES` collection
     """
     if not cols:
         return {}
+    scales_d = scales_d or {}
+    projections_d = projections_d or {}
     with tf.name_scope(scope):
-        looked_up = {feat_name: tf.nn.embedding_lookup(
-            emb_d[feat_name], input_xn_d[feat_name],
-            name=name_tmp.format(feat_name))
-            for feat_name in cols}
-
-        if feature_weights_d is not None:
-            for feat_name, tensor in looked_up.items():
-                if feat_name in feature_weights_d:
-                    looked_up[feat_name] = tf.multiply(
-                        tensor, feature_weights_d[feat_name],
-                        name=f'{name_tmp.format(feat_name)}_weighted')
-
-        # Aggregate if multiple samples per observation
+        looked_up = {}
+        for feat_name in cols:
+            codes = input_xn_d[feat_name]
+            emb = tf.nn.embedding_lookup(
+                emb_d[feat_name], codes,
+                name=name_tmp.format(feat_name))
+            scale = tf.nn.embedding_lookup(scales_d[feat_name], codes) \
+                if feat_name in scales_d else None
+            looked_up[feat_name] = dequantize(emb, scale)
+            add_lookup_reg(reg_fn, looked_up[feat_name])
+            if feat_name in projections_d:
+                looked_up[feat_name] = tf.tensordot(
+                    looked_up[feat_name], projections_d[feat_name], axes=1,
+                    name=f'{name_tmp.format(feat_name)}_proj')
+
+        looked_up = weight_and_agg(looked_up, name_tmp,
+                                   feature_weights_d, agg_fn)
+
+    return looked_up
+
+
+def fused_lookup_wrapper(table: tf.Tensor,
+                         offsets_d: Dict[str, int],
+                         input_xn_d: Dict[str, tf.Tensor],
+                         cols: Iterable[str],
+                         scope: str, name_tmp: str = '{}',
+                         feature_weights_d: Dict[str, float] = None,
+                         agg_fn: Callable = tf.reduce_mean,
+                         scales: Optional[tf.Tensor] = None,
+                         reg_fn: Optional[Callable] = None,
+                         ) -> Dict[str, tf.Tensor]:
+    """Embedding lookup for many categorical features with a single gather
+    over a fused table (see `EmbeddingMap(fused=True)`)
+
+    The codes of each feature are shifted by the feature's row offset,
+    flattened, and concatenated so that the table is only gathered once.
+    The result is split and reshaped back to the shape of each input.
+    """
+    cols = list(cols)
+    if not cols:
+        return {}
+    with tf.name_scope(scope):
+        codes_l = [input_xn_d[feat_name] + offsets_d[feat_name]
+                   for feat_name in cols]
+        flat_codes_l = [tf.reshape(codes, [-1]) for codes in codes_l]
+        flat_codes = tf.concat(flat_codes_l, axis=0)
+        gathered = tf.nn.embedding_lookup(
+            table, flat_codes, name='fused_gather')
+        gathered = dequantize(
+            gathered, tf.nn.embedding_lookup(scales, flat_codes)
+            if scales is not None else None)
+        add_lookup_reg(reg_fn, gathered)
+        splits = tf.split(
+            gathered, tf.stack([tf.size(c) for c in flat_codes_l]),
+            num=len(cols))
+
+        emb_dim = int(table.get_shape()[-1])
+        looked_up = {}
+        for feat_name, codes, split in zip(cols, codes_l, splits):
+            looked_up[feat_name] = tf.reshape(
+                split, tf.concat([tf.shape(codes), [emb_dim]], axis=0),
+                name=name_tmp.format(feat_name))
+            looked_up[feat_name].set_shape(
+                codes.get_shape().concatenate([emb_dim]))
+
+        looked_up = weight_and_agg(looked_up, name_tmp,
+                                   feature_weights_d, agg_fn)
+
+    return looked_up
+
+
+def sliced_initializer(value: tf.Tensor) -> Callable:
+    """Initializer from an initial value which also works for partitioned
+    variables (each partition gets its own rows of `value`)
+    """
+    def init(shape, dtype=None, partition_info=None):
+        offset = partition_info.var_offset[0] if partition_info else 0
+        return value[offset:offset + shape[0]]
+    return init
+
+
+class VocabRemapper(object):
+    """Warm starts tables from a checkpoint onto new vocabs
+
+    Old and new vocabs are aligned via a hash join (see
+    `tophat.utils.io.vocab_remapping`). The alignment of a feature is
+    computed once and shared by its embeddings and biases, old vocab files
+    are read once, and each checkpointed tensor is read once through a
+    single checkpoint reader (also across the partitions of a variable).
+    Rows not in the old vocab get the usual initializer.
+
+    Args:
+        path_checkpoint: path of checkpoint to load from
+        vocab_paths_d: paths of the old vocab files (text or binary) keyed
+            by tensor name (see `EmbeddingMap`)
+    """
+
+    def __init__(self,
+                 path_checkpoint: str,
+                 vocab_paths_d: Dict[str, str],
+                 ):
+        if path_checkpoint is None:
+            raise ValueError('`path_checkpoint` is required to initialize '
+                             'via vocab')
+        self.path_checkpoint = path_checkpoint
+        self.vocab_paths_d = vocab_paths_d
+        self._reader = None
+        self._old_vocabs_d = {}
+        self._remappings_d = {}
+        # Remapped rows of a tensor until all of its rows are taken
+        self._rows_d = {}
+
+    def __contains__(self, tensor_name: str) -> bool:
+        return tensor_name in self.vocab_paths_d
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = tf.train.NewCheckpointReader(self.path_checkpoint)
+        return self._reader
+
+    def old_vocab(self, path_vocab: str) -> np.array:
+        if path_vocab not in self._old_vocabs_d:
+            if is_binary_vocab(path_vocab):
+                vocab = load_binary_vocab(path_vocab)
+            else:
+                with open(path_vocab, 'r') as f:
+                    vocab = np.array(f.read().splitlines(), dtype=object)
+            self._old_vocabs_d[path_vocab] = vocab
+        return self._old_vocabs_d[path_vocab]
+
+    def remapping(self, tensor_name: str, feat_name: str,
+                  new_cats: List[Any]) -> np.array:
+        """Row of the old vocab for each new category (-1 if new)"""
+        path_vocab = self.vocab_paths_d[tensor_name]
+        key = (path_vocab, feat_name)
+        if key not in self._remappings_d:
+            new_cats = np.asarray(new_cats)
+            if not is_binary_vocab(path_vocab):
+                # Text vocabs match when serialized as str type
+                new_cats = new_cats.astype(str)
+            self._remappings_d[key] = vocab_remapping(
+                self.old_vocab(path_vocab), new_cats)
+        return self._remappings_d[key]
+
+    def take_rows(self, tensor_name: str, remap: np.array,
+                  offset: int, n_rows: int) -> np.array:
+        """Remapped rows `[offset, offset + n_rows)` of a tensor"""
+        if tensor_name not in self._rows_d:
+            old = self.reader.get_tensor(tensor_name)
+            rows = old[np.maximum(remap, 0)].astype(np.float32)
+            self._rows_d[tensor_name] = [rows.reshape([len(remap), -1]), 0]
+        entry = self._rows_d[tensor_name]
+        entry[1] += n_rows
+        rows = entry[0][offset:offset + n_rows]
+        if entry[1] >= len(remap):
+            del self._rows_d[tensor_name]
+        return rows
+
+    def initializer(self, tensor_name: str, feat_name: str,
+                    new_cats: List[Any], initializer: Callable,
+                    ) -> Callable:
+        """Initializer of a table of the new vocab
+        (which also works for partitioned variables)
+
+        Args:
+            tensor_name: name of the tensor in the checkpoint
+            feat_name: name of the feature
+            new_cats: new vocab
+            initializer: initializer of the rows not in the old vocab
+        """
+        remap = self.remapping(tensor_name, feat_name, new_cats)
+
+        def init(shape, dtype=tf.float32, partition_info=None):
+            offset = partition_info.var_offset[0] if partition_info else 0
+            n_rows = shape[0]
+
+            def load_rows():
+                rows = self.take_rows(tensor_name, remap, offset, n_rows)
+                return rows, remap[offset:offset + n_rows] >= 0
+
+            # (host arrays are passed in at initialization, not embedded)
+            loaded, found = tf.py_func(load_rows, [], [tf.float32, tf.bool],
+                                       stateful=True, name='load_rows')
+            loaded.set_shape(shape)
+            found.set_shape(shape[:1])
+            return tf.where(found, tf.cast(loaded, dtype),
+                            initializer(shape, dtype=dtype))
+        return init
+
+
+def add_lookup_reg(reg_fn: Optional[Callable], looked_up: tf.Tensor):
+    """Adds the penalty of looked up rows to `LOOKUP_REG_LOSSES`
+    (no-op if `reg_fn` is `None` or disabled)
+    """
+    if reg_fn is None:
+        return
+    penalty = reg_fn(looked_up)
+    if penalty is not None:
+        tf.add_to_collection(LOOKUP_REG_LOSSES, penalty)
+
+
+def quantize_rows_tf(values: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    """In-graph version of `tophat.utils.quantization.quantize_rows`
+    for int8
+
+    Returns:
+        Tuple of int8 values and float32 per-row scale
+    """
+    scale = tf.reduce_max(tf.abs(values), axis=1, keepdims=True) / INT8_MAX
+    scale = tf.where(scale > 0., scale, tf.ones_like(scale))
+    q = tf.cast(tf.clip_by_value(tf.round(values / scale),
+                                 -INT8_MAX, INT8_MAX), tf.int8)
+    return q, scale
+
+
+def dequantize(emb: tf.Tensor, scale: Optional[tf.Tensor] = None,
+               ) -> tf.Tensor:
+    """Casts (looked up) embeddings to float32 and applies the per-row scale
+    """
+    if emb.dtype.base_dtype != tf.float32:
+        emb = tf.cast(emb, tf.float32)
+    if scale is not None:
+        emb = emb * scale
+    return emb
+
+
+def weight_and_agg(looked_up: Dict[str, tf.Tensor],
+                   name_tmp: str = '{}',
+                   feature_weights_d: Dict[str, float] = None,
+                   agg_fn: Callable = tf.reduce_mean,
+                   ) -> Dict[str, tf.Tensor]:
+    """Applies feature weights and aggregates over multiple samples per
+    observation (ex. many negatives) for looked up embeddings
+    """
+    if feature_weights_d is not None:
         for feat_name, tensor in looked_up.items():
-            if len(tensor.get_shape()) == 3:
-                looked_up[feat_name] = agg_fn(looked_up[feat_name], axis=0)
+            if feat_name in feature_weights_d:
+                looked_up[feat_name] = tf.multiply(
+                    tensor, feature_weights_d[feat_name],
+                    name=f'{name_tmp.format(feat_name)}_weighted')
+
+    # Aggregate if multiple samples per observation
+    for feat_name, tensor in looked_up.items():
+        if len(tensor.get_shape()) == 3:
+            looked_up[feat_name] = agg_fn(looked_up[feat_name], axis=0)
 
     return looked_up
 
 
+def bucket_codes(codes: tf.Tensor,
+                 n_buckets: int,
+                 n_fns: int = 1,
+                 seed: int = 0,
+                 ) -> tf.Tensor:
+    """Maps hash codes to embedding rows with `n_fns` hash functions
+    The first function is a plain modulo, the others are universal hashes
+    `((a * x + b) mod HASH_SPACE) mod n_buckets` with random `a` and `b`
+
+    Args:
+        codes: hash codes (see `hash_codes`)
+        n_buckets: number of rows in the embedding table
+        n_fns: number of hash functions
+            If larger than 1, the results are stacked on a new leading axis
+            (or concatenated on the leading axis if `codes` already has an
+            extra sample dimension) so that the downstream aggregation of
+            samples (`lookup_wrapper`) combines them
+        seed: seed for the hash function parameters
+
+    Returns:
+        Bucket codes
+
+    """
+    rand = np.random.RandomState(seed)
+    codes_64 = tf.cast(codes, tf.int64)
+    buckets_l = [codes_64 % n_buckets]
+    for _ in range(1, n_fns):
+        a = int(rand.randint(1, HASH_SPACE))
+        b = int(rand.randint(0, HASH_SPACE))
+        buckets_l.append(((a * codes_64 + b) % HASH_SPACE) % n_buckets)
+    buckets_l = [tf.cast(buckets, tf.int32) for buckets in buckets_l]
+
+    if n_fns == 1:
+        return buckets_l[0]
+    elif len(codes.get_shape()) > 1:
+        return tf.concat(buckets_l, axis=0)
+    else:
+        return tf.stack(buckets_l, axis=0)
+
+
+def adaptive_dims(n_rows_d: Dict[str, int],
+                  max_dim: int,
+                  min_dim: int = 2,
+                  scale: float = 6.,
+                  ) -> Dict[str, int]:
+    """Sizes embedding tables by their number of rows
+    `dim = scale * n_rows ** 0.25`, clipped to `[min_dim, max_dim]`
+    (ex. a 12-value feature gets 11 dims, a million-value feature gets the
+    full `max_dim`)
+
+    Args:
+        n_rows_d: number of rows (categories or hash buckets) by feature
+        max_dim: upper bound (typically the interaction dim)
+        min_dim: lower bound
+        scale: multiplier of the fourth root of the number of rows
+
+    Returns:
+        Dictionary of embedding dims by feature name
+
+    """
+    return {
+        feat_name: int(np.clip(round(scale * n_rows ** 0.25),
+                               min_dim, max_dim))
+        for feat_name, n_rows in n_rows_d.items()
+    }
+
+
 def inits_via_df(df: pd.DataFrame, cats: List[Any]) -> tf.Tensor:
     """Creates a tensor with initialization constants from a dataframe
     of preloaded weights. The tensor will have the correct shape as dictated
@@ -341,7 +973,15 @@ class EmbeddingProjector(object):
 
         self.projection_config = projector.ProjectorConfig()
         emb_proj_d = {}
+        if embedding_map.fused:
+            # Per-feature slices of a fused table are not checkpointed
+            logger.warning('Embedding projections are not supported for '
+                           'fused embedding tables')
+            return
         for feat_name, emb in embedding_map.embeddings_d.items():
+            if feat_name in embedding_map.hash_buckets_d:
+                # Hash buckets have no labels to project
+                continue
             if feat_name in feat_to_metapath:
                 emb_proj_d[feat_name] = self.projection_config.embeddings.add()
                 emb_proj_d[feat_name].tensor_name = emb.name
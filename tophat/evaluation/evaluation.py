@@ -11,10 +11,12 @@ from typing import Dict, Optional
 
 from tophat.constants import FType, FGroup
 from tophat.data import (load_simple_warm_cats, load_simple,
+                         cat_codes_via_df, codes_via_col,
                          InteractionsSource, FeatureSourceDictType)
 from tophat.evaluation.metrics import make_metrics_ops
 from tophat.evaluation.transport import (
     items_pred_dicter_gen, items_pred_dicter_gen_context)
+from tophat.evaluation.towers import ItemTowerCache
 from tophat.tasks.factorization import FactorizationTask
 from tophat.tasks.wrapper import FactorizationTaskWrapper
 from tophat.utils.log import logger
@@ -37,6 +39,11 @@ class Validator(object):
         n_xns_as_cold: threshold on the number of interactions an items must 
             have less than to be considered a cold item 
             (typically 0, but some literature uses a nonzero value ex.5)
+        use_tower_cache: If `True` and the net has towers
+            (see `BilinearNet.has_towers`), score users against a cached
+            item tower of the catalog (refreshed once the model has trained
+            since the last evaluation, or after a restore or
+            re-initialization of the model)
         seed: seed for random state
     """
 
@@ -46,6 +53,7 @@ class Validator(object):
                  include_cold=True, cold_only=False, n_xns_as_cold=5,
                  features_srcs: Optional[FeatureSourceDictType] = None,
                  specific_feature: Optional[Dict[FGroup, bool]] = None,
+                 use_tower_cache: bool = False,
                  seed: int=0,
                  name: Optional[str] = None,
                  ):
@@ -54,6 +62,8 @@ class Validator(object):
         self.parent_task_wrapper = parent_task_wrapper
         train_data_loader = parent_task_wrapper.data_loader
         self.model_ref: FactorizationTask = None
+        self.use_tower_cache = use_tower_cache
+        self.tower_cache: ItemTowerCache = None
         self.rand = np.random.RandomState(seed)
 
         self.user_col_val = interactions_val_src.user_col
@@ -74,6 +84,7 @@ class Validator(object):
         self.metric_ops_d = None
         self.reset_metrics_op = None
         self.eval_ph_d = None
+        self.local_init_op = None
 
         # Allocate dataset stuff
         self.ds = None
@@ -84,8 +95,8 @@ class Validator(object):
         # it is considered a cold item; otherwise, warm
         train_item_counts = train_data_loader.interactions_df\
             .groupby(train_data_loader.item_col, observed=True).size()
-        warm_items = set(
-            train_item_counts.loc[train_item_counts >= n_xns_as_cold].index)
+        warm_items = train_item_counts.index[
+            train_item_counts.values >= n_xns_as_cold]
 
         if include_cold:
             self.init_cold(train_data_loader, interactions_val_src, warm_items,
@@ -95,9 +106,12 @@ class Validator(object):
         else:
             self.init_warm(train_data_loader, interactions_val_src, warm_items)
 
-        self.user_ids_val = np.array(list(set(
-            self.interactions_df[self.user_col_val]
-        ).intersection(set(self.cat_codes_dfs[FGroup.USER].index))))
+        user_codes, user_ids = codes_via_col(
+            self.interactions_df[self.user_col_val])
+        user_ids = user_ids[np.bincount(
+            user_codes[user_codes >= 0], minlength=len(user_ids)) > 0]
+        self.user_ids_val = np.asarray(user_ids[
+            user_ids.isin(self.cat_codes_dfs[FGroup.USER].index)])
 
         # TODO: could be less sketchy (esp considering the cold stuff above^)
         # self.item_ids = self.cats_d[self.item_col_val].copy()
@@ -152,6 +166,7 @@ class Validator(object):
             features_srcs,
             specific_feature,
             existing_cats_d=self.cats_d,
+            hashed_cols=train_data_loader.hashed_cols,
         )
 
         if cold_only:
@@ -170,9 +185,8 @@ class Validator(object):
         for fgroup, feats_d in feats_by_group.items():
 
             # Prep cat codes
-            cat_code_df = feats_d[FType.CAT].copy()
-            for col in cat_code_df.columns:
-                cat_code_df[col] = cat_code_df[col].cat.codes
+            cat_code_df = cat_codes_via_df(feats_d[FType.CAT],
+                                           train_data_loader.hashed_cols)
 
             # Prep num feats
             # TODO: assuming numerical features aggregated into 1 table for now
@@ -216,12 +230,8 @@ class Validator(object):
         # Get the cold users/items that we need to zero enforce
         self.zero_init_rows = {}
         for col in self.cats_d.keys():
-            new_ids = set(self.cats_d[col]) - set(self.cats_d_orig[col])
-            id_to_ind_d = dict(
-                zip(self.cats_d[col], range(len(self.cats_d[col]))))
-            new_inds = [id_to_ind_d[i] for i in
-                        new_ids]  # TODO: I think this is not optimal
-            self.zero_init_rows[col] = new_inds
+            is_new = ~pd.Index(self.cats_d[col]).isin(self.cats_d_orig[col])
+            self.zero_init_rows[col] = np.flatnonzero(is_new).tolist()
 
     def make_ops(self):
         # Eval ops
@@ -229,16 +239,32 @@ class Validator(object):
         if not self.parent_task_wrapper.built:
             self.parent_task_wrapper.build()
         self.model_ref = self.parent_task_wrapper.task
+        local_var_names = {v.op.name for v in tf.local_variables()}
         with tf.name_scope('placeholders'):
             # TODO: can we just use model.get_fwd_dict? whats with model_ref?
             self.input_fwd_d = self.model_ref.get_fwd_dict(
                 batch_size=len(self.item_ids))
 
+        net = self.model_ref.net
+        if self.use_tower_cache and net.has_towers:
+            item_codes_df = self.cat_codes_dfs[FGroup.ITEM] \
+                .loc[self.item_ids, net.cat_cols[FGroup.ITEM]]
+            self.tower_cache = ItemTowerCache(net, item_codes_df)
+            # Only the user's features are needed
+            self.input_fwd_d = {col: self.input_fwd_d[col]
+                                for col in net.cat_cols[FGroup.USER]}
+
         self.metric_ops_d, self.reset_metrics_op, self.eval_ph_d = \
-            make_metrics_ops(self.model_ref.forward, self.input_fwd_d)
+            make_metrics_ops(self.forward, self.input_fwd_d)
 
         self.init_ds()
 
+        # Only the (metric) local variables of the validator are reset per
+        # run, not the ones of the model (ex. in-graph feature arrays)
+        self.local_init_op = tf.variables_initializer(
+            [v for v in tf.local_variables()
+             if v.op.name not in local_var_names])
+
     def init_ds(self):
         def cur_user_fwd_gen():
             # use the same users in the same order if this gen is called again
@@ -259,7 +285,7 @@ class Validator(object):
                 cur_user_fwd_dict['y_true_ph'] = y_true[None, :]
                 cur_user_fwd_dict['y_true_bool_ph'] = y_true_bool[None, :]
 
-                yield cur_user_fwd_dict
+                yield {k: cur_user_fwd_dict[k] for k in input_and_targ_d}
 
         input_and_targ_d = {
             **self.input_fwd_d, **self.eval_ph_d,
@@ -275,7 +301,16 @@ class Validator(object):
 
         # Remake graph replacing placeholders with ds iterator
         self.metric_ops_d, self.reset_metrics_op, self.eval_ph_d = \
-            make_metrics_ops(self.model_ref.forward, self.input_batch)
+            make_metrics_ops(self.forward, self.input_batch)
+
+    def forward(self, input_fwd_d: Dict[str, tf.Tensor]) -> tf.Tensor:
+        """Scores of all items of the catalog for a user"""
+        if self.tower_cache is None:
+            return self.model_ref.forward(input_fwd_d)
+        # User features are repeated for each item, only one is needed
+        user_input_d = {k: v[:1] for k, v in input_fwd_d.items()
+                        if k in self.model_ref.net.cat_cols[FGroup.USER]}
+        return self.tower_cache.scores(user_input_d)[0]
 
     def run_val(self, sess, summary_writer=None, step=None, macro=False):
         """
@@ -299,8 +334,11 @@ class Validator(object):
         else:
             n_users_eval = min(self.n_users_eval, len(self.user_ids_val))
 
+        if self.tower_cache is not None:
+            self.tower_cache.refresh(sess)
+
         metrics_per_user = defaultdict(lambda: [])
-        sess.run(tf.local_variables_initializer())
+        sess.run(self.local_init_op)
         sess.run(self.input_iter.initializer)
         sess.run(self.reset_metrics_op)
         metric_vals = [np.nan] * len(self.metric_ops_d)  # will overwrite
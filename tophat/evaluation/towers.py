@@ -0,0 +1,172 @@
+"""
+Scoring via cached item towers
+
+For nets whose scores decompose into a user tower and an item tower
+(see `BilinearNet.has_towers`), the item tower of a whole catalog is
+materialized once, and scoring a user against the catalog is a single
+matmul. The cache is refreshed when the model has trained since.
+"""
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from typing import Dict, Optional, Tuple
+
+from tophat.constants import FGroup
+from tophat.nets.bilinear import BilinearNet
+
+# Cache variables are kept out of the global and local collections so that
+# they are neither saved nor reset along with the model's variables
+TOWER_CACHE_VARS = 'tower_cache_variables'
+# The caches of a graph (see `invalidate_tower_caches`)
+TOWER_CACHES = 'tower_caches'
+
+
+def training_steps() -> Optional[tf.Tensor]:
+    """Total number of training steps taken by all tasks (in-graph)
+    (see `FactorizationTask.training`)
+    """
+    step_vars = [v for v in tf.global_variables()
+                 if v.op.name.startswith('global/') and
+                 v.op.name.endswith('_step')]
+    if not step_vars:
+        return None
+    return tf.add_n([tf.to_int64(v) for v in step_vars])
+
+
+class ItemTowerCache(object):
+    """Item tower (vectors and biases) of a catalog, cached in-graph
+
+    Args:
+        net: net to score with (must have towers)
+        item_codes_df: encoded item features of the catalog
+            (the row order is the order of the scores)
+        name: name scope
+    """
+
+    def __init__(self,
+                 net: BilinearNet,
+                 item_codes_df: pd.DataFrame,
+                 name: str = 'item_tower_cache',
+                 ):
+        if not net.has_towers:
+            raise ValueError(f'{net.__class__.__name__} scores do not '
+                             f'decompose into user and item towers')
+        self.net = net
+        self.n_items = len(item_codes_df)
+        item_cols = net.cat_cols[FGroup.ITEM]
+
+        with tf.name_scope(name):
+            self.item_input_d = {
+                col: tf.placeholder(tf.int32, shape=[None],
+                                    name=f'{col}_input')
+                for col in item_cols
+            }
+            self.item_feed = {self.item_input_d[col]:
+                              item_codes_df[col].values
+                              for col in item_cols}
+            item_vec, item_bias = net.tower(FGroup.ITEM, self.item_input_d)
+
+            emb_dim = int(item_vec.get_shape()[-1])
+            # Kept on the device computing the tower (the worker's, rather
+            # than a parameter server's under a `replica_device_setter`)
+            with tf.device(item_vec.device):
+                self.item_vecs = tf.Variable(
+                    tf.zeros([self.n_items, emb_dim]), trainable=False,
+                    name='item_vecs', collections=[TOWER_CACHE_VARS])
+                self.item_biases = tf.Variable(
+                    tf.zeros([self.n_items]), trainable=False,
+                    name='item_biases', collections=[TOWER_CACHE_VARS])
+            self.refresh_op = tf.group(
+                tf.assign(self.item_vecs, item_vec),
+                tf.assign(self.item_biases, item_bias),
+                name='refresh')
+            self.init_op = tf.variables_initializer(
+                [self.item_vecs, self.item_biases])
+
+        self.steps_op = training_steps()
+        self.cached_steps = None
+        self.cached_sess = None
+        tf.add_to_collection(TOWER_CACHES, self)
+
+    def invalidate(self):
+        self.cached_steps = None
+
+    def refresh(self, sess: tf.Session, force: bool = False) -> bool:
+        """Re-computes the item tower if the model has trained since it
+        was last computed (or if `force`)
+
+        Returns:
+            `True` if refreshed
+        """
+        steps = sess.run(self.steps_op) if self.steps_op is not None else 0
+        if (not force and sess is self.cached_sess and
+                self.cached_steps == steps):
+            return False
+        if sess is not self.cached_sess:
+            sess.run(self.init_op)
+        sess.run(self.refresh_op, feed_dict=self.item_feed)
+        self.cached_steps, self.cached_sess = steps, sess
+        return True
+
+    def scores(self, user_input_d: Dict[str, tf.Tensor],
+               item_inds: Optional[tf.Tensor] = None,
+               ) -> tf.Tensor:
+        """Scores of users against the cached items
+        (`refresh` before running)
+
+        Args:
+            user_input_d: encoded user features `[n_users]`
+            item_inds: Optional positions in the catalog to score
+                (all items by default)
+
+        Returns:
+            Scores `[n_users x n_items]`
+        """
+        user_vec, user_bias = self.net.tower(FGroup.USER, user_input_d)
+        item_vecs, item_biases = self.item_vecs, self.item_biases
+        if item_inds is not None:
+            item_vecs = tf.gather(item_vecs, item_inds)
+            item_biases = tf.gather(item_biases, item_inds)
+        return tf.matmul(user_vec, item_vecs, transpose_b=True) + \
+            user_bias[:, None] + item_biases[None, :]
+
+
+def invalidate_tower_caches():
+    """Invalidates every cache of the default graph
+    (to call when the model's variables are set other than by training,
+    ex. on restore or re-initialization)
+    """
+    for cache in tf.get_collection(TOWER_CACHES):
+        cache.invalidate()
+
+
+def make_tower_scorer(net: BilinearNet,
+                      item_codes_df: pd.DataFrame,
+                      ) -> Tuple[ItemTowerCache,
+                                 Dict[str, tf.Tensor],
+                                 tf.Tensor,
+                                 tf.Tensor]:
+    """Cache of a catalog, and the ops to score a user against (a subset
+    of) it
+
+    Returns:
+        Tuple of the cache, user placeholders `[1]`, item position
+        placeholder `[n_scored]`, and scores `[n_scored]`
+    """
+    cache = ItemTowerCache(net, item_codes_df)
+    with tf.name_scope('tower_scores'):
+        user_input_d = {
+            col: tf.placeholder(tf.int32, shape=[1], name=f'{col}_input')
+            for col in net.cat_cols[FGroup.USER]
+        }
+        item_inds = tf.placeholder(tf.int32, shape=[None], name='item_inds')
+        scores = cache.scores(user_input_d, item_inds)[0]
+    return cache, user_input_d, item_inds, scores
+
+
+def catalog_positions(item_codes_df: pd.DataFrame, item_ids) -> np.array:
+    positions = item_codes_df.index.get_indexer(item_ids)
+    if (positions < 0).any():
+        raise KeyError(f'Items not in catalog: '
+                       f'{np.asarray(item_ids)[positions < 0]}')
+    return positions
@@ -1,12 +1,17 @@
+import numpy as np
 import tensorflow as tf
-from typing import Dict, Callable, List
+import itertools as it
+from typing import Dict, Callable, List, Optional, Tuple
 from collections import ChainMap
 
 from tophat.constants import FGroup
 from tophat.embedding import EmbeddingMap
 from tophat.utils.xn_utils import \
-    preset_interactions, kernel_via_xn_sets, muls_via_xn_sets
+    preset_interactions, kernel_via_xn_sets, muls_via_xn_sets, \
+    anova_muls, kernel_via_anova, group_sums
 from tophat.nets.fc import simple_fc
+from tophat.sampling.index_feed import host_array_variable, \
+    num_storage_dtype
 
 
 class BilinearNet(object):
@@ -19,6 +24,15 @@ class BilinearNet(object):
         context_cat_cols: Name of context categorical feature columns
         interaction_type: Type of preset interaction
             One of {'intra', 'inter'}
+        max_order: Max order of interactions
+        factored_kernel: If `True`, compute interactions with the
+            factorization machine kernel (linear in the number of fields,
+            see `tophat.utils.xn_utils.anova_muls`) rather than one node
+            per interaction. For `inter`, the kernel is over the sums of
+            the groups' embeddings (ex. the dot product of the user and item
+            sums, see `tophat.utils.xn_utils.group_sums`).
+            Scores are the same up to float rounding, but the graph differs
+            (opt-in, so that existing graphs are kept by default)
     """
 
     def __init__(self,
@@ -27,6 +41,8 @@ class BilinearNet(object):
                  item_cat_cols: List[str],
                  context_cat_cols: List[str],
                  interaction_type='inter',
+                 max_order: int = 2,
+                 factored_kernel: bool = False,
                  ):
         self.embedding_map = embedding_map
         self.cat_cols = {
@@ -35,8 +51,74 @@ class BilinearNet(object):
             FGroup.CONTEXT: context_cat_cols,
         }
         self.interaction_type = interaction_type
+        self.max_order = max_order
+        self.factored_kernel = factored_kernel
         self.num_meta = {}
 
+    @property
+    def is_factored(self) -> bool:
+        return self.factored_kernel and \
+               self.interaction_type in {'intra', 'inter'}
+
+    def factored_embs(self,
+                      fields_d: Dict[FGroup, List[str]],
+                      emb_d: Dict[str, tf.Tensor],
+                      ) -> List[tf.Tensor]:
+        """Embeddings whose `intra` interactions are the interactions of
+        the fields (the group sums if `inter`)
+        """
+        if self.interaction_type == 'inter':
+            return list(group_sums(fields_d, emb_d).values())
+        return [emb_d[f] for f in it.chain(*fields_d.values())]
+
+    def interaction_kernel(self,
+                           fields_d: Dict[FGroup, List[str]],
+                           emb_d: Dict[str, tf.Tensor],
+                           ) -> tf.Tensor:
+        """Reduced interactions of the fields' embeddings
+        (via the kernel over the group sums if `inter` and factored)
+        """
+        if self.is_factored:
+            return kernel_via_anova(self.factored_embs(fields_d, emb_d),
+                                    self.max_order)
+        interaction_sets = preset_interactions(
+            fields_d, interaction_type=self.interaction_type,
+            max_order=self.max_order)
+        return kernel_via_xn_sets(interaction_sets, emb_d)
+
+    @property
+    def has_towers(self) -> bool:
+        """Whether scores decompose into a user tower and an item tower:
+        `dot(user_vec, item_vec) + user_bias + item_bias`
+        (see `tower`)
+        """
+        return self.interaction_type == 'inter' and self.max_order == 2 \
+            and bool(self.cat_cols[FGroup.USER]) \
+            and bool(self.cat_cols[FGroup.ITEM]) \
+            and not self.cat_cols[FGroup.CONTEXT]
+
+    def tower(self, fg: FGroup, input_d: Dict[str, tf.Tensor],
+              ) -> Tuple[tf.Tensor, tf.Tensor]:
+        """One side of the score (see `has_towers`)
+
+        Args:
+            fg: feature group of the tower (user or item)
+            input_d: Dictionary of feature names to category codes
+                (only the group's features are needed)
+
+        Returns:
+            Tuple of tower vectors `[batch_size x embedding_dim]` and tower
+            biases `[batch_size]`
+
+        """
+        cols = self.cat_cols[fg]
+        with tf.name_scope(f'{fg.value}_tower'):
+            embs_by_group, biases = self.embedding_map.look_up(
+                input_d, {fg: cols})
+            vec = group_sums({fg: cols}, embs_by_group[fg])[fg]
+            bias = tf.reshape(tf.add_n([biases[c] for c in cols]), [-1])
+        return vec, bias
+
     def forward(self, input_xn_d: Dict[str, tf.Tensor]) -> tf.Tensor:
         """Forward inference step to score a user-item interaction
         
@@ -59,11 +141,8 @@ class BilinearNet(object):
             for fg in [FGroup.USER, FGroup.ITEM, FGroup.CONTEXT]
         }
 
-        interaction_sets = preset_interactions(
-            fields_d, interaction_type=self.interaction_type)
-
         with tf.name_scope('interactions'):
-            contrib_dot = kernel_via_xn_sets(interaction_sets, embs_all)
+            contrib_dot = self.interaction_kernel(fields_d, embs_all)
             # bias for cat feature factors
             contrib_bias = tf.add_n(list(biases.values()), name='contrib_bias')
 
@@ -85,6 +164,14 @@ class BilinearNetWithNum(BilinearNet):
             Else, use a modified formulation
         interaction_type: Type of preset interaction
             One of {'intra', 'inter'}
+        max_order: Max order of interactions
+        factored_kernel: see `BilinearNet`
+        num_tables_d: Optional numerical feature matrices keyed by feature
+            name (rows indexed by the codes of `num_index_col`). These are
+            held in-graph and gathered rather than fed, and they allow the
+            net to have towers (see `BilinearNet.has_towers`) so that the
+            projections of a catalog can be cached
+        num_index_col: item feature whose codes index `num_tables_d`
 
     References:
         .. [1] He, Ruining, and Julian McAuley. "VBPR: Visual Bayesian 
@@ -100,15 +187,25 @@ class BilinearNetWithNum(BilinearNet):
                  num_meta: Dict[str, int] = None,
                  l2_vis: float = 0.,
                  ruin: bool = True,
+                 max_order: int = 2,
+                 factored_kernel: bool = False,
+                 num_tables_d: Optional[Dict[str, np.array]] = None,
+                 num_index_col: Optional[str] = None,
                  ):
         BilinearNet.__init__(self, embedding_map,
                              user_cat_cols,
                              item_cat_cols,
                              context_cat_cols,
-                             interaction_type)
+                             interaction_type,
+                             max_order,
+                             factored_kernel)
 
         self.ruin = ruin
         self.num_meta = num_meta or {}
+        if num_tables_d and num_index_col not in item_cat_cols:
+            raise ValueError('`num_index_col` must be an item feature to '
+                             'gather the numerical feature tables by')
+        self.num_index_col = num_index_col
         # Params for numerical features
         # embedding matrix for each numerical feature (fully connected layer)
         self.l2_vis = l2_vis
@@ -152,6 +249,83 @@ class BilinearNetWithNum(BilinearNet):
                         regularizer=self.reg_vis,
                     )
 
+            self.num_tables_d = {}
+            for feat_name, arr in (num_tables_d or {}).items():
+                arr = np.asarray(arr)
+                self.num_tables_d[feat_name] = host_array_variable(
+                    arr.astype(num_storage_dtype(arr)), f'{feat_name}_table')
+
+    def num_input(self, feat_name: str, input_xn_d: Dict[str, tf.Tensor],
+                  ) -> tf.Tensor:
+        """Raw numerical feature (gathered in-graph if in `num_tables_d`)"""
+        if feat_name in self.num_tables_d:
+            return tf.to_float(tf.gather(self.num_tables_d[feat_name],
+                                         input_xn_d[self.num_index_col]),
+                               name=f'{feat_name}_gather')
+        return input_xn_d[feat_name]
+
+    def num_embs(self, input_xn_d: Dict[str, tf.Tensor],
+                 ) -> Dict[str, tf.Tensor]:
+        """Projections of the numerical features (vbpr: theta_i)"""
+        num_emb_d = {}
+        for feat_name in self.num_meta.keys():
+            num_emb_d[feat_name] = tf.matmul(
+                self.num_input(feat_name, input_xn_d),
+                self.W_fc_num_d[feat_name],
+                name='item_vis_emb')
+            if not self.ruin:
+                # fc bias (not in vbpr paper)
+                num_emb_d[feat_name] += self.b_fc_num_d[feat_name]
+        return num_emb_d
+
+    def vis_bias(self, input_xn_d: Dict[str, tf.Tensor]) -> tf.Tensor:
+        """Visual bias (vbpr: beta' * f)"""
+        # NOTE: vbpr paper uses a bias matrix beta that we take a
+        #   dot product with original numerical
+        return tf.add_n(
+            [tf.reduce_sum(
+                tf.multiply(self.num_input(feat_name, input_xn_d),
+                            self.b_num_d[feat_name]),
+                1, keep_dims=False
+            ) for feat_name in self.num_meta.keys()])
+
+    @property
+    def has_towers(self) -> bool:
+        if not self.num_meta:
+            return BilinearNet.has_towers.fget(self)
+        # The catalog's numerical features must be in-graph, and the
+        # visual term needs the user's visual factors
+        return BilinearNet.has_towers.fget(self) and \
+            set(self.num_meta) <= set(self.num_tables_d) and \
+            bool(self.embedding_map.vis_emb_user_col)
+
+    def tower(self, fg: FGroup, input_d: Dict[str, tf.Tensor],
+              ) -> Tuple[tf.Tensor, tf.Tensor]:
+        """One side of the score (see `BilinearNet.tower`)
+        The visual term is appended to the vectors:
+        `[user_vec, theta_u]` and `[item_vec, sum theta_i]`
+        """
+        vec, bias = BilinearNet.tower(self, fg, input_d)
+        if not self.num_meta:
+            return vec, bias
+
+        with tf.name_scope(f'{fg.value}_tower_num'):
+            if fg == FGroup.USER:
+                vis = tf.nn.embedding_lookup(
+                    self.embedding_map.user_vis,
+                    input_d[self.embedding_map.vis_emb_user_col],
+                    name='user_vis_emb')
+            else:
+                vis = tf.add_n(list(self.num_embs(input_d).values()))
+                if not self.ruin:
+                    # Numerical features are also item fields
+                    vec += vis
+                if self.b_num_factor_d:
+                    bias += tf.add_n(list(self.b_num_factor_d.values()))
+                if self.b_num_d:
+                    bias += self.vis_bias(input_d)
+        return tf.concat([vec, vis], 1), bias
+
     def forward(self, input_xn_d: Dict[str, tf.Tensor]) -> tf.Tensor:
         """Forward inference step to score a user-item interaction
         
@@ -184,22 +358,7 @@ class BilinearNetWithNum(BilinearNet):
             item_num_cols = []
         else:
             item_num_cols = list(self.num_meta.keys())
-        if self.ruin:
-            num_emb_d = {
-                feat_name: tf.matmul(  # vbpr: theta_i
-                    input_xn_d[feat_name], self.W_fc_num_d[feat_name],
-                    name='item_vis_emb')
-                # + self.b_fc_num_d[feat_name]  # fc bias (not in vbpr paper)
-                for feat_name in self.num_meta.keys()
-            }
-        else:
-            num_emb_d = {
-                feat_name: tf.matmul(  # vbpr: theta_i
-                    input_xn_d[feat_name], self.W_fc_num_d[feat_name],
-                    name='item_vis_emb')
-                + self.b_fc_num_d[feat_name]  # fc bias (not in vbpr paper)
-                for feat_name in self.num_meta.keys()
-            }
+        num_emb_d = self.num_embs(input_xn_d)
 
         # TODO: temp assume num are item features (not vbpr)
         embs_by_group[FGroup.ITEM].update(num_emb_d)
@@ -213,11 +372,8 @@ class BilinearNetWithNum(BilinearNet):
                 self.cat_cols[FGroup.ITEM] + item_num_cols,
         }
 
-        interaction_sets = preset_interactions(
-            fields_d, interaction_type=self.interaction_type)
-
         with tf.name_scope('interactions'):
-            contrib_dot = kernel_via_xn_sets(interaction_sets, embs_all)
+            contrib_dot = self.interaction_kernel(fields_d, embs_all)
             # bias for cat feature factors
             if len(biases.values()):
                 contrib_bias = tf.add_n(list(biases.values()),
@@ -229,17 +385,9 @@ class BilinearNetWithNum(BilinearNet):
             if self.b_num_factor_d.values():
                 # bias for num feature factors
                 contrib_bias += tf.add_n(list(self.b_num_factor_d.values()))
-            # NOTE: vbpr paper uses a bias matrix beta that we take a
-            #   dot product with original numerical
             if self.b_num_d:
-                contrib_vis_bias = tf.add_n(  # vbpr: beta * f
-                    [tf.reduce_sum(
-                        tf.multiply(input_xn_d[feat_name],
-                                    self.b_num_d[feat_name]),
-                        1, keep_dims=False
-                    ) for feat_name in self.num_meta.keys()],
-                    name='contrib_vis_bias'
-                )
+                contrib_vis_bias = tf.identity(
+                    self.vis_bias(input_xn_d), name='contrib_vis_bias')
             else:
                 contrib_vis_bias = tf.zeros_like(contrib_bias,
                                                  name='contrib_vis_bias')
@@ -276,6 +424,8 @@ class BilinearNetWithNumFC(BilinearNet):
             One of {'intra', 'inter'}
         deep_net_fn: function to create deep portion of network
         deep_reg: regularizer for deep portion of network
+        max_order: Max order of interactions
+        factored_kernel: see `BilinearNet`
 
     References:
         .. [2] He, Xiangnan, et al. "Neural collaborative filtering." 
@@ -297,17 +447,26 @@ class BilinearNetWithNumFC(BilinearNet):
                  num_meta: Dict[str, int] = None,
                  deep_net_fn: Callable = simple_fc,
                  deep_reg=None,
+                 max_order: int = 2,
+                 factored_kernel: bool = False,
                  ):
         BilinearNet.__init__(self, embedding_map,
                              user_cat_cols,
                              item_cat_cols,
                              context_cat_cols,
-                             interaction_type)
+                             interaction_type,
+                             max_order,
+                             factored_kernel)
 
         self.num_meta = num_meta or {}
         self.deep_net_fn = deep_net_fn
         self.deep_reg = deep_reg
 
+    @property
+    def has_towers(self) -> bool:
+        # The deep portion does not decompose
+        return False
+
     def forward(self, input_xn_d: Dict[str, tf.Tensor]) -> tf.Tensor:
         """Forward inference step to score a user-item interaction
         
@@ -336,15 +495,21 @@ class BilinearNetWithNumFC(BilinearNet):
             for fg in [FGroup.USER, FGroup.ITEM, FGroup.CONTEXT]
         }
 
-        interaction_sets = preset_interactions(
-            fields_d, interaction_type=self.interaction_type)
-
         with tf.name_scope('interactions'):
-            xn_muls = muls_via_xn_sets(interaction_sets, embs_all)
+            if self.is_factored:
+                # Bi-Interaction pooling via the factorized identity
+                xn_nodes = list(anova_muls(
+                    self.factored_embs(fields_d, embs_all),
+                    self.max_order).values())
+            else:
+                interaction_sets = preset_interactions(
+                    fields_d, interaction_type=self.interaction_type,
+                    max_order=self.max_order)
+                xn_muls = muls_via_xn_sets(interaction_sets, embs_all)
+                xn_nodes = [node for s, node in xn_muls.items()
+                            if len(s) > 1]
             # Bi-Interaction (actually, we allow for >=2 interactions)
-            f_bi = tf.add_n([node for s, node in xn_muls.items()
-                             if len(s) > 1],
-                            name='f_bi')
+            f_bi = tf.add_n(xn_nodes, name='f_bi')
 
         contrib_deep = tf.identity(
             self.deep_net_fn(f_bi, self.deep_reg, scope_name='deep'),
@@ -0,0 +1,50 @@
+import numpy as np
+import tensorflow as tf
+from functools import partial
+from typing import Union
+
+# Optimizers by name with sensible default learning rates.
+# 'lazy_adam' and 'adagrad' only update the slots (and values) of the rows
+# gathered in the batch, whereas 'adam' decays the slots of every row of an
+# embedding table at every step
+NAMED_OPTIMIZERS = {
+    'adam': partial(tf.train.AdamOptimizer, learning_rate=0.001),
+    'lazy_adam': partial(tf.contrib.opt.LazyAdamOptimizer,
+                         learning_rate=0.001),
+    'adagrad': partial(tf.train.AdagradOptimizer, learning_rate=0.1),
+    'sgd': partial(tf.train.GradientDescentOptimizer, learning_rate=0.1),
+}
+
+
+def get_optimizer(optimizer: Union[str, tf.train.Optimizer],
+                  **kwargs) -> tf.train.Optimizer:
+    """Resolves an optimizer
+
+    Args:
+        optimizer: optimizer object or the name of one in `NAMED_OPTIMIZERS`
+        **kwargs: overrides of the named optimizer's arguments
+            (ex. `learning_rate`)
+
+    Returns:
+        Optimizer object
+
+    """
+    if isinstance(optimizer, str):
+        return NAMED_OPTIMIZERS[optimizer](**kwargs)
+    return optimizer
+
+
+def check_emb_dtype(optimizer: tf.train.Optimizer, emb_dtype: str):
+    """Raises if the optimizer's epsilon underflows in the storage dtype of
+    the embedding tables (their optimizer slots have the same dtype, so
+    ex. Adam's default `epsilon=1e-8` is 0 in float16, and the updates of
+    rows with small second moments blow up to inf/nan)
+    """
+    if emb_dtype != 'float16':
+        return
+    epsilon = getattr(optimizer, '_epsilon', None)
+    if epsilon is not None and epsilon < np.finfo(np.float16).tiny:
+        raise ValueError(
+            f'{optimizer.__class__.__name__} epsilon={epsilon} underflows '
+            f'in float16: raise it (ex. to 1e-4) or use an optimizer '
+            f'without one (ex. Adagrad) for float16 embedding tables')
@@ -0,0 +1,273 @@
+"""
+Pre-materialized cache of sampled training batches
+
+A background writer runs the sampler ahead of training and writes the
+sampled (user, pos, neg) indices of each epoch as TFRecord shards (one
+record per batch). Training streams the shards via `tf.data` with parallel
+interleave, and gathers the features in-graph
+(see `tophat.sampling.index_feed.FeatureGatherer`), so that the trainer
+never waits on python sampling.
+
+Layout of a cache directory:
+    meta.json: sampler settings (and a fingerprint of the interactions)
+        the cache was written with
+    epoch-{e}-shard-{s}.tfrecord: batches of epoch `e`, shard `s`
+"""
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from typing import Dict, Optional, Tuple, Union, Any
+
+from tophat.constants import *
+from tophat.sampling.pair_sampler import PairSampler
+from tophat.utils.log import logger
+
+# Methods whose negatives do not depend on the state of the model
+CACHEABLE_METHODS = {
+    'uniform',
+    'uniform_verified',
+    'uniform_ordinal',
+    'weighted',
+}
+IND_TAGS = [USER_VAR_TAG, POS_VAR_TAG, NEG_VAR_TAG, CONTEXT_VAR_TAG]
+META_FILE = 'meta.json'
+
+
+def shard_path(cache_dir: Union[str, Path], epoch: int, shard: int) -> Path:
+    return Path(cache_dir) / f'epoch-{epoch:04d}-shard-{shard:03d}.tfrecord'
+
+
+def xn_fingerprint(sampler: PairSampler) -> str:
+    """Digest of the sampler's positive interactions (so that a cache is
+    not re-used for different data with the same settings)
+    """
+    pos_xn_coo = sampler.pos_xn_coo
+    digest = hashlib.sha1()
+    for arr, dtype in [(pos_xn_coo.row, np.int64),
+                       (pos_xn_coo.col, np.int64),
+                       (pos_xn_coo.data, np.float64)]:
+        digest.update(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+    return f'{pos_xn_coo.nnz}-{digest.hexdigest()}'
+
+
+def sampler_meta(sampler: PairSampler, n_epochs: int, n_shards: int,
+                 ) -> Dict[str, Any]:
+    return {
+        'method': sampler.method,
+        'batch_size': int(sampler.batch_size),
+        'n_neg': int(sampler.n_neg),
+        'n_users': int(sampler.n_users),
+        'n_items': int(sampler.n_items),
+        'n_epochs': n_epochs,
+        'n_shards': n_shards,
+        'fingerprint': xn_fingerprint(sampler),
+    }
+
+
+def read_meta(cache_dir: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    path = Path(cache_dir) / META_FILE
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def batch_example(inds_d: Dict[str, np.array]) -> tf.train.Example:
+    return tf.train.Example(features=tf.train.Features(feature={
+        tag: tf.train.Feature(int64_list=tf.train.Int64List(
+            value=np.ravel(inds_d[tag]).astype(np.int64)))
+        for tag in IND_TAGS
+    }))
+
+
+class SampleCacheWriter(threading.Thread):
+    """Writes `n_epochs` epochs of sampled indices in the background
+
+    Each shard file is written to a temporary file and renamed once
+    complete, so readers can start on the first epoch while the following
+    ones are still being sampled. An existing cache written with the same
+    settings and interactions is re-used as is.
+
+    An exception raised while writing is kept in `exception` (and re-raised
+    by `check`), so that readers can fail rather than wait on shard files
+    that will never come (see `cached_inds_dataset`)
+
+    Args:
+        sampler: sampler to run (with a method in `CACHEABLE_METHODS`)
+        cache_dir: directory of the cache
+        n_epochs: number of epochs to write
+        n_shards: number of shard files per epoch
+            (the unit of parallelism of the reader)
+    """
+
+    def __init__(self,
+                 sampler: PairSampler,
+                 cache_dir: Union[str, Path],
+                 n_epochs: int = 1,
+                 n_shards: int = 4,
+                 ):
+        super().__init__(name='sample_cache_writer', daemon=True)
+        if sampler.method not in CACHEABLE_METHODS:
+            raise ValueError(
+                f'Sample method {sampler.method} can not be cached '
+                f'(one of {sorted(CACHEABLE_METHODS)})')
+        self.sampler = sampler
+        self.cache_dir = Path(cache_dir)
+        self.n_epochs = n_epochs
+        self.n_shards = n_shards
+        self.meta = sampler_meta(sampler, n_epochs, n_shards)
+        self.exception: Optional[BaseException] = None
+
+        existing_meta = read_meta(self.cache_dir)
+        if existing_meta is not None and existing_meta != self.meta:
+            raise ValueError(
+                f'Existing cache in {self.cache_dir} was written with '
+                f'different settings (or data) {existing_meta}')
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Written atomically, as readers poll for it
+        path_tmp = self.cache_dir / f'{META_FILE}.tmp'
+        with open(path_tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path_tmp, self.cache_dir / META_FILE)
+
+    def run(self):
+        try:
+            self.write()
+        except BaseException as e:
+            self.exception = e
+            logger.error(f'Sample cache writer failed: {e!r}')
+
+    def check(self):
+        """Re-raises the exception of the writer (if it failed)"""
+        if self.exception is not None:
+            raise RuntimeError(
+                f'Sample cache writer of {self.cache_dir} failed'
+            ) from self.exception
+
+    def write(self):
+        tic = time.perf_counter()
+        for epoch, shard in itertools.product(range(self.n_epochs),
+                                              range(self.n_shards)):
+            path = shard_path(self.cache_dir, epoch, shard)
+            if path.exists():
+                continue
+            path_tmp = path.with_suffix('.tmp')
+            with tf.python_io.TFRecordWriter(str(path_tmp)) as writer:
+                for inds_d in self.sampler.iter_inds(shard, self.n_shards,
+                                                     n_epochs=1):
+                    writer.write(batch_example(inds_d).SerializeToString())
+            os.replace(path_tmp, path)
+        logger.info(f'Sample cache of {self.n_epochs} epochs written to '
+                    f'{self.cache_dir} in {time.perf_counter() - tic:.1f}s')
+
+
+def write_sample_cache(sampler: PairSampler,
+                       cache_dir: Union[str, Path],
+                       n_epochs: int = 1,
+                       n_shards: int = 4,
+                       block: bool = False,
+                       ) -> SampleCacheWriter:
+    """Starts (or, if `block`, runs) a `SampleCacheWriter`"""
+    writer = SampleCacheWriter(sampler, cache_dir, n_epochs, n_shards)
+    writer.start()
+    if block:
+        writer.join()
+    return writer
+
+
+def cached_inds_dataset(cache_dir: Union[str, Path],
+                        shard: Optional[Tuple[int, int]] = None,
+                        num_parallel_calls: int = 4,
+                        prefetch: Optional[int] = 10,
+                        poll_secs: float = 0.1,
+                        timeout_secs: float = 600.,
+                        writer: Optional[SampleCacheWriter] = None,
+                        ) -> tf.data.Dataset:
+    """Dataset of the batches of sampled indices of a cache
+    The epochs of the cache are cycled through indefinitely
+
+    Args:
+        cache_dir: directory of the cache
+            (the cache may still be in the making, ex. by another worker)
+        shard: Optional (shard index, number of shards) to only read the
+            shard files of a reader (ex. a hogwild thread)
+        num_parallel_calls: number of shard files read concurrently
+            (and of parallel parse calls)
+        prefetch: number of batches to prefetch
+        poll_secs: interval of polling for files not yet written
+        timeout_secs: time to wait for the cache's `meta.json`, and for
+            each shard file
+        writer: Optional writer of the cache (in this process): if it
+            fails, or stops with shard files missing, reading raises
+            rather than waiting for them
+
+    Returns:
+        Dataset of dictionaries of `int32` indices keyed by tag
+        (see `PairSampler.iter_inds`)
+
+    """
+    deadline = time.time() + timeout_secs
+    meta = read_meta(cache_dir)
+    while meta is None:
+        if time.time() > deadline:
+            raise FileNotFoundError(f'No sample cache in {cache_dir}')
+        time.sleep(poll_secs)
+        meta = read_meta(cache_dir)
+    batch_size, n_neg = meta['batch_size'], meta['n_neg']
+    shard_index, n_readers = shard or (0, 1)
+    file_shards = list(range(meta['n_shards']))[shard_index::n_readers]
+    if not file_shards:
+        raise ValueError(f'Not enough shard files ({meta["n_shards"]}) '
+                         f'for {n_readers} readers')
+
+    def wait_for(path):
+        shard_deadline = time.time() + timeout_secs
+        while not path.exists():
+            if writer is not None:
+                writer.check()
+                # (the writer may have completed the file since polled)
+                if not writer.is_alive() and not path.exists():
+                    raise RuntimeError(f'Sample cache writer stopped '
+                                       f'without writing {path}')
+            if time.time() > shard_deadline:
+                raise TimeoutError(f'Shard {path} not written within '
+                                   f'{timeout_secs}s')
+            time.sleep(poll_secs)
+
+    def gen_paths():
+        for epoch in itertools.cycle(range(meta['n_epochs'])):
+            for s in file_shards:
+                path = shard_path(cache_dir, epoch, s)
+                wait_for(path)
+                yield str(path)
+
+    features = {
+        USER_VAR_TAG: tf.FixedLenFeature([batch_size], tf.int64),
+        POS_VAR_TAG: tf.FixedLenFeature([batch_size], tf.int64),
+        NEG_VAR_TAG: tf.FixedLenFeature([batch_size * n_neg], tf.int64),
+        CONTEXT_VAR_TAG: tf.FixedLenFeature([batch_size], tf.int64),
+    }
+
+    def parse(record):
+        parsed = tf.parse_single_example(record, features)
+        inds_d = {k: tf.cast(v, tf.int32) for k, v in parsed.items()}
+        inds_d[NEG_VAR_TAG] = tf.reshape(inds_d[NEG_VAR_TAG],
+                                         [batch_size, n_neg])
+        return inds_d
+
+    cycle_length = min(num_parallel_calls, len(file_shards))
+    dataset = tf.data.Dataset.from_generator(
+        gen_paths, tf.string, tf.TensorShape([])) \
+        .apply(tf.contrib.data.parallel_interleave(
+            tf.data.TFRecordDataset, cycle_length=cycle_length)) \
+        .map(parse, num_parallel_calls=num_parallel_calls)
+    if prefetch:
+        dataset = dataset.prefetch(prefetch)
+    return dataset
@@ -0,0 +1,154 @@
+"""
+In-graph gathering of features from sampled indices
+
+The feature code (and numerical feature) arrays of the sampler are kept in
+the graph as local variables, so that only indices need to be fed (or read
+from a cache) per batch
+"""
+import numpy as np
+import tensorflow as tf
+from typing import Dict, Tuple
+
+from tophat.constants import *
+from tophat.sampling.pair_sampler import PairSampler
+
+
+def num_storage_dtype(arr: np.array) -> np.dtype:
+    """In-graph storage dtype of a numerical feature table"""
+    return np.float16 if arr.dtype == np.float16 else np.float32
+
+
+def host_array_variable(arr: np.array, name: str) -> tf.Variable:
+    """Non-trainable local variable initialized from a host array
+    The array is passed in at initialization (via `tf.py_func`) rather than
+    embedded as a constant in the graph definition (the `py_func` is
+    stateful, so that it is not constant folded into the graph either)
+    """
+    init = tf.py_func(lambda: arr, [], tf.as_dtype(arr.dtype),
+                      stateful=True, name=f'{name}_init')
+    init.set_shape(arr.shape)
+    # On the device of the initial value: under a
+    # `tf.train.replica_device_setter`, the worker's rather than a
+    # parameter server's (see `tophat.distributed`)
+    with tf.device(init.device):
+        return tf.Variable(init, trainable=False, name=name,
+                           collections=[tf.GraphKeys.LOCAL_VARIABLES])
+
+
+class FeatureGatherer(object):
+    """Maps batches of sampled indices to the task's input in-graph
+
+    Args:
+        sampler: sampler whose feature arrays to gather from
+        input_pair_d: task input (for its keys, dtypes and shapes)
+        name: name scope
+    """
+
+    def __init__(self,
+                 sampler: PairSampler,
+                 input_pair_d: Dict[str, tf.Tensor],
+                 name: str = 'feature_gatherer',
+                 ):
+        self.input_pair_d = input_pair_d
+        self.cols_d = sampler.code_df_cols
+        self.batch_size = sampler.batch_size
+        self.n_neg = sampler.n_neg
+
+        with tf.name_scope(name):
+            self.codes_d = {
+                fg: host_array_variable(arr.astype(np.int32),
+                                        f'{fg.value}_codes')
+                for fg, arr in sampler.feats_codes_arrs.items()
+                if arr is not None
+            }
+            # (half precision tables are kept as is, and cast on gather)
+            self.num_d = {
+                fg: (num_key, host_array_variable(
+                    arr.astype(num_storage_dtype(arr)), f'{fg.value}_num'))
+                for fg, num_key, arr in [
+                    (FGroup.USER, 'user_num_feats',
+                     sampler.user_num_feats_arr),
+                    (FGroup.ITEM, 'item_num_feats',
+                     sampler.item_num_feats_arr),
+                ] if arr is not None
+            }
+
+    def gather_group(self, fg: FGroup, inds: tf.Tensor,
+                     ) -> Dict[str, tf.Tensor]:
+        """Features of a group for a batch of indices
+        (the in-graph version of `feed_via_inds`)
+
+        Args:
+            fg: feature group
+            inds: indices `[batch_size]` or `[batch_size x n_neg]`
+                (then features come out as `[n_neg x batch_size]` like the
+                tiled negative inputs)
+
+        Returns:
+            Dictionary of features keyed by feature name
+        """
+        if fg not in self.codes_d:
+            return {}
+
+        def to_sample_major(t):
+            if len(inds.get_shape()) < 2:
+                return t
+            rank = len(t.get_shape())
+            return tf.transpose(t, [1, 0] + list(range(2, rank)))
+
+        codes = tf.gather(self.codes_d[fg], inds)
+        d = {col: to_sample_major(codes[..., j])
+             for j, col in enumerate(self.cols_d[fg])}
+        if fg in self.num_d:
+            num_key, num_arr = self.num_d[fg]
+            d[num_key] = to_sample_major(tf.gather(num_arr, inds))
+        return d
+
+    def gather(self, inds_d: Dict[str, tf.Tensor]) -> Dict[str, tf.Tensor]:
+        """Task input for a batch of sampled indices
+
+        Args:
+            inds_d: indices keyed by tag (see `PairSampler.iter_inds`)
+                and optionally misc. inputs keyed by their input name
+
+        Returns:
+            Dictionary with the structure of `input_pair_d`
+        """
+        with tf.name_scope('gather_features'):
+            gathered = {}
+            for tag, fg in [(USER_VAR_TAG, FGroup.USER),
+                            (POS_VAR_TAG, FGroup.ITEM),
+                            (NEG_VAR_TAG, FGroup.ITEM),
+                            (CONTEXT_VAR_TAG, FGroup.CONTEXT)]:
+                if tag not in inds_d:
+                    continue
+                for feat_name, t in self.gather_group(
+                        fg, inds_d[tag]).items():
+                    gathered[f'{tag}{TAG_DELIM}{feat_name}'] = t
+
+            input_d = {}
+            for k, ph in self.input_pair_d.items():
+                t = gathered[k] if k in gathered else inds_d[k]
+                t = tf.cast(t, ph.dtype)
+                t.set_shape(ph.get_shape())
+                input_d[k] = t
+
+        return input_d
+
+    def inds_structure(self) -> Tuple[Dict[str, tf.DType],
+                                      Dict[str, tf.TensorShape]]:
+        """Types and shapes of index feeds
+        (see `PairSampler.iter_ind_feeds`)
+        """
+        shapes = {
+            USER_VAR_TAG: tf.TensorShape([self.batch_size]),
+            POS_VAR_TAG: tf.TensorShape([self.batch_size]),
+            NEG_VAR_TAG: tf.TensorShape([self.batch_size, self.n_neg]),
+            CONTEXT_VAR_TAG: tf.TensorShape([self.batch_size]),
+        }
+        types = {k: tf.int64 for k in shapes}
+        for k, v in self.input_pair_d.items():
+            if k.startswith(MISC_TAG):
+                types[k] = v.dtype
+                shapes[k] = v.get_shape()
+        return types, shapes
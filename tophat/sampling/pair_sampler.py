@@ -2,13 +2,15 @@
 Implements a generator for basic uniform random sampling of negative items
 """
 import sys
+import time
 
 import numpy as np
 import pandas as pd
 from pandas.api.types import CategoricalDtype
 import scipy.sparse as sp
 import tensorflow as tf
-from collections import ChainMap
+from collections import ChainMap, defaultdict
+from functools import partial
 from typing import Iterable, Sized, Sequence, Optional
 
 from tophat.constants import *
@@ -173,6 +175,14 @@ class PairSampler(object):
             self.item_num_feats_arr = feats_d_d[FGroup.ITEM][FType.NUM]\
                 .loc[cats_d[item_col]].values
         # TODO: NUM not supported for context right now
+        if input_pair_d is not None:
+            # Numerical features held in-graph by the net are not fed
+            if f'{USER_VAR_TAG}{TAG_DELIM}user_num_feats' \
+                    not in input_pair_d:
+                self.user_num_feats_arr = None
+            if f'{POS_VAR_TAG}{TAG_DELIM}item_num_feats' \
+                    not in input_pair_d:
+                self.item_num_feats_arr = None
 
         self.method = method
         self.get_negs = {
@@ -322,6 +332,10 @@ class PairSampler(object):
 
         self.sess = sess
 
+        # Cumulative time (in seconds) spent in each sampling phase
+        # (see `pop_timings`)
+        self.timings = defaultdict(float)
+
     @classmethod
     def from_data_loader(cls,
                          train_data_loader: TrainDataLoader,
@@ -361,6 +375,35 @@ class PairSampler(object):
     def __iter__(self):
         return self.iter_feed_pairs()
 
+    def pop_timings(self) -> Dict[str, float]:
+        """Cumulative time (in seconds) spent in each phase of sampling
+        since the last call, and the number of batches sampled
+
+        Phases:
+            - sample: sampling of the positive interactions (or users)
+            - negatives: sampling of the negative items
+            - feed_build: gathering the features of the batch into a feed
+        """
+        timings, self.timings = self.timings, defaultdict(float)
+        return dict(timings)
+
+    def shard(self, shard_index: int, n_shards: int,
+              inds_only: bool = False) -> Callable:
+        """Generator function of a single shard of the sampler
+        (ex. for `tf.data.Dataset.from_generator`)
+
+        Args:
+            shard_index: index of the shard
+            n_shards: total number of shards
+            inds_only: If `True`, generate index feeds
+                (see `iter_ind_feeds`) rather than feature feeds
+
+        Returns:
+            Callable returning the shard's generator of feed dicts
+        """
+        gen_fn = self.iter_ind_feeds if inds_only else self.iter_feed_pairs
+        return partial(gen_fn, shard_index, n_shards)
+
     def sample_uniform(self, **_):
         """See :func:`tophat.sampling.uniform.sample_uniform`"""
         return uniform.sample_uniform(self.n_items,
@@ -481,10 +524,72 @@ class PairSampler(object):
                              num_key=None,
                              )
 
-    def iter_feed_pairs(self):
+    def iter_feed_pairs(self, shard_index: int = 0, n_shards: int = 1):
         # The feed dict generator itself
         # Note: can implement __next__ as well
         #   if we want book-keeping state info to be kept
+        for inds_d in self.iter_inds(shard_index, n_shards):
+            tic = time.perf_counter()
+
+            user_feed_d = self.user_feed_via_inds(inds_d[USER_VAR_TAG])
+            pos_item_feed_d = self.item_feed_via_inds(inds_d[POS_VAR_TAG])
+            neg_item_feed_d = self.item_feed_via_inds(inds_d[NEG_VAR_TAG])
+
+            context_feed_d = self.context_feed_via_inds(
+                inds_d[CONTEXT_VAR_TAG])
+
+            feed_pair_dict = feed_via_pair(
+                user_feed_d,
+                pos_item_feed_d, neg_item_feed_d,
+                context_feed_d,
+                misc_feed_d=inds_d[MISC_TAG],
+                input_pair_d=self.input_pair_d_usage,
+            )
+
+            self.timings['feed_build'] += time.perf_counter() - tic
+            yield feed_pair_dict
+
+    def iter_ind_feeds(self, shard_index: int = 0, n_shards: int = 1,
+                       ) -> Iterator[Dict[str, np.array]]:
+        """Generates flat feeds of sampled indices, with misc. feeds keyed
+        by their input name (features are then gathered in-graph, see
+        `tophat.sampling.index_feed.FeatureGatherer`)
+        """
+        for inds_d in self.iter_inds(shard_index, n_shards):
+            misc_feed_d = inds_d.pop(MISC_TAG) or {}
+            for k, v in misc_feed_d.items():
+                inds_d[f'{MISC_TAG}{TAG_DELIM}{k}'] = v
+            yield inds_d
+
+    def iter_inds(self, shard_index: int = 0, n_shards: int = 1,
+                  n_epochs: Optional[int] = None,
+                  ) -> Iterator[Dict[str, Any]]:
+        """Generates batches of sampled indices (rather than features)
+
+        Args:
+            shard_index: index of the shard
+            n_shards: total number of shards
+            n_epochs: Optional number of epochs (overrides `self.n_epochs`)
+
+        Yields:
+            Dictionary of indices keyed by tag:
+                - user: user indices `[batch_size]`
+                - pos: positive item indices `[batch_size]`
+                - neg: negative item indices `[batch_size x n_neg]`
+                - context: interaction (or user) indices `[batch_size]`
+                - misc: Optional dictionary of additional feeds
+
+        """
+
+        # Each shard iterates over its own slice of the positives (or users)
+        # with its own random state so that shards can run concurrently
+        if n_shards > 1:
+            shuffle_inds = self.shuffle_inds[shard_index::n_shards].copy()
+            rand = np.random.RandomState(
+                self.rand.randint(np.iinfo(np.int32).max) + shard_index)
+        else:
+            shuffle_inds = self.shuffle_inds
+            rand = self.rand
 
         cs_l = []
         if self.uniform_users:
@@ -504,12 +609,14 @@ class PairSampler(object):
         else:
             is_pos_weighted = False
 
-        for i in range(self.n_epochs):
+        n_epochs = self.n_epochs if n_epochs is None else n_epochs
+        for i in range(n_epochs):
             if self.shuffle:
-                self.rand.shuffle(self.shuffle_inds)
-            inds_batcher = batcher(self.shuffle_inds, n=self.batch_size)
+                rand.shuffle(shuffle_inds)
+            inds_batcher = batcher(shuffle_inds, n=self.batch_size)
             # inds are either on interaction or user level
             for inds_batch in inds_batcher:
+                tic = time.perf_counter()
 
                 if self.uniform_users:
                     user_inds_batch = inds_batch
@@ -519,10 +626,11 @@ class PairSampler(object):
                         pos_sampler = uniform_users.sample_user_pos
 
                     pos_item_inds_batch = pos_sampler(
-                        user_inds_batch, pos_xn_csr, self.rand, cs_l)
+                        user_inds_batch, pos_xn_csr, rand, cs_l)
                 else:
                     user_inds_batch = self.pos_xn_coo.row[inds_batch]
                     pos_item_inds_batch = self.pos_xn_coo.col[inds_batch]
+                toc_sample = time.perf_counter()
 
                 neg_samp_results = self.get_negs(
                     user_inds_batch=user_inds_batch,
@@ -536,21 +644,18 @@ class PairSampler(object):
                 else:
                     neg_item_inds_batch = neg_samp_results
                     misc_feed_d = None
-
-                user_feed_d = self.user_feed_via_inds(user_inds_batch)
-                pos_item_feed_d = self.item_feed_via_inds(pos_item_inds_batch)
-                neg_item_feed_d = self.item_feed_via_inds(neg_item_inds_batch)
-
-                context_feed_d = self.context_feed_via_inds(inds_batch)
-
-                feed_pair_dict = feed_via_pair(
-                    user_feed_d,
-                    pos_item_feed_d, neg_item_feed_d,
-                    context_feed_d,
-                    misc_feed_d=misc_feed_d,
-                    input_pair_d=self.input_pair_d_usage,
-                )
-                yield feed_pair_dict
+                toc_negatives = time.perf_counter()
+
+                self.timings['sample'] += toc_sample - tic
+                self.timings['negatives'] += toc_negatives - toc_sample
+                self.timings['n_batches'] += 1
+                yield {
+                    USER_VAR_TAG: user_inds_batch,
+                    POS_VAR_TAG: pos_item_inds_batch,
+                    NEG_VAR_TAG: neg_item_inds_batch,
+                    CONTEXT_VAR_TAG: inds_batch,
+                    MISC_TAG: misc_feed_d,
+                }
 
     def fwd_dicter_via_inds(self,
                             user_inds: Union[int, Sequence[int]],
@@ -0,0 +1,212 @@
+"""
+Pair sampling expressed natively in `tf.data`
+
+Shuffling, batching and negative sampling all run as dataset
+transformations (negatives are sampled in a parallel `map`, against the
+non-negative interactions held in-graph as CSR arrays), so that sampling
+neither holds the GIL nor is limited to a single thread like
+`tf.data.Dataset.from_generator`.
+
+The dataset yields batches of indices: the features are gathered in-graph
+(see `tophat.sampling.index_feed.FeatureGatherer`).
+
+Note: the interaction (and CSR) arrays are embedded in the graph as
+constants, which limits this to interaction sets within the 2GB graph
+limit.
+"""
+import sys
+
+import numpy as np
+import tensorflow as tf
+from typing import Optional, Tuple
+
+from tophat.constants import *
+from tophat.sampling.pair_sampler import PairSampler
+
+TF_METHODS = {
+    'uniform',
+    'uniform_verified',
+    'weighted',
+}
+# Autotuned prefetch where available
+PREFETCH_AUTO = getattr(tf.contrib.data, 'AUTOTUNE', 10)
+
+
+def sample_pos_via_csr(user_inds: tf.Tensor,
+                       indptr: tf.Tensor,
+                       indices: tf.Tensor,
+                       ) -> tf.Tensor:
+    """Samples a positive item uniformly from each user's row of a CSR
+    (users are assumed to have at least one positive)
+    """
+    starts = tf.gather(indptr, user_inds)
+    counts = tf.gather(indptr, user_inds + 1) - starts
+    offsets = tf.cast(tf.floor(
+        tf.random_uniform(tf.shape(user_inds), dtype=tf.float64) *
+        tf.cast(counts, tf.float64)), tf.int64)
+    return tf.gather(indices, starts + tf.minimum(offsets, counts - 1))
+
+
+def sample_uniform_verified_tf(user_inds: tf.Tensor,
+                               pos_item_inds: tf.Tensor,
+                               indptr: tf.Tensor,
+                               adj_indices: tf.Tensor,
+                               n_items: int,
+                               n_neg: int,
+                               n_search_iters: int,
+                               ) -> tf.Tensor:
+    """In-graph version of `tophat.sampling.utils.neg_samp_bsearch` over a
+    batch of users
+
+    A raw sample is drawn uniformly from the user's non-positive items
+    count, then shifted by the number of positives at or below it, found by
+    a (vectorized) binary search over the user's adjusted positive indices
+
+    Args:
+        user_inds: users of the batch `[batch_size]`
+        pos_item_inds: positive items of the batch `[batch_size]`
+            (paired with themselves if a user has no negatives available)
+        indptr: CSR index pointers of the non-negatives
+        adj_indices: sorted CSR indices of the non-negatives, minus their
+            position within their row
+        n_items: number of items
+        n_neg: number of negatives per positive
+        n_search_iters: number of binary search iterations
+            (enough for the longest row)
+
+    Returns:
+        Negative items `[batch_size x n_neg]`
+
+    """
+    batch_size = tf.shape(user_inds)[0]
+    starts = tf.tile(tf.gather(indptr, user_inds)[:, None], [1, n_neg])
+    ends = tf.tile(tf.gather(indptr, user_inds + 1)[:, None], [1, n_neg])
+    n_avail = n_items - (ends - starts)
+
+    raw_samp = tf.cast(tf.floor(
+        tf.random_uniform([batch_size, n_neg], dtype=tf.float64) *
+        tf.cast(n_avail, tf.float64)), tf.int64)
+    raw_samp = tf.minimum(raw_samp, tf.maximum(n_avail - 1, 0))
+
+    # Count of adjusted positives <= raw sample, i.e. the upper bound
+    lo, hi = starts, ends
+    max_ind = tf.maximum(tf.size(adj_indices, out_type=tf.int64) - 1, 0)
+    for _ in range(n_search_iters):
+        active = lo < hi
+        mid = (lo + hi) // 2
+        go_right = tf.gather(adj_indices, tf.minimum(mid, max_ind)) \
+            <= raw_samp
+        lo = tf.where(active & go_right, mid + 1, lo)
+        hi = tf.where(active & ~go_right, mid, hi)
+    neg_inds = raw_samp + (lo - starts)
+
+    # No negatives available: pairing the positive with itself
+    pos_tiled = tf.tile(pos_item_inds[:, None], [1, n_neg])
+    return tf.where(n_avail > 0, neg_inds, pos_tiled)
+
+
+def tf_inds_dataset(sampler: PairSampler,
+                    shard: Optional[Tuple[int, int]] = None,
+                    num_parallel_calls: int = 4,
+                    prefetch: Optional[int] = PREFETCH_AUTO,
+                    ) -> tf.data.Dataset:
+    """Dataset of batches of sampled indices
+    (with the same structure as `PairSampler.iter_inds`)
+
+    Each epoch is shuffled and batched on its own, and the partial last
+    batch of an epoch is dropped (batches have a static size). Like the
+    python sampler, the dataset ends after `sampler.n_epochs` epochs
+    (repeats indefinitely if unset)
+
+    Args:
+        sampler: sampler to take the interactions, method and settings of
+        shard: Optional (shard index, number of shards) to only sample a
+            slice of the positives (or users)
+        num_parallel_calls: number of batches sampled in parallel
+        prefetch: number of batches to prefetch (autotuned by default)
+
+    Returns:
+        Dataset of dictionaries of `int64` indices keyed by tag
+
+    """
+    if sampler.method not in TF_METHODS:
+        raise ValueError(f'Sample method {sampler.method} is not available '
+                         f'in-graph (one of {sorted(TF_METHODS)})')
+    if sampler.uniform_users and sampler.pos_xn_coo.dtype != bool:
+        raise ValueError('Weighted positive sampling is not available '
+                         'in-graph')
+
+    batch_size, n_neg, n_items = \
+        sampler.batch_size, sampler.n_neg, sampler.n_items
+    shard_index, n_shards = shard or (0, 1)
+    shuffle_inds = sampler.shuffle_inds[shard_index::n_shards]
+
+    # Host arrays, embedded as constants in the sampling function
+    if sampler.uniform_users:
+        pos_xn_csr = sampler.pos_xn_coo.tocsr()
+        pos_arrs = (pos_xn_csr.indptr, pos_xn_csr.indices)
+    else:
+        pos_arrs = (sampler.pos_xn_coo.row, sampler.pos_xn_coo.col)
+
+    if sampler.method == 'uniform_verified':
+        csr = sampler.non_neg_xn_csr.copy()
+        csr.sum_duplicates()
+        csr.sort_indices()
+        row_lens = np.diff(csr.indptr)
+        # Position of each index within its row
+        row_pos = np.arange(csr.nnz) - np.repeat(csr.indptr[:-1], row_lens)
+        nn_arrs = (csr.indptr, csr.indices - row_pos)
+        n_search_iters = int(np.ceil(
+            np.log2(row_lens.max(initial=0) + 1))) + 1
+    elif sampler.method == 'weighted':
+        neg_logits_arr = np.log(
+            np.asarray(sampler.neg_weights, dtype=np.float64) +
+            np.finfo(np.float64).tiny)[None, :]
+
+    def sample(inds_batch):
+        inds_batch.set_shape([batch_size])
+        pos_a, pos_b = [tf.constant(arr, tf.int64) for arr in pos_arrs]
+        if sampler.uniform_users:
+            user_inds = inds_batch
+            pos_item_inds = sample_pos_via_csr(user_inds, pos_a, pos_b)
+        else:
+            user_inds = tf.gather(pos_a, inds_batch)
+            pos_item_inds = tf.gather(pos_b, inds_batch)
+
+        if sampler.method == 'uniform':
+            neg_item_inds = tf.random_uniform(
+                [batch_size, n_neg], maxval=n_items, dtype=tf.int64)
+        elif sampler.method == 'uniform_verified':
+            nn_indptr, nn_adj_indices = [tf.constant(arr, tf.int64)
+                                         for arr in nn_arrs]
+            neg_item_inds = sample_uniform_verified_tf(
+                user_inds, pos_item_inds, nn_indptr, nn_adj_indices,
+                n_items, n_neg, n_search_iters)
+        else:
+            neg_item_inds = tf.reshape(tf.multinomial(
+                tf.constant(neg_logits_arr, tf.float32),
+                batch_size * n_neg, output_dtype=tf.int64),
+                [batch_size, n_neg])
+
+        return {
+            USER_VAR_TAG: user_inds,
+            POS_VAR_TAG: pos_item_inds,
+            NEG_VAR_TAG: neg_item_inds,
+            CONTEXT_VAR_TAG: inds_batch,
+        }
+
+    dataset = tf.data.Dataset.from_tensor_slices(
+        shuffle_inds.astype(np.int64))
+    if sampler.shuffle:
+        dataset = dataset.shuffle(len(shuffle_inds))
+    # Batching before repeating: batches do not straddle epochs (the
+    # partial last batch of each epoch is dropped)
+    n_epochs = None if sampler.n_epochs == sys.maxsize else sampler.n_epochs
+    dataset = dataset \
+        .batch(batch_size) \
+        .filter(lambda inds: tf.equal(tf.shape(inds)[0], batch_size)) \
+        .repeat(n_epochs) \
+        .map(sample, num_parallel_calls=num_parallel_calls)
+    if prefetch is not None:
+        dataset = dataset.prefetch(prefetch)
+    return dataset
@@ -0,0 +1,148 @@
+"""
+Task schedulers decide which task runs at each step of a multi-task fit
+(see `TophatModel`)
+"""
+import numpy as np
+from typing import Optional, Sequence
+
+
+class TaskScheduler(object):
+    """Base scheduler: weighted random sampling of tasks
+
+    Args:
+        weights: base sampling weights of the tasks
+            (typically proportional to their number of steps per epoch)
+        seed: seed for random state
+            (the global numpy random state is used if `None`)
+    """
+
+    def __init__(self, weights: Sequence[float], seed: Optional[int] = None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.weights /= self.weights.sum()
+        self.n_tasks = len(self.weights)
+        self.rand = np.random.RandomState(seed) if seed is not None \
+            else np.random
+
+        # Book-keeping of the current epoch
+        self.epoch_loss_sums = np.zeros(self.n_tasks)
+        self.epoch_steps = np.zeros(self.n_tasks)
+        self.epoch_durations = np.zeros(self.n_tasks)
+
+    def probs(self) -> np.array:
+        """Sampling probabilities of the tasks for the next epoch"""
+        return self.weights
+
+    def schedule(self, n_steps: int) -> np.array:
+        """Task indices of each step of an epoch"""
+        inds = self.rand.choice(self.n_tasks, n_steps, p=self.probs())
+        self.on_epoch_begin()
+        return inds
+
+    def on_epoch_begin(self):
+        self.epoch_loss_sums[:] = 0.
+        self.epoch_steps[:] = 0.
+        self.epoch_durations[:] = 0.
+
+    def update(self, task_ind: int, loss: float, duration: float,
+               n_steps: int = 1):
+        """Records the outcome of a run of a task
+
+        Args:
+            task_ind: index of the task
+            loss: (mean) loss of the run
+            duration: wall time of the run (in seconds)
+            n_steps: number of optimizer steps in the run
+        """
+        self.epoch_loss_sums[task_ind] += loss * n_steps
+        self.epoch_steps[task_ind] += n_steps
+        self.epoch_durations[task_ind] += duration
+
+    @property
+    def epoch_mean_losses(self) -> np.array:
+        """Mean loss of each task over the current epoch
+        (nan if the task did not run)
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.epoch_loss_sums / self.epoch_steps
+
+
+class RoundRobinScheduler(TaskScheduler):
+    """Cycles through the tasks (ignores weights)"""
+
+    def schedule(self, n_steps: int) -> np.array:
+        self.on_epoch_begin()
+        return np.arange(n_steps) % self.n_tasks
+
+
+class LossImprovementScheduler(TaskScheduler):
+    """Weights tasks by the relative improvement of their loss over the last
+    epoch, so that converged tasks give up their steps to improving ones
+
+    Args:
+        min_share: floor of each task's share of steps
+            (so that a stalled task can still recover)
+    """
+
+    def __init__(self, weights: Sequence[float], seed: Optional[int] = None,
+                 min_share: float = 0.05):
+        super().__init__(weights, seed)
+        self.min_share = min_share
+        self.prev_losses = np.full(self.n_tasks, np.nan)
+        self.improvements = np.ones(self.n_tasks)
+
+    def schedule(self, n_steps: int) -> np.array:
+        losses = self.epoch_mean_losses
+        ran = np.isfinite(losses)
+        compared = ran & np.isfinite(self.prev_losses)
+        self.improvements[compared] = np.maximum(
+            (self.prev_losses[compared] - losses[compared]) /
+            np.abs(self.prev_losses[compared]), 0.)
+        self.prev_losses[ran] = losses[ran]
+        return super().schedule(n_steps)
+
+    def probs(self) -> np.array:
+        p = self.weights * self.improvements
+        p = p / p.sum() if p.sum() > 0 else self.weights
+        p = np.maximum(p, self.min_share)
+        return p / p.sum()
+
+
+class TimeBudgetScheduler(TaskScheduler):
+    """Treats the weights as shares of wall time rather than of steps:
+    the steps of each task are scaled by the inverse of its measured step
+    latency
+
+    Args:
+        momentum: momentum of the moving average of step latencies
+    """
+
+    def __init__(self, weights: Sequence[float], seed: Optional[int] = None,
+                 momentum: float = 0.5):
+        super().__init__(weights, seed)
+        self.momentum = momentum
+        self.latencies = np.full(self.n_tasks, np.nan)
+
+    def schedule(self, n_steps: int) -> np.array:
+        ran = self.epoch_steps > 0
+        latencies = self.epoch_durations[ran] / self.epoch_steps[ran]
+        self.latencies[ran] = np.where(
+            np.isfinite(self.latencies[ran]),
+            self.momentum * self.latencies[ran] +
+            (1 - self.momentum) * latencies,
+            latencies)
+        return super().schedule(n_steps)
+
+    def probs(self) -> np.array:
+        if not np.isfinite(self.latencies).all():
+            # Not all latencies measured yet
+            return self.weights
+        p = self.weights / self.latencies
+        return p / p.sum()
+
+
+NAMED_SCHEDULERS = {
+    'weighted': TaskScheduler,
+    'round_robin': RoundRobinScheduler,
+    'loss_improvement': LossImprovementScheduler,
+    'time_budget': TimeBudgetScheduler,
+}
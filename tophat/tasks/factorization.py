@@ -1,6 +1,7 @@
 import itertools as it
 from tophat.tasks.base import BaseTask
 from tophat import losses
+from tophat.optimizers import check_emb_dtype
 from tophat.nets.bilinear import *
 from tophat.utils.ph_conversions import *
 
@@ -35,8 +36,11 @@ class FactorizationTask(BaseTask):
 
         self.net = net
         self.loss_fn = loss_fn
+        check_emb_dtype(optimizer, net.embedding_map.emb_dtype)
         self.optimizer = optimizer
         self.input_pair_d: Dict[str, tf.Tensor] = None
+        # Name scope of the loss ops (see `get_loss`)
+        self.scope: Optional[str] = None
 
         self.forward = self.net.forward
 
@@ -87,8 +91,12 @@ class FactorizationTask(BaseTask):
                 FType.CAT: self.net.cat_cols[FGroup.ITEM],
                 # TODO: assume for now that all num feats are item-related
                 #   (else, need extra book-keeping)
-                FType.NUM: list(self.net.num_meta.items())
-                if hasattr(self.net, 'num_meta') else [],
+                # (less those held in-graph by the net)
+                FType.NUM: [
+                    (feat_name, dim)
+                    for feat_name, dim in self.net.num_meta.items()
+                    if feat_name not in getattr(self.net, 'num_tables_d', {})
+                ] if hasattr(self.net, 'num_meta') else [],
             },
             context_ftypemeta={
                 FType.CAT: self.net.cat_cols[FGroup.CONTEXT],
@@ -98,13 +106,19 @@ class FactorizationTask(BaseTask):
             extra_dim=extra_dim,
         )
 
-    def get_loss(self) -> tf.Tensor:
+    def get_loss(self, input_pair_d: Optional[Dict[str, tf.Tensor]] = None,
+                 ) -> tf.Tensor:
         """Calculates the pair-loss between a positive and negative interaction
 
+        Args:
+            input_pair_d: Optional input (defaults to `self.input_pair_d`)
+                ex. another batch of the dataset iterator
+
         Returns:
             Loss operation
 
         """
+        input_pair_d = input_pair_d or self.input_pair_d
 
         def input_by_prefix(d, prefixes):
             """Filter input dictionary by prefix condition on key"""
@@ -112,7 +126,7 @@ class FactorizationTask(BaseTask):
                     for k, v in d.items()
                     if k.startswith(tuple(prefixes))}
 
-        with tf.name_scope(f'task_{self.name}'):
+        with tf.name_scope(f'task_{self.name}') as self.scope:
             # Split up input into pos & neg interaction
             shared_prefixes = {
                 USER_VAR_TAG + TAG_DELIM,
@@ -121,8 +135,8 @@ class FactorizationTask(BaseTask):
             pos_prefixes = {POS_VAR_TAG + TAG_DELIM}.union(shared_prefixes)
             neg_prefixes = {NEG_VAR_TAG + TAG_DELIM}.union(shared_prefixes)
 
-            pos_input_d = input_by_prefix(self.input_pair_d, pos_prefixes)
-            neg_input_d = input_by_prefix(self.input_pair_d, neg_prefixes)
+            pos_input_d = input_by_prefix(input_pair_d, pos_prefixes)
+            neg_input_d = input_by_prefix(input_pair_d, neg_prefixes)
 
             with tf.name_scope('positive'):
                 pos_score = tf.identity(self.forward(
@@ -131,7 +145,7 @@ class FactorizationTask(BaseTask):
                 neg_score = tf.identity(self.forward(
                     neg_input_d), name='neg_score')
 
-            first_violation = self.input_pair_d.get(
+            first_violation = input_pair_d.get(
                 f'{MISC_TAG}.first_violator_inds', None)
 
             with tf.name_scope('loss'):
@@ -140,24 +154,39 @@ class FactorizationTask(BaseTask):
                                     first_violation, self.n_items,
                                     )
 
-    def training(self, loss) -> tf.Operation:
+    def training(self, loss, weight: float = 1., summarize: bool = True,
+                 ) -> tf.Operation:
         """Makes the training operation and attaches some summary values
 
         Args:
             loss: Loss operation
+            weight: multiplicative weight of the loss
+                (and of the regularization of the rows it looked up)
+            summarize: flag to attach the summary values
+                (can be turned off for additional training operations of the
+                same task)
 
         Returns:
             Training operation
 
         """
 
-        loss_reg = sum(tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES))
+        loss = weight * loss
+
+        # Penalties of the rows looked up by this task's loss only
+        # (see `EmbeddingMap(reg_on_lookup=True)`)
+        loss_lookup_reg = weight * sum(tf.get_collection(
+            LOOKUP_REG_LOSSES, scope=self.scope))
+
+        loss_reg = sum(tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES)) \
+            + loss_lookup_reg
         loss_tot = loss + loss_reg
 
-        tf.summary.scalar(f'{self.name}/loss', loss)  # loss w/o reg
-        tf.summary.scalar(f'{self.name}/loss_reg', loss_reg)
+        if summarize:
+            tf.summary.scalar(f'{self.name}/loss', loss)  # loss w/o reg
+            tf.summary.scalar(f'{self.name}/loss_reg', loss_reg)
 
-        with tf.variable_scope('global'):
+        with tf.variable_scope('global', reuse=tf.AUTO_REUSE):
             task_step = tf.get_variable(
                 f'{self.name}_step', shape=[], trainable=False,
                 initializer=tf.constant_initializer(0))
@@ -10,8 +10,12 @@ from tophat.embedding import EmbeddingMap
 from tophat.nets.bilinear import BilinearNet
 from tophat.tasks.factorization import FactorizationTask
 from tophat.losses import PairLossFn, NAMED_LOSSES
+from tophat.optimizers import get_optimizer
 from tophat.sampling.pair_sampler import PairSampler
-from typing import Dict, List, Optional, Union
+from tophat.sampling.index_feed import FeatureGatherer
+from tophat.sampling.cache import SampleCacheWriter, cached_inds_dataset
+from tophat.sampling.tf_sampling import tf_inds_dataset
+from typing import Dict, List, Optional, Union, Tuple, Callable
 
 # TODO: having trouble doing proper inheritance with the shady property
 XN_SRC = Union[InteractionsSource, InteractionsDerived]
@@ -32,14 +36,21 @@ class FactorizationTaskWrapper(object):
             context_cols: Optional[List[str]] = None,
             parent_task_wrapper: Optional['FactorizationTaskWrapper'] = None,
             embedding_map_kwargs: Optional = None,
+            factored_kernel: bool = False,
             batch_size: Optional[int] = None,
             task_weight: Optional[float] = 1.,
             sample_uniform_users: bool = False,
             weighted_pos_sampling: bool = False,
             sample_prefetch: Optional[int] = 10,
-            optimizer: Optional[tf.train.Optimizer] =
+            index_feed: bool = False,
+            sample_in_graph: bool = False,
+            sample_cache_dir: Optional[str] = None,
+            sample_cache_epochs: int = 1,
+            sample_cache_shards: int = 4,
+            optimizer: Optional[Union[str, tf.train.Optimizer]] =
             tf.train.AdamOptimizer(learning_rate=0.001),
             build_on_init: Optional[bool] = True,
+            shard: Optional[Tuple[int, int]] = None,
             existing_cats: Optional[Dict[str, List[Any]]] = None,
             add_new_cats: Optional[bool] = False,
             seed: Optional[int] = 322,
@@ -64,6 +75,10 @@ class FactorizationTaskWrapper(object):
                 embedding maps with
             embedding_map_kwargs: kwargs for a new initialization of an
                 embedding_map
+                (features in `hash_buckets_d` will bypass vocab encoding)
+            factored_kernel: If `True`, the net computes interactions with
+                the factorization machine kernel
+                (see `tophat.nets.bilinear.BilinearNet`)
             batch_size: batch size
             task_weight: multiplicative weight to apply to the task's loss
             sample_uniform_users: If `True` sample by user
@@ -72,8 +87,27 @@ class FactorizationTaskWrapper(object):
                 (valid when `sample_uniform_users` is `True`)
             sample_prefetch: number of samples to prefetch in the
                 `tf.data.Dataset.prefetch` transformation
-            optimizer: graph optimizer to use
+            index_feed: If `True`, the sampler only feeds indices, and the
+                features are gathered in-graph
+                (see `tophat.sampling.index_feed`)
+            sample_in_graph: If `True`, sample with a native `tf.data`
+                pipeline (see `tophat.sampling.tf_sampling`) rather than the
+                python sampler. Only for methods in
+                `tophat.sampling.tf_sampling.TF_METHODS`.
+            sample_cache_dir: Optional directory of a pre-materialized cache
+                of sampled indices (see `tophat.sampling.cache`) to train
+                from. The cache is written in the background if missing.
+                Only for methods with fixed negatives (not adaptive).
+            sample_cache_epochs: number of distinct epochs to cache
+                (training cycles through them)
+            sample_cache_shards: number of shard files per cached epoch
+            optimizer: graph optimizer to use (or the name of one in
+                `tophat.optimizers.NAMED_OPTIMIZERS`, ex. 'lazy_adam' which,
+                with `reg_on_lookup` in `embedding_map_kwargs`, makes step
+                time independent of the vocabulary sizes)
             build_on_init: flag to build the graph on object init
+            shard: Optional (shard index, number of shards) to only train on
+                a shard of the sampler (ex. one data-parallel worker)
             existing_cats: existing categories to re-use.
                 The categories from `parent_task_wrapper` take precedence over
                 this argument.
@@ -87,13 +121,19 @@ class FactorizationTaskWrapper(object):
         self.seed = seed
         self.sample_method = sample_method
         self.sample_prefetch = sample_prefetch
+        self.index_feed = index_feed
+        self.sample_in_graph = sample_in_graph
+        self.sample_cache_dir = sample_cache_dir
+        self.sample_cache_epochs = sample_cache_epochs
+        self.sample_cache_shards = sample_cache_shards
+        self.shard = shard
         self.loss_fn = NAMED_LOSSES[loss_fn] if isinstance(loss_fn, str) \
             else loss_fn
         self.sample_uniform_users = sample_uniform_users
         self.weighted_pos_sampling = weighted_pos_sampling
         self.batch_size = batch_size
         self.task_weight = task_weight
-        self.optimizer = optimizer
+        self.optimizer = get_optimizer(optimizer)
 
         self.parent_task_wrapper = parent_task_wrapper
 
@@ -104,6 +144,12 @@ class FactorizationTaskWrapper(object):
         else:
             existing_cats_d = None
 
+        # Hashed features must be consistent with the shared embedding map
+        embedding_map_kwargs_ref = parent_task_wrapper.embedding_map_kwargs \
+            if parent_task_wrapper else embedding_map_kwargs
+        hashed_cols = list(
+            (embedding_map_kwargs_ref or {}).get('hash_buckets_d', {}))
+
         self.data_loader = TrainDataLoader(
             interactions_train=interactions,
             group_features=group_features,
@@ -113,20 +159,30 @@ class FactorizationTaskWrapper(object):
             batch_size=batch_size,
             existing_cats_d=existing_cats_d,
             add_new_cats=add_new_cats,
+            hashed_cols=hashed_cols,
         )
 
         # Attributes used when building the graph
         self.embedding_map_kwargs = embedding_map_kwargs
+        self.factored_kernel = factored_kernel
         self.embedding_map: EmbeddingMap = None
         self.net: BilinearNet = None
         self.task: FactorizationTask = None
         self.nonnegs: Optional[XN_SRC] = nonnegs
         self.neg_weights = neg_weights
         self.sampler: PairSampler = None
+        self.cache_writer: SampleCacheWriter = None
+        self.gatherer: FeatureGatherer = None
         self.dataset: tf.data.Dataset = None
+        self.iterator: tf.data.Iterator = None
         self.input_pair_d_via_iter: Iterator = None
         self.loss: tf.Tensor = None
         self.train_op: tf.Operation = None
+        # Multi-step training operations keyed by number of steps
+        self.multi_step_ops_d: Dict[int, Tuple[tf.Tensor, tf.Operation]] = {}
+        # Training operations of each sampler shard keyed by number of shards
+        self.shard_ops_d: Dict[
+            int, List[Tuple[tf.Tensor, tf.Operation]]] = {}
 
         self.built = False
         if build_on_init:
@@ -156,6 +212,7 @@ class FactorizationTaskWrapper(object):
             user_cat_cols=self.data_loader.user_cat_cols,
             item_cat_cols=self.data_loader.item_cat_cols,
             context_cat_cols=self.data_loader.context_cat_cols,
+            factored_kernel=self.factored_kernel,
         )
 
         self.task = FactorizationTask(
@@ -193,33 +250,158 @@ class FactorizationTaskWrapper(object):
                     self.task.input_pair_d[k] = tf.tile(
                         tf.expand_dims(v, 0), [self.sampler.n_neg, 1])
 
-        self.dataset = tf.data.Dataset.from_generator(
-            self.sampler.__iter__,
-            {k: v.dtype for k, v in self.task.input_pair_d.items()},
-            {k: v.shape for k, v in self.task.input_pair_d.items()},) \
-            .prefetch(self.sample_prefetch)
+        if self.index_feed or self.sample_in_graph or self.sample_cache_dir:
+            self.gatherer = FeatureGatherer(self.sampler,
+                                            self.task.input_pair_d)
+        if self.sample_cache_dir:
+            # Only the first worker writes a shared cache
+            if not self.shard or self.shard[0] == 0:
+                self.cache_writer = SampleCacheWriter(
+                    self.sampler, self.sample_cache_dir,
+                    n_epochs=self.sample_cache_epochs,
+                    n_shards=self.sample_cache_shards,
+                )
+                self.cache_writer.start()
+
+        self.dataset = self.make_input_dataset(self.shard)
 
-        self.input_pair_d_via_iter = self.dataset.make_one_shot_iterator() \
-            .get_next()
+        self.iterator = self.dataset.make_one_shot_iterator()
+        self.input_pair_d_via_iter = self.input_via_iterator(self.iterator)
 
         # Change out our legacy placeholders with this dataset iter
         self.task.input_pair_d = self.input_pair_d_via_iter
 
         # Get our training operations
         self.loss = self.task.get_loss()
-        self.train_op = self.task.training(self.loss * self.task_weight)
+        self.train_op = self.task.training(self.loss, self.task_weight)
 
         self.built = True
 
+    def make_dataset(self, generator: Callable) -> tf.data.Dataset:
+        """Dataset of feed dicts generated by `generator`
+        (with the structure of the task's input)
+        """
+        return tf.data.Dataset.from_generator(
+            generator,
+            {k: v.dtype for k, v in self.task.input_pair_d.items()},
+            {k: v.shape for k, v in self.task.input_pair_d.items()},) \
+            .prefetch(self.sample_prefetch)
+
+    def make_input_dataset(self, shard: Optional[Tuple[int, int]] = None,
+                           ) -> tf.data.Dataset:
+        """Dataset of the task's training input (of a shard if provided)
+        Batches of index feeds (or of the sample cache, or sampled in-graph)
+        are indices, see
+        `input_via_iterator`
+        """
+        if self.sample_cache_dir:
+            return cached_inds_dataset(self.sample_cache_dir, shard=shard,
+                                       prefetch=self.sample_prefetch,
+                                       writer=self.cache_writer)
+        if self.sample_in_graph:
+            return tf_inds_dataset(self.sampler, shard=shard)
+        if self.index_feed:
+            return tf.data.Dataset.from_generator(
+                self.sampler.shard(*shard, inds_only=True) if shard
+                else self.sampler.iter_ind_feeds,
+                *self.gatherer.inds_structure()) \
+                .prefetch(self.sample_prefetch)
+        return self.make_dataset(
+            self.sampler.shard(*shard) if shard else self.sampler.__iter__)
+
+    def input_via_iterator(self, iterator: tf.data.Iterator,
+                           ) -> Dict[str, tf.Tensor]:
+        """Next batch of the task's input from a dataset iterator
+        (features are gathered in-graph if the dataset is of indices)
+        """
+        next_el = iterator.get_next()
+        if self.gatherer is not None:
+            return self.gatherer.gather(next_el)
+        return next_el
+
+    def shard_ops(self, n_shards: int,
+                  ) -> List[Tuple[tf.Tensor, tf.Operation]]:
+        """Training operations for concurrent trainers
+        (see `TophatModel.fit_hogwild`)
+
+        Each shard gets its own dataset over its own slice of the sampler,
+        and its own loss and training operation. All shards update the same
+        variables without locking.
+
+        Args:
+            n_shards: number of shards
+
+        Returns:
+            List of loss and training operation for each shard
+
+        """
+        if n_shards not in self.shard_ops_d:
+            ops_l = []
+            for shard_index in range(n_shards):
+                dataset = self.make_input_dataset((shard_index, n_shards))
+                input_pair_d = self.input_via_iterator(
+                    dataset.make_one_shot_iterator())
+                loss = self.task.get_loss(input_pair_d)
+                train_op = self.task.training(loss, self.task_weight,
+                                              summarize=False)
+                ops_l.append((loss, train_op))
+            self.shard_ops_d[n_shards] = ops_l
+
+        return self.shard_ops_d[n_shards]
+
+    def multi_step_ops(self, n_steps: int,
+                       ) -> Tuple[tf.Tensor, tf.Operation]:
+        """Training operations which run `n_steps` optimizer steps in a
+        single session call
+
+        The steps run sequentially in a `tf.while_loop`: each step pulls
+        its own batch from the dataset iterator, and the next step (with
+        all of its variable reads) only starts once the previous step's
+        update has been applied, as with `n_steps` separate runs. The
+        variables (and optimizer slots) of the single step training
+        operation are shared.
+
+        Args:
+            n_steps: number of optimizer steps per run
+
+        Returns:
+            Tuple of the mean loss over the steps, and the training operation
+
+        """
+        if n_steps not in self.multi_step_ops_d:
+            # (`get_loss` sets the task's scope to the loop's)
+            task_scope = self.task.scope
+
+            def step(i, loss_sum):
+                input_pair_d = self.input_via_iterator(self.iterator)
+                loss = self.task.get_loss(input_pair_d)
+                train_op = self.task.training(loss, self.task_weight,
+                                              summarize=False)
+                with tf.control_dependencies([train_op]):
+                    return i + 1, loss_sum + loss
+
+            with tf.name_scope(f'{self.name}_x{n_steps}'):
+                _, loss_sum = tf.while_loop(
+                    lambda i, _: i < n_steps, step,
+                    [tf.constant(0), tf.constant(0.)],
+                    parallel_iterations=1, back_prop=False)
+                mean_loss = tf.divide(loss_sum, float(n_steps),
+                                      name=f'{self.name}_loss_x{n_steps}')
+            self.task.scope = task_scope
+            self.multi_step_ops_d[n_steps] = (mean_loss, mean_loss.op)
+
+        return self.multi_step_ops_d[n_steps]
+
     def __len__(self):
         return len(self.data_loader.interactions_df)
 
     @property
     def steps_per_epoch(self):
+        n_shards = self.shard[1] if self.shard else 1
         if self.sampler.uniform_users:
-            return self.data_loader.n_users / self.batch_size
+            return self.data_loader.n_users / self.batch_size / n_shards
         else:
-            return len(self) / self.batch_size
+            return len(self) / self.batch_size / n_shards
 
 
 
@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union, Any
+
+# Snapshots are `{PREFIX}{step}.npz` files (values) with a `.json` sidecar
+# (metadata incl. variable names and global step)
+PREFIX = 'snapshot-'
+STEP_WIDTH = 10
+
+
+def snapshot_stem(save_dir: Union[str, Path], global_step: int) -> Path:
+    return Path(save_dir) / f'{PREFIX}{global_step:0{STEP_WIDTH}d}'
+
+
+def write_snapshot(save_dir: Union[str, Path],
+                   names: List[str],
+                   values: List[np.array],
+                   meta: Dict[str, Any],
+                   ) -> Path:
+    """Atomically writes a snapshot of variable values
+
+    The values are written to a temporary file which is then renamed, and
+    the metadata is written last, so that a snapshot is only listed once
+    complete (see `list_snapshots`)
+
+    Args:
+        save_dir: directory of the snapshots
+        names: variable names
+        values: variable values (same order as `names`)
+        meta: metadata (must contain `global_step`)
+
+    Returns:
+        Path of the values file
+
+    """
+    stem = snapshot_stem(save_dir, meta['global_step'])
+    path_values = stem.with_suffix('.npz')
+    path_tmp = stem.with_suffix('.tmp.npz')
+    np.savez(path_tmp, *values)
+    os.replace(path_tmp, path_values)
+
+    path_meta_tmp = stem.with_suffix('.tmp.json')
+    with open(path_meta_tmp, 'w') as f:
+        json.dump(dict(meta, variables=names), f)
+    os.replace(path_meta_tmp, stem.with_suffix('.json'))
+    return path_values
+
+
+def list_snapshots(save_dir: Union[str, Path]) -> List[Path]:
+    """Complete snapshots (stems) sorted by global step"""
+    return sorted(p.with_suffix('') for p in
+                  Path(save_dir).glob(f'{PREFIX}*.json')
+                  if not p.name.endswith('.tmp.json'))
+
+
+def remove_old_snapshots(save_dir: Union[str, Path], keep_last: int):
+    """Removes all but the last `keep_last` snapshots"""
+    stems = list_snapshots(save_dir)
+    for stem in stems[:max(len(stems) - keep_last, 0)]:
+        for suffix in ['.json', '.npz']:
+            path = stem.with_suffix(suffix)
+            if path.exists():
+                path.unlink()
+
+
+def read_snapshot(path: Union[str, Path],
+                  ) -> Tuple[Dict[str, np.array], Dict[str, Any]]:
+    """Reads a snapshot
+
+    Args:
+        path: a snapshot (stem, `.npz` or `.json` path) or a directory of
+            snapshots (the latest is read)
+
+    Returns:
+        Tuple of values keyed by variable name, and metadata
+
+    """
+    path = Path(path)
+    if path.is_dir():
+        stems = list_snapshots(path)
+        if not stems:
+            raise FileNotFoundError(f'No snapshots in {path}')
+        stem = stems[-1]
+    else:
+        stem = path.with_suffix('') if path.suffix in {'.npz', '.json'} \
+            else path
+
+    with open(stem.with_suffix('.json')) as f:
+        meta = json.load(f)
+    names = meta.pop('variables')
+    with np.load(stem.with_suffix('.npz')) as f:
+        values_d = {name: f[f'arr_{i}'] for i, name in enumerate(names)}
+    return values_d, meta
+
+
+def latest_snapshot(save_dir: Union[str, Path]) -> Optional[Path]:
+    stems = list_snapshots(save_dir)
+    return stems[-1] if stems else None
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from typing import Iterable
+
+# Raw ids are hashed into this space on the host, buckets are taken in-graph
+HASH_SPACE = 2 ** 31 - 1
+
+
+def hash_codes(values: Iterable) -> np.array:
+    """Stable (across processes and runs) hash of raw ids into int32 codes
+    Used in place of vocab encoding for hashed features
+
+    Note: the hash depends on the dtype of the values
+    (ex. `5` and `'5'` hash differently)
+
+    Args:
+        values: raw ids
+
+    Returns:
+        Array of codes in `[0, HASH_SPACE)`
+
+    """
+    h = pd.util.hash_array(np.asarray(values))
+    return (h % HASH_SPACE).astype(np.int32)
@@ -1,35 +1,122 @@
+import numpy as np
+import pandas as pd
+from collections.abc import Sequence
 from pathlib import Path
 from typing import Dict, Union, List, Any, Optional
 
+# Binary vocabs are `{k}.vocab.npy` files: the categories as a typed array,
+# or for str categories, their utf-8 text concatenated (as uint8) with a
+# `{k}.vocab.offsets.npy` sidecar of byte offsets `[n_cats + 1]`
+BINARY_VOCAB_EXT = '.vocab.npy'
+OFFSETS_EXT = '.vocab.offsets.npy'
+
 
 def write_vocab(vocab_dir: Union[str, Path],
                 cats_d: Dict[str, List[Any]],
+                binary: bool = False,
                 ):
     """Writes a dictionary of categories to vocab files
     Each line of the file will contain 1 word of the vocabulary
+
+    If `binary`, the categories are written as `.vocab.npy` arrays instead
+    (which keep their dtype, see `write_binary_vocab`)
     """
     vocab_dir = Path(vocab_dir)
     if not vocab_dir.exists():
         vocab_dir.mkdir()
     for k, v in cats_d.items():
+        if binary:
+            write_binary_vocab(vocab_dir / f'{k}{BINARY_VOCAB_EXT}', v)
+            continue
         with open(vocab_dir / f'{k}.vocab', 'w') as f:
             f.write('\n'.join(map(str, v)) + '\n')
 
 
+def write_binary_vocab(path: Union[str, Path], cats: List[Any]):
+    """Writes categories to a binary vocab file
+    Numerical (and bool) categories are written as is, anything else as str
+    """
+    cats = np.asarray(cats)
+    if cats.dtype.kind in 'biuf':
+        np.save(str(path), cats)
+        return
+    encoded = [str(c).encode('utf-8') for c in cats]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(str(path), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(str(path)[:-len(BINARY_VOCAB_EXT)] + OFFSETS_EXT, offsets)
+
+
+class StrVocab(Sequence):
+    """Str categories of a binary vocab, decoded as they are accessed
+    from the memory-mapped text and offsets
+
+    Note: converting to an array (ex. `vocab_index`) decodes every category
+    """
+
+    def __init__(self, text: np.array, offsets: np.array):
+        self.text = text
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = range(len(self))[i]
+        return self.text[self.offsets[i]:self.offsets[i + 1]]\
+            .tobytes().decode('utf-8')
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        cats = np.empty(len(self), dtype=object)
+        cats[:] = self.tolist()
+        return cats if dtype is None else cats.astype(dtype)
+
+    def tolist(self) -> List[str]:
+        return list(self)
+
+
+def load_binary_vocab(path: Union[str, Path]) -> Union[np.array, StrVocab]:
+    """Loads the categories of a binary vocab file (memory-mapped)
+    Str categories are loaded as a `StrVocab`, which only decodes the
+    categories that are accessed
+    """
+    path_offsets = Path(str(path)[:-len(BINARY_VOCAB_EXT)] + OFFSETS_EXT)
+    if not path_offsets.exists():
+        return np.load(str(path), mmap_mode='r')
+    return StrVocab(np.load(str(path), mmap_mode='r'),
+                    np.load(str(path_offsets), mmap_mode='r'))
+
+
+def is_binary_vocab(path: Union[str, Path]) -> bool:
+    return str(path).endswith(BINARY_VOCAB_EXT)
+
+
 def load_vocab(vocab_dir: Union[str, Path],
                pattern: Optional[str] = '*.vocab',
+               binary: bool = False,
                ) -> Dict[str, List[Any]]:
     """Loads a dictionary of categories from a directory of vocab files
-    
+
     Args:
         vocab_dir: directory containing vocab files
-        pattern: glob pattern for finding vocab files. 
+        pattern: glob pattern for finding vocab files.
             Note: vocab files created by `write_vocab` will have `.vocab` ext
+        binary: if `True`, loads the `.vocab.npy` files of
+            `write_vocab(binary=True)` instead (memory-mapped, see
+            `load_binary_vocab`), and `pattern` is ignored
 
     Returns: dictionary of vocab lists
 
     """
     vocab_dir = Path(vocab_dir)
+    if binary:
+        return {
+            vocab_path.name[:-len(BINARY_VOCAB_EXT)]:
+                load_binary_vocab(vocab_path)
+            for vocab_path in vocab_dir.glob(f'*{BINARY_VOCAB_EXT}')
+        }
     # WARNING: this reads the vocab as str type (could have been Any type)
     cats_d = {}
     for vocab_path in vocab_dir.glob(pattern):
@@ -38,3 +125,23 @@ def load_vocab(vocab_dir: Union[str, Path],
             cats_d[vocab_path.stem] = v
     return cats_d
 
+
+def vocab_index(cats: Union[List[Any], np.array]) -> pd.Index:
+    """Hash index of a vocab: `vocab_index(cats).get_indexer(ids)` gives
+    the codes of ids (-1 if not in the vocab)
+    """
+    return pd.Index(np.asarray(cats))
+
+
+def vocab_remapping(old_cats: Union[List[Any], np.array],
+                    new_cats: Union[List[Any], np.array],
+                    ) -> np.array:
+    """Rows of the old vocab for each category of the new vocab
+    (-1 for new categories). The new categories are compared in the dtype
+    of the old ones
+    """
+    old_index = vocab_index(old_cats)
+    new_index = pd.Index(np.asarray(new_cats))
+    if new_index.dtype != old_index.dtype:
+        new_index = new_index.astype(old_index.dtype)
+    return old_index.get_indexer(new_index)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Optional, Union
+
+from tophat.constants import SEED
+
+# Storage dtypes for numerical features
+NUM_DTYPES = {'float64', 'float32', 'float16'}
+REDUCE_METHODS = {'pca', 'random'}
+
+
+class NumTransform(object):
+    """Preprocessing of a numerical feature table: an optional linear
+    reduction to `n_components` (fitted once, then re-applied as is, ex. to
+    the cold items of validation), and a cast to a storage dtype
+
+    Args:
+        dtype: one of {'float64', 'float32', 'float16'}
+        n_components: Optional target dimensionality
+        method: reduction method, one of {'pca', 'random'}
+
+            - pca: projection onto the top principal components
+            - random: gaussian random projection (data independent)
+        fit_rows: max number of rows to fit the PCA on
+            (a random subset of the table)
+        seed: seed of the row subset and of the random projection
+    """
+
+    def __init__(self,
+                 dtype: str = 'float32',
+                 n_components: Optional[int] = None,
+                 method: str = 'pca',
+                 fit_rows: int = 10000,
+                 seed: int = SEED,
+                 ):
+        if dtype not in NUM_DTYPES:
+            raise ValueError(f'Unknown numerical dtype: {dtype}')
+        if method not in REDUCE_METHODS:
+            raise ValueError(f'Unknown reduction method: {method}')
+        self.dtype = dtype
+        self.n_components = n_components
+        self.method = method
+        self.fit_rows = fit_rows
+        self.seed = seed
+
+        self.mean: Optional[np.array] = None
+        self.components: Optional[np.array] = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.n_components is None or self.components is not None
+
+    def fit(self, arr: np.array) -> 'NumTransform':
+        """Fits the reduction on a table `[n_rows x n_feats]`"""
+        if self.n_components is None:
+            return self
+        arr = np.asarray(arr, dtype=np.float64)
+        n_rows, n_feats = arr.shape
+        if self.n_components > n_feats:
+            raise ValueError(f'Can not reduce {n_feats} features to '
+                             f'{self.n_components} components')
+        rand = np.random.RandomState(self.seed)
+
+        if self.method == 'pca':
+            if n_rows > self.fit_rows:
+                arr = arr[rand.choice(n_rows, self.fit_rows, replace=False)]
+            self.mean = arr.mean(axis=0)
+            _, _, vt = np.linalg.svd(arr - self.mean, full_matrices=False)
+            self.components = vt[:self.n_components].T
+        else:
+            self.mean = np.zeros(n_feats)
+            self.components = rand.normal(
+                scale=1. / np.sqrt(self.n_components),
+                size=(n_feats, self.n_components))
+        return self
+
+    def transform(self, arr: np.array) -> np.array:
+        """Reduces (if fitted to) and casts a table"""
+        if not self.is_fitted:
+            raise ValueError('NumTransform has not been fitted')
+        if self.components is not None:
+            arr = (np.asarray(arr, dtype=np.float64) - self.mean) \
+                @ self.components
+        return np.asarray(arr, dtype=self.dtype)
+
+    def fit_transform(self, arr: np.array) -> np.array:
+        return self.fit(arr).transform(arr)
+
+    def transform_df(self, df: pd.DataFrame,
+                     prefix: str = 'num') -> pd.DataFrame:
+        """`transform` of a dataframe (index is kept, reduced columns are
+        renamed `{prefix}_{i}`)
+        """
+        if not self.is_fitted:
+            self.fit(df.values)
+        arr = self.transform(df.values)
+        columns = df.columns if self.components is None else \
+            [f'{prefix}_{i}' for i in range(arr.shape[1])]
+        return pd.DataFrame(arr, index=df.index, columns=columns)
+
+    def save(self, path: Union[str, Path]):
+        """Writes the (fitted) transform to a `.npz` file"""
+        if not self.is_fitted:
+            raise ValueError('NumTransform has not been fitted')
+        arrs = {
+            'dtype': np.array(self.dtype),
+            'method': np.array(self.method),
+        }
+        if self.components is not None:
+            arrs['mean'] = self.mean
+            arrs['components'] = self.components
+        np.savez(path, **arrs)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'NumTransform':
+        """Loads a transform written by `save`"""
+        with np.load(path) as f:
+            components = f['components'] if 'components' in f else None
+            transform = cls(
+                dtype=str(f['dtype']),
+                n_components=None if components is None
+                else components.shape[1],
+                method=str(f['method']),
+            )
+            if components is not None:
+                transform.mean = f['mean']
+                transform.components = components
+        return transform
@@ -0,0 +1,80 @@
+import numpy as np
+from pathlib import Path
+from typing import Tuple, Optional, Union
+
+# Storage dtypes for embedding tables
+EMB_DTYPES = {'float32', 'float16', 'int8'}
+
+INT8_MAX = 127
+
+
+def quantize_rows(arr: np.array, dtype: str = 'int8',
+                  ) -> Tuple[np.array, Optional[np.array]]:
+    """Quantizes an embedding table for storage
+
+    Args:
+        arr: embedding table `[n_rows x dim]`
+        dtype: one of {'float32', 'float16', 'int8'}
+            int8 uses a symmetric per-row scale:
+            `arr[i] ~= q[i] * scale[i]`
+
+    Returns:
+        Tuple of quantized table and per-row scale `[n_rows x 1]`
+        (scale is `None` for float dtypes)
+
+    """
+    if dtype not in EMB_DTYPES:
+        raise ValueError(f'Unknown embedding dtype: {dtype}')
+    if dtype != 'int8':
+        return arr.astype(dtype), None
+
+    scale = np.abs(arr).max(axis=1, keepdims=True) / INT8_MAX
+    scale[scale == 0] = 1.
+    q = np.clip(np.round(arr / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def dequantize_rows(q: np.array, scale: Optional[np.array] = None,
+                    ) -> np.array:
+    """Inverse of `quantize_rows` (up to quantization error)"""
+    if scale is None:
+        return q.astype(np.float32)
+    return q.astype(np.float32) * scale
+
+
+def write_quantized(path: Union[str, Path],
+                    values: np.array,
+                    scale: Optional[np.array] = None,
+                    bias: Optional[np.array] = None,
+                    ):
+    """Writes a quantized table (and optionally its biases) for serving"""
+    arrs = {'values': values}
+    if scale is not None:
+        arrs['scale'] = scale
+    if bias is not None:
+        arrs['bias'] = bias
+    np.savez(path, **arrs)
+
+
+def load_quantized(path: Union[str, Path],
+                   dequantize: bool = True,
+                   ) -> Tuple[np.array, Optional[np.array]]:
+    """Loads a table written by `write_quantized`
+
+    Args:
+        path: path of the `.npz` file
+        dequantize: if `True`, return float32 values,
+            else, the stored values (and scale)
+
+    Returns:
+        Tuple of values (or stored values and scale), and biases
+        (biases are `None` if not written)
+
+    """
+    with np.load(path) as f:
+        values = f['values']
+        scale = f['scale'] if 'scale' in f else None
+        bias = f['bias'] if 'bias' in f else None
+    if dequantize:
+        return dequantize_rows(values, scale), bias
+    return (values, scale), bias
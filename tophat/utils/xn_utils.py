@@ -1,6 +1,7 @@
 import tensorflow as tf
 import itertools as it
-from typing import Dict, Iterable, Any, Mapping
+from functools import reduce
+from typing import Dict, Iterable, Any, Mapping, Sequence
 
 
 def preset_interactions(fields_d: Dict[Any, Iterable[str]],
@@ -131,3 +132,97 @@ def kernel_via_xn_sets(interaction_sets: Iterable[frozenset],
     """
     # TODO: for now we assume that all dependencies of previous order are met
     return kernel_via_xn_muls(muls_via_xn_sets(interaction_sets, emb_d))
+
+
+def anova_muls(embs: Sequence[tf.Tensor],
+               max_order: int = 2,
+               ) -> Dict[int, tf.Tensor]:
+    """Element-wise ANOVA kernels of a set of embeddings: for each order,
+    the sum over all subsets of that many distinct embeddings of their
+    element-wise products
+
+    This equals summing the nodes of `muls_via_xn_sets` for all
+    `intra` interactions (of each order), but with O(k*n) rather than
+    O(n^k) graph nodes and compute for k orders and n fields. Order 2 uses
+    the square of sum minus sum of squares identity [3]_, higher orders the
+    ANOVA recursion [2]_.
+
+    Args:
+        embs: embedding tensors (broadcastable to the same shape)
+        max_order: max order of interactions
+
+    Returns:
+        Dictionary of the element-wise kernel of each order (from 2) keyed
+        by order (orders larger than the number of embeddings are omitted)
+
+    References:
+        .. [3] Rendle, Steffen. "Factorization Machines." IEEE International
+           Conference on Data Mining. 2010.
+
+    """
+    embs = list(embs)
+    if max_order == 2:
+        if len(embs) < 2:
+            return {}
+        elif len(embs) == 2:
+            return {2: tf.multiply(*embs, name='anova_2')}
+        sum_sq = tf.square(reduce(tf.add, embs))
+        sq_sum = reduce(tf.add, [tf.square(e) for e in embs])
+        return {2: tf.multiply(0.5, sum_sq - sq_sum, name='anova_2')}
+
+    # a[j]: kernel of order j over the embeddings seen so far
+    # (`None` while there are fewer than j of them)
+    a = [None] * (max_order + 1)
+    for i, emb in enumerate(embs):
+        for order in range(min(i + 1, max_order), 0, -1):
+            term = emb if order == 1 else emb * a[order - 1]
+            a[order] = term if a[order] is None else a[order] + term
+    return {order: tf.identity(a[order], name=f'anova_{order}')
+            for order in range(2, max_order + 1) if a[order] is not None}
+
+
+def group_sums(fields_d: Dict[Any, Iterable[str]],
+               emb_d: Mapping[Any, tf.Tensor],
+               ) -> Dict[Any, tf.Tensor]:
+    """Sums of the embeddings of each (non-empty) group of fields
+
+    The `inter` interactions of `preset_interactions` (all products of
+    features of different groups) are the `intra` interactions of these
+    sums, ex. with only user and item groups:
+    `sum_(u, i) dot(e_u, e_i) = dot(sum_u e_u, sum_i e_i)`
+
+    Args:
+        fields_d: Dictionary of group_name to iterable of feat_names that
+            belong to that group
+        emb_d: Dictionary of embedding tensors
+
+    Returns:
+        Dictionary of the sum of embeddings keyed by group name
+    """
+    return {
+        group: reduce(tf.add, [emb_d[f] for f in fields])
+        for group, fields in fields_d.items() if len(fields)
+    }
+
+
+def kernel_via_anova(embs: Sequence[tf.Tensor],
+                     max_order: int = 2) -> tf.Tensor:
+    """Factorization machine kernel of all interactions (of order 2 up to
+    `max_order`) between the embeddings (see `anova_muls`)
+
+    Args:
+        embs: embedding tensors
+        max_order: max order of interactions
+
+    Returns:
+        Reduced interactions
+    """
+    muls_d = anova_muls(embs, max_order)
+    if muls_d:
+        contrib_dot = tf.add_n([
+            tf.reduce_sum(node, 1, keepdims=False)
+            for node in muls_d.values()
+        ], name='contrib_dot')
+    else:
+        contrib_dot = tf.zeros(None, name='contrib_dot')
+    return contrib_dot